@@ -39,6 +39,7 @@ class buildroot_sync(BuildrootDeploymentTask):
     def __init__(self):
         super().__init__()
         self.set_name(buildroot_sync.__name__)
+        self.set_prefetchable()
 
     def execute(self):
 
@@ -128,7 +129,7 @@ class buildroot_build(BuildrootDeploymentTask):
         used_compiler = self._get_compiler()
 
         self.subprocess_must_succeed(f"cd {self.SOURCE_PATH}; make O={self.BUILD_PATH} -C {self.SOURCE_PATH} ARCH=" + arch_type.lower() +
-            " CROSS_COMPILE=" + used_compiler + "- -j${BUILD_SYSTEM_CORES_NUMBER} all",
+            " CROSS_COMPILE=" + used_compiler + "- " + self._get_make_jobs() + " all",
             communication_mode = CommunicationMode.PIPE_OUTPUT)
 
 class buildroot_deploy(BuildrootDeploymentTask):
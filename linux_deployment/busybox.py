@@ -41,6 +41,7 @@ class busybox_sync(BusyboxDeploymentTask):
     def __init__(self):
         super().__init__()
         self.set_name(busybox_sync.__name__)
+        self.set_prefetchable()
 
     def execute(self):
 
@@ -133,7 +134,7 @@ class busybox_build(BusyboxDeploymentTask):
         used_compiler = self._get_compiler()
 
         self.subprocess_must_succeed(f"cd {self.SOURCE_PATH}; make O={self.BUILD_PATH} -C {self.SOURCE_PATH} ARCH=" + arch_type.lower() +
-            " CROSS_COMPILE=" + used_compiler + "- -j${BUILD_SYSTEM_CORES_NUMBER} all",
+            " CROSS_COMPILE=" + used_compiler + "- " + self._get_make_jobs() + " all",
             communication_mode = CommunicationMode.PIPE_OUTPUT)
 
         self.subprocess_must_succeed(f"cd {self.SOURCE_PATH}; make O={self.BUILD_PATH} -C {self.SOURCE_PATH} ARCH=" + arch_type.lower() +
@@ -5,7 +5,7 @@ Created on Dec 29, 2021
 '''
 
 import general
-from paf.paf_impl import Task
+from paf.paf_impl import Config, Task
 
 LINUX_KERNEL_FOLDER_PREFIX = "lk_"
 BUSYBOX_FOLDER_PREFIX = "bb_"
@@ -29,6 +29,12 @@ class LinuxDeploymentTask(Task):
         arch_type = self._get_arch_type()
         return "${" + arch_type + "_COMPILER_PATH}"
 
+    # with the shared jobserver make takes the number of the jobs from it, as an explicit -j would disable it
+    def _get_make_jobs(self):
+        if Config.get_jobserver():
+            return ""
+        return "-j${BUILD_SYSTEM_CORES_NUMBER}"
+
     def _get_qemu_path(self):
 
         prefix = ""
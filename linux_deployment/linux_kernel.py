@@ -39,6 +39,7 @@ class linux_kernel_sync(LinuxKernelDeploymentTask):
     def __init__(self):
         super().__init__()
         self.set_name(linux_kernel_sync.__name__)
+        self.set_prefetchable()
 
     def execute(self):
 
@@ -139,7 +140,7 @@ class linux_kernel_build(LinuxKernelDeploymentTask):
         additional_params = ""
 
         self.subprocess_must_succeed(f"cd {self.SOURCE_PATH}; make O={self.BUILD_PATH} -C {self.SOURCE_PATH} ARCH=" +
-            arch_type.lower() + " CROSS_COMPILE=" + used_compiler + "- " + "-j${BUILD_SYSTEM_CORES_NUMBER}" +
+            arch_type.lower() + " CROSS_COMPILE=" + used_compiler + "- " + self._get_make_jobs() +
             additional_params + " all",
             communication_mode = CommunicationMode.PIPE_OUTPUT)
 
@@ -35,6 +35,7 @@ class uboot_sync(UbootDeploymentTask):
     def __init__(self):
         super().__init__()
         self.set_name(uboot_sync.__name__)
+        self.set_prefetchable()
 
     def execute(self):
 
@@ -78,7 +79,7 @@ class uboot_configure(UbootDeploymentTask):
                                         communication_mode = CommunicationMode.PIPE_OUTPUT)
 
         self.subprocess_must_succeed(f"cd {self.SOURCE_PATH}; make O={self.BUILD_PATH} -C {self.SOURCE_PATH} V=1 "
-                                      "CROSS_COMPILE=" + used_compiler + "- -j${BUILD_SYSTEM_CORES_NUMBER} menuconfig",
+                                      "CROSS_COMPILE=" + used_compiler + "- " + self._get_make_jobs() + " menuconfig",
                                      communication_mode = CommunicationMode.PIPE_OUTPUT)
 
 class uboot_build(UbootDeploymentTask):
@@ -91,7 +92,7 @@ class uboot_build(UbootDeploymentTask):
         used_compiler = self._get_compiler()
 
         self.subprocess_must_succeed(f"cd {self.SOURCE_PATH}; make O={self.BUILD_PATH} -C {self.SOURCE_PATH} V=1 "
-                                      "CROSS_COMPILE=" + used_compiler + "- -j${BUILD_SYSTEM_CORES_NUMBER} all",
+                                      "CROSS_COMPILE=" + used_compiler + "- " + self._get_make_jobs() + " all",
                                      communication_mode = CommunicationMode.PIPE_OUTPUT)
 
 class uboot_deploy(UbootDeploymentTask):
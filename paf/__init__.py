@@ -0,0 +1,5 @@
+
+from paf.session import Session
+from paf.session import run
+
+__all__ = ["Session", "run"]
@@ -0,0 +1,193 @@
+'''
+Content-addressed cache of the task outputs.
+'''
+
+import contextlib
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import stat
+import tempfile
+
+from paf.task_state import expand_file_patterns
+from paf.task_state import pattern_root
+
+
+# amount of bytes copied at once while storing a file
+_COPY_CHUNK_SIZE = 1024 * 1024
+# ioctl, which makes the file share the extents of another one until either of them is changed
+_FICLONE = 0x40049409
+
+
+class ArtifactCacheResult:
+    def __init__(self, files = 0, size = 0):
+        self.files = files
+        self.size = size
+
+
+class ArtifactCache:
+    """
+    Stores the output files of the tasks under a key derived from the task inputs.
+
+    Each file is stored once as a read-only object named by the digest of its content. An entry is a manifest,
+    which maps the paths relative to the output pattern roots to the objects. The entries are restored as
+    writable copies, which are reflinks on the file systems supporting them, so changing a restored file
+    does not change the cached object. The least recently used entries are evicted, once the objects
+    exceed the size limit. The entry just stored is never evicted, even if it alone exceeds the limit.
+
+    The cache can be shared by several processes. The eviction holds an exclusive lock of the cache, while
+    storing and restoring hold a shared one, so that the objects are not removed while they are used.
+    """
+
+    def __init__(self, root, max_size):
+        self.__objects_dir = os.path.join(root, "objects")
+        self.__entries_dir = os.path.join(root, "entries")
+        self.__lock_path = os.path.join(root, "lock")
+        self.__max_size = max_size
+
+        os.makedirs(self.__objects_dir, exist_ok = True)
+        os.makedirs(self.__entries_dir, exist_ok = True)
+
+    @contextlib.contextmanager
+    def __locked(self, operation):
+        # the lock is released, once the file is closed
+        with open(self.__lock_path, "a") as stream:
+            fcntl.flock(stream.fileno(), operation)
+            yield
+
+    def __entry_path(self, key):
+        return os.path.join(self.__entries_dir, hashlib.sha256(key.encode("utf-8")).hexdigest() + ".json")
+
+    def __object_path(self, object_name):
+        return os.path.join(self.__objects_dir, object_name[:2], object_name)
+
+    def __store_object(self, path):
+        executable = os.stat(path).st_mode & stat.S_IXUSR
+        digest = hashlib.sha256()
+
+        # the file is hashed while it is copied, so it is read only once
+        with open(path, "rb") as source, \
+             tempfile.NamedTemporaryFile(dir = self.__objects_dir, delete = False) as target:
+            for chunk in iter(lambda: source.read(_COPY_CHUNK_SIZE), b""):
+                digest.update(chunk)
+                target.write(chunk)
+
+        object_name = digest.hexdigest() + ("-x" if executable else "")
+        object_path = self.__object_path(object_name)
+
+        if os.path.exists(object_path):
+            os.remove(target.name)
+        else:
+            os.chmod(target.name, 0o555 if executable else 0o444)
+            os.makedirs(os.path.dirname(object_path), exist_ok = True)
+            os.replace(target.name, object_path)
+
+        return object_name
+
+    def store(self, key, output_patterns):
+        files = []
+        entry_path = self.__entry_path(key)
+
+        with self.__locked(fcntl.LOCK_SH):
+            for index, (pattern, paths) in enumerate(expand_file_patterns(output_patterns)):
+                root = pattern_root(pattern)
+                for path in paths:
+                    files.append([index, os.path.relpath(path, root), self.__store_object(path),
+                                  os.path.getsize(path)])
+
+            with tempfile.NamedTemporaryFile("w", dir = self.__entries_dir, delete = False,
+                                             encoding = "utf-8") as stream:
+                json.dump({"key": key, "files": files}, stream)
+            os.replace(stream.name, entry_path)
+
+        with self.__locked(fcntl.LOCK_EX):
+            self.__evict(entry_path)
+
+        return ArtifactCacheResult(len(files), sum(file[3] for file in files))
+
+    def restore(self, key, output_patterns):
+        """Restores the outputs stored under the key. Returns None on a miss."""
+        with self.__locked(fcntl.LOCK_SH):
+            return self.__restore(key, output_patterns)
+
+    def __restore(self, key, output_patterns):
+        entry_path = self.__entry_path(key)
+
+        try:
+            with open(entry_path, "r", encoding = "utf-8") as stream:
+                files = json.load(stream)["files"]
+        except FileNotFoundError:
+            return None
+
+        roots = [pattern_root(pattern) for pattern in output_patterns]
+
+        if any(not os.path.exists(self.__object_path(object_name)) for _, _, object_name, _ in files) \
+                or any(index >= len(roots) for index, _, _, _ in files):
+            return None
+
+        for index, relative_path, object_name, _ in files:
+            path = os.path.join(roots[index], relative_path)
+            os.makedirs(os.path.dirname(path) or ".", exist_ok = True)
+            if os.path.lexists(path):
+                os.remove(path)
+
+            self.__restore_object(self.__object_path(object_name), path)
+
+        # the modification time of the entry is its last usage time
+        os.utime(entry_path)
+        return ArtifactCacheResult(len(files), sum(file[3] for file in files))
+
+    @staticmethod
+    def __restore_object(object_path, path):
+        with open(object_path, "rb") as source, open(path, "wb") as target:
+            try:
+                fcntl.ioctl(target.fileno(), _FICLONE, source.fileno())
+            except OSError:
+                # e.g. the file system does not support the reflinks or the cache is located on another one
+                shutil.copyfileobj(source, target, _COPY_CHUNK_SIZE)
+
+        # the objects are read-only, while the restored files are owned by the task
+        os.chmod(path, stat.S_IMODE(os.stat(object_path).st_mode) | stat.S_IWUSR)
+
+    def __evict(self, stored_entry_path):
+        entries = []
+
+        for name in os.listdir(self.__entries_dir):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.__entries_dir, name)
+            try:
+                with open(path, "r", encoding = "utf-8") as stream:
+                    entries.append((os.path.getmtime(path), path, json.load(stream)["files"]))
+            except (OSError, ValueError, KeyError):
+                # e.g. removed by another process or a temporary file
+                continue
+
+        kept_objects: set[str] = set()
+        size = 0
+
+        # the stored entry goes first, then the most recently used ones
+        entries.sort(key = lambda entry: (entry[1] == stored_entry_path, entry[0]), reverse = True)
+
+        for _, path, files in entries:
+            new_objects = {object_name: object_size for _, _, object_name, object_size in files
+                           if object_name not in kept_objects}
+            entry_size = sum(new_objects.values())
+
+            if size + entry_size > self.__max_size and path != stored_entry_path:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(path)
+                continue
+
+            kept_objects.update(new_objects)
+            size += entry_size
+
+        for directory, _, names in os.walk(self.__objects_dir):
+            if directory == self.__objects_dir:
+                continue
+            for name in names:
+                if name not in kept_objects:
+                    with contextlib.suppress(FileNotFoundError):
+                        os.remove(os.path.join(directory, name))
@@ -11,7 +11,9 @@ import fcntl
 import struct
 import termios
 import glob
+import contextlib
 import importlib.util
+import sqlite3
 
 def has_fileno(stream):
     """
@@ -159,6 +161,20 @@ def load_all_modules_in_dirs(module_paths):
         result.update(load_all_modules_in_dir(module_path))
     return result
 
+def file_stamp(path):
+    """Identifies the version of the file - its absolute path, size and modification time."""
+    stat = os.stat(path)
+    return os.path.abspath(path), stat.st_size, stat.st_mtime_ns
+
+@contextlib.contextmanager
+def connect_db(path):
+    """Opens an SQLite database of paf's persistent state for one transaction and closes it afterwards."""
+    # the callers open a connection per operation, so that the tasks executed in parallel do not share it.
+    # The concurrent writers wait for the lock of each other up to a minute
+    with contextlib.closing(sqlite3.connect(path, timeout = 60)) as connection:
+        with connection:
+            yield connection
+
 def create_class_instance(full_class_name, loaded_modules):
     module_name, class_name = full_class_name.rsplit('.', 1)
     module = loaded_modules.get(module_name)
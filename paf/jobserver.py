@@ -0,0 +1,59 @@
+'''
+GNU make jobserver shared by all sub-processes started by PAF.
+'''
+
+import os
+import shutil
+import tempfile
+from typing import Optional
+
+
+JOBSERVER_AUTH_OPTION = "--jobserver-auth="
+
+
+def has_jobserver(makeflags):
+    return JOBSERVER_AUTH_OPTION in (makeflags or "")
+
+
+class Jobserver:
+    """
+    Named pipe with the job tokens, as created by GNU make 4.4 and later. Each make, which finds it in MAKEFLAGS,
+    takes a token before starting any job besides its first one, so all builds share one parallelism budget.
+    Older versions of make do not support the named pipe and stop with an error.
+    """
+
+    def __init__(self, slots):
+        if slots < 1:
+            raise Exception(f"Number of the jobserver slots should be positive, got {slots}")
+
+        self.__slots = slots
+        self.__directory = tempfile.mkdtemp(prefix = "paf_jobserver_")
+        self.__path = os.path.join(self.__directory, "fifo")
+        os.mkfifo(self.__path, 0o600)
+
+        # the pipe is kept open for reading and writing, so that the tokens survive while no make is running.
+        # Each make has one implicit slot, so the pipe contains one token less than the number of the slots
+        self.__fd: Optional[int] = os.open(self.__path, os.O_RDWR)
+        os.write(self.__fd, b"+" * (slots - 1))
+
+    def get_slots(self):
+        return self.__slots
+
+    def get_path(self):
+        return self.__path
+
+    def get_makeflags(self):
+        return f"-j{self.__slots} {JOBSERVER_AUTH_OPTION}fifo:{self.__path}"
+
+    def export(self, env):
+        """Adds the jobserver to the MAKEFLAGS of the environment, unless it already refers to a jobserver."""
+        makeflags = env.get("MAKEFLAGS", "")
+
+        if not has_jobserver(makeflags):
+            env["MAKEFLAGS"] = (self.get_makeflags() + " " + makeflags).strip()
+
+    def close(self):
+        if self.__fd is not None:
+            os.close(self.__fd)
+            self.__fd = None
+            shutil.rmtree(self.__directory, ignore_errors = True)
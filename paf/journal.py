@@ -0,0 +1,116 @@
+'''
+Journal of the completed tasks, used to resume a failed run.
+'''
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+from paf.task_state import hash_value
+
+
+JOURNAL_FILE_NAME = "journal.jsonl"
+
+# the variables, which paf sets to the files it generates in the log directory. A resumed run has another
+# log directory, so the content of these files is hashed instead of their paths
+_GENERATED_FILE_VARIABLES = ("YAML_CONF_FILE",)
+
+
+def resolve_journal_path(path):
+    """The journal path or the log directory, which contains the journal."""
+    if os.path.isdir(path):
+        return os.path.join(path, JOURNAL_FILE_NAME)
+    return path
+
+
+def environment_hash(environment):
+    variables = dict(environment.getVariables())
+
+    for name in _GENERATED_FILE_VARIABLES:
+        if name in variables and os.path.isfile(variables[name]):
+            with open(variables[name], "rb") as stream:
+                variables[name] = hashlib.sha256(stream.read()).hexdigest()
+
+    return hash_value(variables)
+
+
+def environment_changes(before, after):
+    return {
+        "set": {name: value for name, value in after.items() if name not in before or before[name] != value},
+        "deleted": [name for name in before if name not in after],
+    }
+
+
+def apply_environment_changes(environment, changes):
+    for name, value in changes["set"].items():
+        environment.setVariableValue(name, value)
+    for name in changes["deleted"]:
+        environment.deleteVariableValue(name)
+
+
+class RunJournal:
+    """
+    Records each completed task as a JSON line - its scenario, phase, name, occurrence and the hash of
+    the environment it was started with. The changes the task made to the environment are recorded as well,
+    so that they are applied, when the task is skipped on resume.
+    """
+
+    def __init__(self, path, resume_path = None):
+        self.__lock = threading.Lock()
+        self.__occurrences = {}
+        self.__completed = {}
+        self.__completed_tasks = set()
+
+        # the resumed journal is read before the new one is created, as both can be the same file
+        if resume_path:
+            with open(resolve_journal_path(resume_path), "r", encoding = "utf-8") as stream:
+                for line in stream:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.__completed[self.__entry_key(entry)] = entry
+                        self.__completed_tasks.add((entry["scenario"], entry["phase"], entry["task"]))
+
+        self.__stream = open(path, "w", encoding = "utf-8") if path else None
+
+    @staticmethod
+    def __entry_key(entry):
+        return (entry["scenario"], entry["phase"], entry["task"], entry["occurrence"], entry["environment_hash"])
+
+    def close(self):
+        if self.__stream:
+            self.__stream.close()
+            self.__stream = None
+
+    def start_step(self, scenario, phase, task):
+        """Returns the occurrence of the task within the same scenario and phase during this run."""
+        with self.__lock:
+            key = (scenario, phase, task)
+            occurrence = self.__occurrences.get(key, 0)
+            self.__occurrences[key] = occurrence + 1
+            return occurrence
+
+    def find_completed(self, scenario, phase, task, occurrence, environment_hash):
+        return self.__completed.get((scenario, phase, task, occurrence, environment_hash))
+
+    def has_completed(self, scenario, phase, task):
+        """Whether the resumed run has completed the task at any occurrence and with any environment."""
+        return (scenario, phase, task) in self.__completed_tasks
+
+    def record(self, scenario, phase, task, occurrence, environment_hash, changes):
+        entry = {
+            "scenario": scenario,
+            "phase": phase,
+            "task": task,
+            "occurrence": occurrence,
+            "environment_hash": environment_hash,
+            "environment_changes": changes,
+            "time": time.time(),
+        }
+
+        with self.__lock:
+            if self.__stream:
+                # each entry is flushed, so that it survives the failure of the next task
+                self.__stream.write(json.dumps(entry, sort_keys = True) + "\n")
+                self.__stream.flush()
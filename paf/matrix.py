@@ -0,0 +1,126 @@
+'''
+Matrix execution of the PAF elements across the sets of parameters.
+'''
+
+import itertools
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import as_completed
+
+from paf import paf_impl
+from paf.paf_impl import logger
+
+
+def parse_matrix_parameter(parameter):
+    """Parses 'NAME=VALUE1,VALUE2' into the name and the list of the values."""
+    name, separator, values = parameter.partition("=")
+    name = name.strip()
+
+    if not separator or not name:
+        raise Exception(f"Wrong matrix parameter '{parameter}'. Expected format is NAME=VALUE1,VALUE2")
+
+    values = [value.strip() for value in values.split(",") if value.strip()]
+
+    if not values:
+        raise Exception(f"Matrix parameter '{name}' has no values")
+
+    return name, values
+
+
+def expand_matrix(matrix_parameters):
+    """
+    Expands the matrix parameters into the cases - one dict of the parameter values per combination.
+    The values of a repeated parameter name are merged.
+    """
+    axes: dict[str, list[str]] = {}
+
+    for parameter in matrix_parameters:
+        name, values = parse_matrix_parameter(parameter)
+        axis = axes.setdefault(name, [])
+        axis.extend(value for value in values if value not in axis)
+
+    return [dict(zip(axes, combination)) for combination in itertools.product(*axes.values())]
+
+
+def case_label(case):
+    return ", ".join(f"{name}={value}" for name, value in case.items())
+
+
+def case_log_dir(log_dir, case):
+    if not log_dir:
+        return log_dir
+
+    case_dir = "_".join(f"{name}-{value}" for name, value in case.items())
+    return os.path.join(log_dir, re.sub(r"[^A-Za-z0-9._-]+", "_", case_dir))
+
+
+class MatrixCaseResult:
+    def __init__(self, case, succeeded, duration, error = None):
+        self.case = case
+        self.succeeded = succeeded
+        self.duration = duration
+        self.error = error
+
+
+def _run_case(run_case, case):
+    # the output of the concurrently executed cases is prefixed with the values of the case
+    output_prefix = "[" + ",".join(case.values()) + "] "
+    started = time.monotonic()
+    error = None
+
+    # the reused worker process still has the log file of its previous case. The case opens its own one
+    logger.set_log_dir(None)
+
+    try:
+        with paf_impl._task_output_context(output_prefix, None):
+            run_case(case)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+
+    return MatrixCaseResult(case, error is None, time.monotonic() - started, error)
+
+
+def run_matrix(cases, run_case, jobs = 0):
+    """
+    Calls run_case(case) for each case in a separate process. Up to 'jobs' cases are executed at once.
+    0 means all cases at once. Returns the results in the order of the cases.
+    """
+    jobs = min(jobs or len(cases), len(cases))
+    results = [None] * len(cases)
+
+    # fork keeps the imported task modules and does not require the entry point to be importable
+    with ProcessPoolExecutor(max_workers = jobs, mp_context = multiprocessing.get_context("fork")) as executor:
+        futures = {executor.submit(_run_case, run_case, case): index for index, case in enumerate(cases)}
+
+        for future in as_completed(futures):
+            index = futures[future]
+
+            try:
+                result = future.result()
+            except Exception as e:
+                # e.g. the worker process was killed
+                result = MatrixCaseResult(cases[index], False, 0.0, f"{type(e).__name__}: {e}")
+
+            status = "succeeded" if result.succeeded else "failed"
+            logger.info(f"Matrix case '{case_label(result.case)}' {status} after {result.duration:.1f}s")
+            results[index] = result
+
+    return results
+
+
+def format_summary(results, label = case_label):
+    rows = [("Case", "Result", "Duration", "Error")]
+
+    for result in results:
+        rows.append((label(result.case),
+                     "OK" if result.succeeded else "FAILED",
+                     f"{result.duration:.1f}s",
+                     result.error.splitlines()[0] if result.error else ""))
+
+    widths = [max(len(row[column]) for row in rows) for column in range(len(rows[0]))]
+    lines = [" | ".join(value.ljust(width) for value, width in zip(row, widths)).rstrip() for row in rows]
+    lines.insert(1, "-+-".join("-" * width for width in widths))
+    return lines
@@ -4,7 +4,10 @@ Created on Dec 28, 2021
 @author: vladyslav_goncharuk
 '''
 
+import codecs
+import collections
 from collections import OrderedDict
+import contextlib
 import copy
 import json
 import paramiko
@@ -17,27 +20,83 @@ import tty
 import sys
 import subprocess
 import select
+import selectors
 import shlex
 import signal
+import threading
+import queue
 import errno
 import os
 import enum
+import mmap
+import tempfile
+import time
 from datetime import datetime
 import re
-from typing import Dict, List, Optional, Union, cast
+from typing import IO, Any, Deque, Dict, List, Optional, Union, cast
 
+from paf import artifact_cache
 from paf import common
+from paf import jobserver
+from paf import journal
+from paf import prefetch
+from paf import scheduler
+from paf import ssh_transfer
+from paf import task_state
+from paf import timing
 from pickle import NONE
 import pty
 
+class RawLogFileSink:
+    """
+    Writes the raw command output into the log file through the binary stream of the file handler.
+    The structured records and the raw output share one buffered writer, so they stay in order.
+    """
+
+    def __init__(self, file_handler):
+        self.__file_handler = file_handler
+        self.__at_line_start = True
+
+    def write(self, data):
+        if not data:
+            return
+
+        self.__file_handler.acquire()
+        try:
+            # the handler flushes its text layer after each record, so nothing is pending there
+            self.__file_handler.stream.buffer.write(data)
+            self.__at_line_start = data.endswith(b"\n")
+        finally:
+            self.__file_handler.release()
+
+    # terminates the last output line, so that the next record starts on its own line
+    def end_line(self):
+        if self.__at_line_start:
+            return
+
+        self.__file_handler.acquire()
+        try:
+            if not self.__at_line_start:
+                self.__file_handler.stream.buffer.write(b"\n")
+                self.__at_line_start = True
+        finally:
+            self.__file_handler.release()
+
+    def flush(self):
+        self.end_line()
+        self.__file_handler.flush()
+
 class logger:
     __log_dir: Optional[str] = None
     log_filepath: Optional[str] = None
     __logging = logging.getLogger(__name__)
     __logging_to_file: Optional[logging.Logger] = None
+    __file_handler: Optional[logging.FileHandler] = None
+    # the log directory, which contains the current log file
+    __file_log_dir: Optional[str] = None
+    __output_sink: Optional[RawLogFileSink] = None
     __print_to_file = False
     __messageFormat = "%(asctime)s,%(msecs)03d %(levelname)s %(message)s"
-    __simpleFormat = '%(message)s'
 
     @staticmethod
     def __generate_log_filepath():
@@ -58,6 +117,10 @@ class logger:
 
         if logger.log_to_file():
 
+            # each run of a batch or a matrix case, executed by a reused process, logs into its own directory
+            if logger.__logging_to_file is not None and logger.__file_log_dir != logger.__log_dir:
+                logger.__close_log_file()
+
             if logger.__logging_to_file == None:
 
                 logger.__logging_to_file = logging.getLogger(__name__ + "_to_file")
@@ -70,38 +133,67 @@ class logger:
                 formatter = logging.Formatter(logger.__messageFormat)
                 file_handler.setFormatter(formatter)
                 logger.__logging_to_file.addHandler(file_handler)
+                logger.__file_handler = file_handler
+                logger.__file_log_dir = logger.__log_dir
+                logger.__output_sink = RawLogFileSink(file_handler)
 
         coloredlogs.install(level='INFO', logging = logger.__logging,
                     fmt=logger.__messageFormat,
                     milliseconds=True)
 
     @staticmethod
-    def __change_to_simple_formatting():
-        for handler in logger.__logging.handlers:
-            handler.setFormatter(logging.Formatter(logger.__simpleFormat))
+    def __close_log_file():
+        if logger.__output_sink is not None:
+            logger.__output_sink.flush()
+
+        if logger.__logging_to_file is not None and logger.__file_handler is not None:
+            logger.__logging_to_file.removeHandler(logger.__file_handler)
+            logger.__file_handler.close()
+
+        logger.__logging_to_file = None
+        logger.__file_handler = None
+        logger.__file_log_dir = None
+        logger.__output_sink = None
 
+    # writes the raw command output into the log file. It is neither decoded nor formatted
     @staticmethod
-    def __change_to_message_formatting():
-        for handler in logger.__logging.handlers:
-            handler.setFormatter(logging.Formatter(logger.__messageFormat))
+    def output_to_file(data):
+        if logger.__output_sink is not None:
+            logger.__output_sink.write(data)
+
+    @staticmethod
+    def flush_output_to_file():
+        if logger.__output_sink is not None:
+            logger.__output_sink.flush()
+
+    # the messages of the tasks executed in parallel are prefixed with the task name
+    @staticmethod
+    def __prefixed(msg):
+        prefix = _get_output_prefix()
+        return f"{prefix}{msg}" if prefix else msg
+
+    @staticmethod
+    def __end_output_line():
+        if logger.__output_sink is not None:
+            logger.__output_sink.end_line()
+
+    @staticmethod
+    def __non_formatted_to_file(msg, *args):
+        if args:
+            msg = msg % args
+        logger.output_to_file(bytes(f"{msg}\n", encoding='utf-8'))
 
     @staticmethod
     def non_formatted_info_to_file( msg, *args, **kwargs ):
-        logger.__change_to_simple_formatting()
-        logger.__file_logger().info( msg, *args, **kwargs )
-        logger.__change_to_message_formatting()
+        logger.__non_formatted_to_file(msg, *args)
 
     @staticmethod
     def non_formatted_warning_to_file( msg, *args, **kwargs ):
-        logger.__change_to_simple_formatting()
-        logger.__file_logger().warning( msg, *args, **kwargs )
-        logger.__change_to_message_formatting()
+        logger.__non_formatted_to_file(msg, *args)
 
     @staticmethod
     def non_formatted_error_to_file( msg, *args, **kwargs ):
-        logger.__change_to_simple_formatting()
-        logger.__file_logger().error( msg, *args, **kwargs )
-        logger.__change_to_message_formatting()
+        logger.__non_formatted_to_file(msg, *args)
 
     @staticmethod
     def log_to_file():
@@ -113,25 +205,35 @@ class logger:
     def set_log_dir(log_dir):
         logger.__log_dir = log_dir
 
+    @staticmethod
+    def get_log_dir():
+        return logger.__log_dir
+
     @staticmethod
     def info(msg, *args, **kwargs):
+        msg = logger.__prefixed(msg)
         logger.__logging.info(msg, *args, **kwargs)
 
         if logger.log_to_file():
+            logger.__end_output_line()
             logger.__file_logger().info(msg, *args, **kwargs)
 
     @staticmethod
     def warning(msg, *args, **kwargs):
+        msg = logger.__prefixed(msg)
         logger.__logging.warning(msg, *args, **kwargs)
 
         if logger.log_to_file():
+            logger.__end_output_line()
             logger.__file_logger().warning(msg, *args, **kwargs)
 
     @staticmethod
     def error(msg, *args, **kwargs):
+        msg = logger.__prefixed(msg)
         logger.__logging.error(msg, *args, **kwargs)
 
         if logger.log_to_file():
+            logger.__end_output_line()
             logger.__file_logger().error(msg, *args, **kwargs)
 
 class ExecutionMode(enum.Enum):
@@ -148,10 +250,44 @@ class CommunicationMode(enum.Enum):
     USE_PTY = 0 # redirect output to pseudo-terminal pair. The executed sub-process will think, that it is executed in tty
     PIPE_OUTPUT = 1 # pipe all output without usage of the additional PTY. The executed sub-process will think, that it is NOT running in tty
 
+# how the output is stored in the ExecutionMode.COLLECT_DATA mode
+class CaptureMode(enum.Enum):
+    MEMORY        = 0 # keep the whole output in memory
+    SPOOL_TO_DISK = 1 # keep the output in memory up to the spool threshold. The rest goes to a temporary file in the log directory
+    TAIL          = 2 # keep only the last part of the output. Enough for the failure diagnostics of long builds
+
+# which deadline has stopped a sub-process
+class TimeoutKind(enum.Enum):
+    OVERALL = 0 # the sub-process was running longer than 'timeout' seconds
+    IDLE    = 1 # the sub-process did not produce any output for 'idle_timeout' seconds
+
 class Config:
     __DEFAULT_EXECUTION_MODE = ExecutionMode.COLLECT_DATA
     __DEFAULT_INTERACTION_MODE = InteractionMode.PROCESS_INPUT
     __DEFAULT_COMMUNICATION_MODE = CommunicationMode.USE_PTY
+    __DEFAULT_CAPTURE_MAX_SIZE: Optional[int] = None
+    __DEFAULT_CAPTURE_MODE = CaptureMode.MEMORY
+    __DEFAULT_CAPTURE_SPOOL_THRESHOLD = 64 * 1024 * 1024
+    __DEFAULT_CAPTURE_TAIL_SIZE: Optional[int] = 64 * 1024
+    __DEFAULT_CAPTURE_TAIL_LINES: Optional[int] = None
+    __CONSOLE_FLUSH_INTERVAL = 0.1
+    __CONSOLE_FLUSH_SIZE = 64 * 1024
+    __TASK_STATE_DB_PATH = os.path.join(".paf", "task_state.db")
+    __FORCE_ALL_TASKS = False
+    __FORCED_TASKS: List[str] = []
+    __ARTIFACT_CACHE_DIR: Optional[str] = None
+    __ARTIFACT_CACHE_MAX_SIZE = 10 * 1024 * 1024 * 1024
+    __RESOURCE_CORES = os.cpu_count() or 1
+    __RESOURCE_MEMORY = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // (1024 * 1024)
+    __JOBSERVER = False
+    __SSH_MAX_CONNECTIONS_PER_HOST = 4
+    __SSH_MAX_SESSIONS_PER_CONNECTION = 8
+    __SSH_KEEPALIVE_INTERVAL = 15
+    __SSH_RECONNECT_ATTEMPTS = 5
+    __SSH_RECONNECT_MAX_DELAY = 30
+    __TRANSFER_STATE_DIR = os.path.join(".paf", "transfers")
+    __TRANSFER_STREAMS = 4
+    __TRANSFER_PARALLEL_THRESHOLD = 64 * 1024 * 1024
 
     @staticmethod
     def set_default_execution_mode(val):
@@ -177,6 +313,215 @@ class Config:
     def get_default_communication_mode():
         return Config.__DEFAULT_COMMUNICATION_MODE
 
+    # maximum amount of bytes collected per stream in COLLECT_DATA mode. None means unlimited
+    @staticmethod
+    def set_default_capture_max_size(val):
+        Config.__DEFAULT_CAPTURE_MAX_SIZE = val
+
+    @staticmethod
+    def get_default_capture_max_size():
+        return Config.__DEFAULT_CAPTURE_MAX_SIZE
+
+    @staticmethod
+    def set_default_capture_mode(val):
+        Config.__DEFAULT_CAPTURE_MODE = val
+
+    @staticmethod
+    def get_default_capture_mode():
+        return Config.__DEFAULT_CAPTURE_MODE
+
+    # amount of bytes per stream kept in memory in CaptureMode.SPOOL_TO_DISK mode
+    @staticmethod
+    def set_default_capture_spool_threshold(val):
+        Config.__DEFAULT_CAPTURE_SPOOL_THRESHOLD = val
+
+    @staticmethod
+    def get_default_capture_spool_threshold():
+        return Config.__DEFAULT_CAPTURE_SPOOL_THRESHOLD
+
+    # amount of the last bytes per stream kept in CaptureMode.TAIL mode. None means no limit by size
+    @staticmethod
+    def set_default_capture_tail_size(val):
+        Config.__DEFAULT_CAPTURE_TAIL_SIZE = val
+
+    @staticmethod
+    def get_default_capture_tail_size():
+        return Config.__DEFAULT_CAPTURE_TAIL_SIZE
+
+    # amount of the last lines per stream kept in CaptureMode.TAIL mode. None means no limit by lines
+    @staticmethod
+    def set_default_capture_tail_lines(val):
+        Config.__DEFAULT_CAPTURE_TAIL_LINES = val
+
+    @staticmethod
+    def get_default_capture_tail_lines():
+        return Config.__DEFAULT_CAPTURE_TAIL_LINES
+
+    # maximum amount of seconds the command output stays in the console buffer
+    @staticmethod
+    def set_console_flush_interval(val):
+        Config.__CONSOLE_FLUSH_INTERVAL = val
+
+    @staticmethod
+    def get_console_flush_interval():
+        return Config.__CONSOLE_FLUSH_INTERVAL
+
+    # amount of the buffered bytes of the command output, which triggers the console flush
+    @staticmethod
+    def set_console_flush_size(val):
+        Config.__CONSOLE_FLUSH_SIZE = val
+
+    @staticmethod
+    def get_console_flush_size():
+        return Config.__CONSOLE_FLUSH_SIZE
+
+    # database with the fingerprints of the tasks, which declare their inputs and outputs
+    @staticmethod
+    def set_task_state_db_path(val):
+        Config.__TASK_STATE_DB_PATH = val
+
+    @staticmethod
+    def get_task_state_db_path():
+        return Config.__TASK_STATE_DB_PATH
+
+    # execute all tasks, even if they are up to date
+    @staticmethod
+    def set_force_all_tasks(val):
+        Config.__FORCE_ALL_TASKS = val
+
+    @staticmethod
+    def get_force_all_tasks():
+        return Config.__FORCE_ALL_TASKS
+
+    # names of the tasks, which are executed, even if they are up to date
+    @staticmethod
+    def set_forced_tasks(val):
+        Config.__FORCED_TASKS = list(val)
+
+    @staticmethod
+    def get_forced_tasks():
+        return Config.__FORCED_TASKS
+
+    # directory of the cache of the task outputs. None means, that the cache is not used
+    @staticmethod
+    def set_artifact_cache_dir(val):
+        Config.__ARTIFACT_CACHE_DIR = val
+
+    @staticmethod
+    def get_artifact_cache_dir():
+        return Config.__ARTIFACT_CACHE_DIR
+
+    # amount of bytes of the cached files, above which the least recently used entries are evicted
+    @staticmethod
+    def set_artifact_cache_max_size(val):
+        Config.__ARTIFACT_CACHE_MAX_SIZE = val
+
+    @staticmethod
+    def get_artifact_cache_max_size():
+        return Config.__ARTIFACT_CACHE_MAX_SIZE
+
+    # number of the CPU cores shared by the tasks executed in parallel. The machine's number by default
+    @staticmethod
+    def set_resource_cores(val):
+        Config.__RESOURCE_CORES = val
+
+    @staticmethod
+    def get_resource_cores():
+        return Config.__RESOURCE_CORES
+
+    # megabytes of the memory shared by the tasks executed in parallel. The machine's memory by default
+    @staticmethod
+    def set_resource_memory(val):
+        Config.__RESOURCE_MEMORY = val
+
+    @staticmethod
+    def get_resource_memory():
+        return Config.__RESOURCE_MEMORY
+
+    # whether the sub-processes share one GNU make jobserver with the resource cores as its slots.
+    # Requires GNU make 4.4 or later
+    @staticmethod
+    def set_jobserver(val):
+        Config.__JOBSERVER = val
+
+    @staticmethod
+    def get_jobserver():
+        return Config.__JOBSERVER
+
+    # maximum number of the SSH connections, which are opened to the same user@host:port.
+    # An additional connection is opened only when all existing ones have reached their session limit
+    @staticmethod
+    def set_ssh_max_connections_per_host(val):
+        Config.__SSH_MAX_CONNECTIONS_PER_HOST = val
+
+    @staticmethod
+    def get_ssh_max_connections_per_host():
+        return Config.__SSH_MAX_CONNECTIONS_PER_HOST
+
+    # maximum number of the commands, which are executed at once over one SSH connection.
+    # Should not exceed the MaxSessions setting of the SSH server, which is 10 by default
+    @staticmethod
+    def set_ssh_max_sessions_per_connection(val):
+        Config.__SSH_MAX_SESSIONS_PER_CONNECTION = val
+
+    @staticmethod
+    def get_ssh_max_sessions_per_connection():
+        return Config.__SSH_MAX_SESSIONS_PER_CONNECTION
+
+    # seconds between the keepalive messages of the SSH connections. 0 disables them
+    @staticmethod
+    def set_ssh_keepalive_interval(val):
+        Config.__SSH_KEEPALIVE_INTERVAL = val
+
+    @staticmethod
+    def get_ssh_keepalive_interval():
+        return Config.__SSH_KEEPALIVE_INTERVAL
+
+    # number of the attempts to restore a broken SSH connection, e.g. after the reboot of the target
+    @staticmethod
+    def set_ssh_reconnect_attempts(val):
+        Config.__SSH_RECONNECT_ATTEMPTS = val
+
+    @staticmethod
+    def get_ssh_reconnect_attempts():
+        return Config.__SSH_RECONNECT_ATTEMPTS
+
+    # maximum delay in seconds between the reconnection attempts. The delay starts at 1 second and doubles
+    @staticmethod
+    def set_ssh_reconnect_max_delay(val):
+        Config.__SSH_RECONNECT_MAX_DELAY = val
+
+    @staticmethod
+    def get_ssh_reconnect_max_delay():
+        return Config.__SSH_RECONNECT_MAX_DELAY
+
+    # directory with the progress of the interrupted file transfers, which are resumed by the next attempt
+    @staticmethod
+    def set_transfer_state_dir(val):
+        Config.__TRANSFER_STATE_DIR = val
+
+    @staticmethod
+    def get_transfer_state_dir():
+        return Config.__TRANSFER_STATE_DIR
+
+    # number of the SFTP sessions, which transfer the parts of a large file at once
+    @staticmethod
+    def set_transfer_streams(val):
+        Config.__TRANSFER_STREAMS = val
+
+    @staticmethod
+    def get_transfer_streams():
+        return Config.__TRANSFER_STREAMS
+
+    # minimal size in bytes of the file, which is transferred by several streams
+    @staticmethod
+    def set_transfer_parallel_threshold(val):
+        Config.__TRANSFER_PARALLEL_THRESHOLD = val
+
+    @staticmethod
+    def get_transfer_parallel_threshold():
+        return Config.__TRANSFER_PARALLEL_THRESHOLD
+
 
 def _resolve_execution_mode(exec_mode):
     if exec_mode == None:
@@ -185,6 +530,9 @@ def _resolve_execution_mode(exec_mode):
 
 
 def _resolve_interaction_mode(interaction_mode):
+    # the tasks executed in parallel can not share the user input
+    if _get_output_prefix():
+        return InteractionMode.IGNORE_INPUT
     if interaction_mode == None:
         return Config.get_default_interaction_mode()
     return interaction_mode
@@ -196,135 +544,1026 @@ def _resolve_communication_mode(communication_mode):
     return communication_mode
 
 
-def _check_expected_return_code(command_output, expected_return_codes, failure_prefix):
+def _resolve_capture_mode(capture_mode):
+    if capture_mode == None:
+        return Config.get_default_capture_mode()
+    return capture_mode
+
+
+class CommandFailedError(Exception):
+    """
+    Raised when a command returns an unexpected code.
+    Carries the last lines of the collected output and the amount of produced bytes for the failure diagnostics.
+    """
+
+    # amount of the last output lines attached to the exception
+    TAIL_LINES = 50
+
+    def __init__(self, message, command_output):
+        super().__init__(message)
+        self.command_output = command_output
+        self.exit_code = command_output.exit_code
+        self.stdout_tail, self.stdout_total_size = CommandFailedError.__stream_tail(command_output, "stdout_capture")
+        self.stderr_tail, self.stderr_total_size = CommandFailedError.__stream_tail(command_output, "stderr_capture")
+
+    @staticmethod
+    def __stream_tail(command_output, capture_name):
+        capture = getattr(command_output, capture_name, None)
+        if capture is None:
+            return [], 0
+        return capture.tail(CommandFailedError.TAIL_LINES), capture.total_size()
+
+
+class CommandTimeoutError(CommandFailedError):
+    """Raised when a command was stopped, because it has exceeded its overall or idle timeout."""
+
+    def __init__(self, message, command_output):
+        super().__init__(message, command_output)
+        self.timeout_kind = command_output.timeout_kind
+
+
+def _check_expected_return_code(command_output, expected_return_codes, failure_prefix, return_capture = False):
+    if getattr(command_output, "timed_out", False):
+        raise CommandTimeoutError(f"{failure_prefix} The command has exceeded its "
+                                  f"{command_output.timeout_kind.name.lower()} timeout and was killed. "
+                                  f"Actual return code: '{command_output.exit_code}'", command_output)
+
     if not command_output.exit_code in expected_return_codes:
-        raise Exception(f"{failure_prefix} Expected return codes are: '{expected_return_codes}'. "
-                        f"Actual return code: '{command_output.exit_code}'")
+        raise CommandFailedError(f"{failure_prefix} Expected return codes are: '{expected_return_codes}'. "
+                                 f"Actual return code: '{command_output.exit_code}'", command_output)
 
     if command_output.exit_code != 0:
         logger.info(f"Return code '{command_output.exit_code}' fits to the expected return code.")
 
+    # the capture is returned as is, e.g. so that the output spooled to disk is not decoded as a whole
+    if return_capture:
+        return command_output.stdout_capture
+
     return command_output.stdout
 
 
+class CommandOutputCapture:
+    """Collects the raw output chunks of a command and joins them only once, on first access."""
+
+    def __init__(self, max_size = None):
+        self.__chunks: List[bytes] = []
+        self.__stored_size = 0
+        self.__total_size = 0
+        self.__max_size = max_size
+        self.__truncated = False
+        self.__decoded: Optional[str] = None
+
+    def append(self, data):
+        if not data:
+            return
+
+        self.__total_size += len(data)
+
+        if self.__max_size is not None:
+            free_space = self.__max_size - self.size()
+            if len(data) > free_space:
+                self.__truncated = True
+                if free_space <= 0:
+                    return
+                data = data[:free_space]
+
+        self._store(bytes(data))
+        self.__decoded = None
+
+    def _store(self, data):
+        self.__chunks.append(data)
+        self.__stored_size += len(data)
+
+    def _data(self):
+        if len(self.__chunks) > 1:
+            self.__chunks = [b"".join(self.__chunks)]
+        return self.__chunks[0] if self.__chunks else b""
+
+    def _truncate(self, size):
+        data = self._data()[:size]
+        self.__chunks = [data] if data else []
+        self.__stored_size = len(data)
+
+    def rstrip(self, chars = b"\r\n"):
+        data = self._data()
+        size = self.size()
+        end = size
+        while end > 0 and data[end - 1:end] in chars:
+            end -= 1
+
+        if end != size:
+            self._truncate(end)
+            self.__decoded = None
+
+    # amount of bytes which are currently stored
+    def size(self):
+        return self.__stored_size
+
+    def total_size(self):
+        return self.__total_size
+
+    def truncated(self):
+        return self.__truncated
+
+    def find(self, sub, start = 0):
+        """Returns the byte offset of the first occurrence of 'sub' or -1."""
+        if isinstance(sub, str):
+            sub = sub.encode("utf-8")
+        return self._data().find(sub, start)
+
+    def splitlines(self):
+        """Lazily iterates over the decoded lines of the output, without the line endings."""
+        data = self._data()
+        size = self.size()
+        position = 0
+        while position < size:
+            end = data.find(b"\n", position)
+            if end == -1:
+                end = size
+            yield data[position:end].rstrip(b"\r").decode(encoding='utf-8', errors='ignore')
+            position = end + 1
+
+    def tail(self, lines_number):
+        """Returns the last 'lines_number' decoded lines of the output."""
+        if lines_number <= 0 or self.size() == 0:
+            return []
+
+        data = self._data()
+        end = self.size()
+        if data[end - 1:end] == b"\n":
+            end -= 1
+
+        position = end
+        for _ in range(lines_number):
+            position = data.rfind(b"\n", 0, position)
+            if position == -1:
+                break
+
+        return [line.rstrip(b"\r").decode(encoding='utf-8', errors='ignore')
+                for line in data[position + 1:end].split(b"\n")]
+
+    def as_bytes(self):
+        return bytes(self._data())
+
+    def as_memoryview(self):
+        return memoryview(self._data())
+
+    def as_str(self):
+        if self.__decoded is None:
+            self.__decoded = self.as_bytes().decode(encoding='utf-8', errors='ignore')
+        return self.__decoded
+
+    def close(self):
+        pass
+
+    def __bytes__(self):
+        return self.as_bytes()
+
+    def __str__(self):
+        return self.as_str()
+
+    def __len__(self):
+        return self.size()
+
+
+class SpooledCommandOutputCapture(CommandOutputCapture):
+    """
+    Keeps the output in memory up to the spool threshold, then moves it to a temporary file.
+    The spooled output is accessed through a read-only memory mapping of that file,
+    so 'find', 'splitlines' and 'tail' do not load the whole output into memory.
+    """
+
+    def __init__(self, spool_threshold, spool_dir = None, max_size = None):
+        super().__init__(max_size)
+        self.__spool_threshold = spool_threshold
+        self.__spool_dir = spool_dir
+        self.__chunks: List[bytes] = []
+        self.__memory_size = 0
+        self.__file_size = 0
+        self.__file: Optional[IO[bytes]] = None
+        self.__mapping: Optional[mmap.mmap] = None
+
+    def spooled(self):
+        return self.__file is not None
+
+    def _store(self, data):
+        if self.__file is None and self.__memory_size + len(data) > self.__spool_threshold:
+            self.__file = tempfile.TemporaryFile(dir = self.__spool_dir, prefix = "paf_output_")
+            logger.info(f"Collected output exceeds '{self.__spool_threshold}' bytes. "
+                        f"It is spooled to a temporary file in '{self.__spool_dir or tempfile.gettempdir()}'")
+            for chunk in self.__chunks:
+                self.__file.write(chunk)
+            self.__file_size = self.__memory_size
+            self.__chunks = []
+            self.__memory_size = 0
+
+        if self.__file is not None:
+            self.__file.write(data)
+            self.__file_size += len(data)
+            self.__mapping = None
+        else:
+            self.__chunks.append(data)
+            self.__memory_size += len(data)
+
+    def _data(self):
+        if self.__file is None:
+            if len(self.__chunks) > 1:
+                self.__chunks = [b"".join(self.__chunks)]
+            return self.__chunks[0] if self.__chunks else b""
+
+        if self.__mapping is None:
+            self.__file.flush()
+            if self.__file_size == 0:
+                return b""
+            self.__mapping = mmap.mmap(self.__file.fileno(), 0, access = mmap.ACCESS_READ)
+        return self.__mapping
+
+    def _truncate(self, size):
+        if self.__file is None:
+            data = self._data()[:size]
+            self.__chunks = [data] if data else []
+            self.__memory_size = len(data)
+        else:
+            self.__mapping = None
+            self.__file.flush()
+            self.__file.truncate(size)
+            self.__file.seek(size)
+            self.__file_size = size
+
+    def size(self):
+        return self.__file_size if self.__file is not None else self.__memory_size
+
+    def close(self):
+        self.__mapping = None
+        if self.__file is not None:
+            self.__file.close()
+            self.__file = None
+        self.__chunks = []
+        self.__memory_size = 0
+        self.__file_size = 0
+
+
+class TailCommandOutputCapture(CommandOutputCapture):
+    """
+    Keeps only the last 'max_size' bytes and the last 'max_lines' lines of the output in a ring of chunks.
+    total_size() still counts all produced bytes, dropped_size() counts the discarded ones.
+    """
+
+    def __init__(self, max_size = None, max_lines = None):
+        super().__init__()
+        self.__max_size = max_size
+        self.__max_lines = max_lines
+        self.__chunks: Deque[bytes] = collections.deque()
+        self.__stored_size = 0
+        self.__newlines = 0
+
+    def _store(self, data):
+        self.__chunks.append(data)
+        self.__stored_size += len(data)
+        self.__newlines += data.count(b"\n")
+
+        if self.__max_size is not None and self.__stored_size > self.__max_size:
+            self.__drop_bytes(self.__stored_size - self.__max_size)
+
+        if self.__max_lines is not None:
+            # an unterminated last line counts as well
+            lines = self.__newlines + (0 if data.endswith(b"\n") else 1)
+            excess_lines = lines - self.__max_lines
+            if excess_lines > 0:
+                self.__drop_lines(excess_lines)
+
+    def __drop_bytes(self, amount):
+        while amount > 0:
+            first = self.__chunks[0]
+            if len(first) <= amount:
+                self.__chunks.popleft()
+                dropped = first
+            else:
+                self.__chunks[0] = first[amount:]
+                dropped = first[:amount]
+            amount -= len(dropped)
+            self.__stored_size -= len(dropped)
+            self.__newlines -= dropped.count(b"\n")
+
+    def __drop_lines(self, amount):
+        dropped_size = 0
+        for chunk in self.__chunks:
+            chunk_newlines = chunk.count(b"\n")
+            if chunk_newlines < amount:
+                amount -= chunk_newlines
+                dropped_size += len(chunk)
+                continue
+
+            position = -1
+            for _ in range(amount):
+                position = chunk.find(b"\n", position + 1)
+            dropped_size += position + 1
+            break
+
+        self.__drop_bytes(dropped_size)
+
+    def _data(self):
+        if len(self.__chunks) > 1:
+            joined = b"".join(self.__chunks)
+            self.__chunks.clear()
+            self.__chunks.append(joined)
+        return self.__chunks[0] if self.__chunks else b""
+
+    def _truncate(self, size):
+        data = self._data()[:size]
+        self.__chunks.clear()
+        if data:
+            self.__chunks.append(data)
+        self.__stored_size = len(data)
+        self.__newlines = data.count(b"\n")
+
+    def size(self):
+        return self.__stored_size
+
+    def dropped_size(self):
+        return self.total_size() - self.__stored_size
+
+
+def _create_output_capture(capture_mode):
+    resolved_capture_mode = _resolve_capture_mode(capture_mode)
+
+    if resolved_capture_mode == CaptureMode.SPOOL_TO_DISK:
+        return SpooledCommandOutputCapture(Config.get_default_capture_spool_threshold(),
+                                           logger.get_log_dir() or None,
+                                           Config.get_default_capture_max_size())
+    elif resolved_capture_mode == CaptureMode.TAIL:
+        return TailCommandOutputCapture(Config.get_default_capture_tail_size(),
+                                        Config.get_default_capture_tail_lines())
+
+    return CommandOutputCapture(Config.get_default_capture_max_size())
+
+
+def _create_output_decoder():
+    # incremental, so that the multi-byte characters split between two reads are not lost
+    return codecs.getincrementaldecoder("utf-8")(errors = "ignore")
+
+
+# durations of the elements of the current execution. None, if the durations are not recorded
+_timing_db: Optional[timing.TimingDB] = None
+
+class _Measurement:
+    def __init__(self):
+        # the skipped elements are not recorded, as their durations would distort the estimations
+        self.skipped = False
+
+@contextlib.contextmanager
+def _timed(kind, scope, name):
+    timing_db = _timing_db
+    measurement = _Measurement()
+    started = time.time()
+    started_monotonic = time.monotonic()
+    succeeded = False
+    try:
+        yield measurement
+        succeeded = True
+    finally:
+        if timing_db is not None and not measurement.skipped:
+            timing_db.record(kind, scope, name, started, time.monotonic() - started_monotonic, succeeded)
+
+def _command_timing_name(cmd, avoid_printing_command):
+    if avoid_printing_command:
+        return "<hidden>"
+    return cmd if isinstance(cmd, str) else " ".join(str(arg) for arg in cmd)
+
+
+# parsed XML configs by their stamps, so that the runs in one process do not parse the unchanged files again
+_parsed_xml_configs: Dict[tuple, Any] = {}
+
+def _parse_xml_config(config_path):
+    stamp = common.file_stamp(config_path)
+    root = _parsed_xml_configs.get(stamp)
+    if root is None:
+        root = ET.parse(config_path).getroot()
+        _parsed_xml_configs[stamp] = root
+    return root
+
+
+# GNU make jobserver exported to all sub-processes. None, if it is disabled
+_jobserver: Optional[jobserver.Jobserver] = None
+
+@contextlib.contextmanager
+def _shared_jobserver():
+    global _jobserver
+    # a jobserver created by the enclosing execution or inherited from a make, which started paf, is kept
+    if _jobserver is not None or not Config.get_jobserver() or jobserver.has_jobserver(os.environ.get("MAKEFLAGS")):
+        yield
+        return
+
+    _jobserver = jobserver.Jobserver(Config.get_resource_cores())
+    logger.info(f"Jobserver with {_jobserver.get_slots()} slots was created: '{_jobserver.get_path()}'")
+    try:
+        yield
+    finally:
+        _jobserver.close()
+        _jobserver = None
+
+
+# the console and log output of the tasks executed in parallel is prefixed with the task name.
+# The tasks of a phase also share the cancellation scope, which stops them after the first failure
+_task_context = threading.local()
+
+def _get_output_prefix():
+    return getattr(_task_context, "output_prefix", "")
+
+def _get_cancellation_scope():
+    return getattr(_task_context, "cancellation_scope", None)
+
+@contextlib.contextmanager
+def _task_output_context(output_prefix, cancellation_scope):
+    previous = (_get_output_prefix(), _get_cancellation_scope())
+    _task_context.output_prefix = output_prefix
+    _task_context.cancellation_scope = cancellation_scope
+    try:
+        yield
+    finally:
+        _task_context.output_prefix, _task_context.cancellation_scope = previous
+
+
+class TaskCancelledError(Exception):
+    """Raised when a command is started in a task, which was cancelled, because another task has failed."""
+
+
+class CancellationScope:
+    """
+    Stops the commands, which are running in the scope, once it is cancelled.
+    Each running command registers a callback, which stops it.
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__cancelled = False
+        self.__callbacks: Dict[int, Any] = {}
+
+    def cancel(self):
+        with self.__lock:
+            self.__cancelled = True
+            callbacks = list(self.__callbacks.values())
+
+        for callback in callbacks:
+            callback()
+
+    def cancelled(self):
+        return self.__cancelled
+
+    def add_callback(self, callback):
+        with self.__lock:
+            cancelled = self.__cancelled
+            if not cancelled:
+                self.__callbacks[id(callback)] = callback
+
+        if cancelled:
+            callback()
+
+    def remove_callback(self, callback):
+        with self.__lock:
+            self.__callbacks.pop(id(callback), None)
+
+
+def _is_cancelled():
+    scope = _get_cancellation_scope()
+    return scope is not None and scope.cancelled()
+
+def _check_not_cancelled():
+    if _is_cancelled():
+        raise TaskCancelledError("The command was not started, because the task was cancelled.")
+
+@contextlib.contextmanager
+def _stop_on_cancel(callback):
+    scope = _get_cancellation_scope()
+    if scope is None:
+        yield
+        return
+
+    scope.add_callback(callback)
+    try:
+        yield
+    finally:
+        scope.remove_callback(callback)
+
+
+class OutputLinePrefixer:
+    """
+    Prefixes each line of the output. The incomplete last line is held back until it is completed,
+    so that the output of the tasks executed in parallel does not mix within a line.
+    """
+
+    # the incomplete line is released without waiting for its end, once it gets that long
+    MAX_PARTIAL_LINE_SIZE = 64 * 1024
+
+    def __init__(self, prefix):
+        self.__prefix = prefix
+        self.__partial_line = b""
+
+    def feed(self, data):
+        data = self.__partial_line + data
+        end = data.rfind(b"\n") + 1
+
+        if end == 0 and len(data) < OutputLinePrefixer.MAX_PARTIAL_LINE_SIZE:
+            self.__partial_line = data
+            return b""
+
+        if end == 0:
+            end = len(data)
+
+        self.__partial_line = data[end:]
+        lines = data[:end]
+        return self.__prefix + lines[:-1].replace(b"\n", b"\n" + self.__prefix) + lines[-1:]
+
+    def finish(self):
+        partial_line = self.__partial_line
+        self.__partial_line = b""
+        return self.__prefix + partial_line + b"\n" if partial_line else b""
+
+
+def _create_line_prefixer():
+    prefix = _get_output_prefix()
+    return OutputLinePrefixer(prefix.encode("utf-8")) if prefix else None
+
+
+class ConsoleSink:
+    """
+    Batches the command output written to the console streams.
+    The buffer is flushed once it reaches Config.get_console_flush_size() bytes or gets older than
+    Config.get_console_flush_interval() seconds. With 'immediate' each write is flushed right away,
+    so that the user sees the echo of the typed input.
+    Switching to another stream flushes the buffered output first, so that stdout and stderr keep their order.
+    With 'prefix' each output line is prefixed and written only once it is complete.
+    """
+
+    def __init__(self, immediate = False, translate_newlines = True, prefix = None):
+        self.__immediate = immediate
+        self.__translate_newlines = translate_newlines
+        self.__flush_interval = Config.get_console_flush_interval()
+        self.__flush_size = Config.get_console_flush_size()
+        self.__stream: Optional[Any] = None
+        self.__buffer = bytearray()
+        self.__buffered_since = 0.0
+        self.__is_tty: Dict[int, bool] = {}
+        self.__prefix = prefix
+        self.__prefixers: Dict[int, Any] = {}
+
+    def write(self, stream, data):
+        if self.__prefix is not None:
+            data = self.__prefixer(stream).feed(data)
+            if not data:
+                return
+
+        self.__append(stream, data)
+
+    # writes the held back incomplete lines and flushes the buffer
+    def finish(self):
+        for stream, prefixer in list(self.__prefixers.values()):
+            rest = prefixer.finish()
+            if rest:
+                self.__append(stream, rest)
+
+        self.flush()
+
+    def __prefixer(self, stream):
+        if id(stream) not in self.__prefixers:
+            self.__prefixers[id(stream)] = (stream, OutputLinePrefixer(self.__prefix))
+        return self.__prefixers[id(stream)][1]
+
+    def __append(self, stream, data):
+        if stream is not self.__stream:
+            self.flush()
+            self.__stream = stream
+
+        # the console is in the raw mode while the command is running, so the new lines are not translated by tty
+        if self.__translate_newlines and self.__stream_is_tty(stream):
+            data = data.replace(b'\n', b'\r\n')
+
+        if not self.__buffer:
+            self.__buffered_since = time.monotonic()
+
+        self.__buffer += data
+
+        if self.__immediate or len(self.__buffer) >= self.__flush_size:
+            self.flush()
+
+    # how long the select() call can wait before the buffered output should be flushed
+    def flush_timeout(self):
+        if not self.__buffer:
+            return None
+        return max(self.__buffered_since + self.__flush_interval - time.monotonic(), 0)
+
+    def flush_if_due(self):
+        if self.__buffer and time.monotonic() >= self.__buffered_since + self.__flush_interval:
+            self.flush()
+
+    def flush(self):
+        if self.__stream is None:
+            return
+
+        if self.__buffer:
+            self.__stream.buffer.write(self.__buffer)
+            self.__buffer.clear()
+
+        self.__stream.flush()
+
+    def __stream_is_tty(self, stream):
+        if id(stream) not in self.__is_tty:
+            self.__is_tty[id(stream)] = common.isatty(stream)
+        return self.__is_tty[id(stream)]
+
+
+def _create_console_sink(interaction_mode, translate_newlines = True):
+    immediate = interaction_mode == InteractionMode.PROCESS_INPUT and common.isatty(sys.stdin)
+    prefix = _get_output_prefix()
+    return ConsoleSink(immediate, translate_newlines, prefix.encode("utf-8") if prefix else None)
+
+
+class OutputListener:
+    """
+    Delivers the output of a running command to the 'on_chunk' and 'on_line' callbacks.
+    'on_chunk' receives the raw bytes, 'on_line' receives each decoded line without the line ending.
+    If any callback returns False, the command is stopped. The stop can also be requested
+    from another thread with request_stop().
+    """
+
+    def __init__(self, on_chunk = None, on_line = None):
+        self.__on_chunk = on_chunk
+        self.__on_line = on_line
+        self.__partial_lines: Dict[str, str] = {}
+        self.__decoders: Dict[str, Any] = {}
+        self.__stop_requested = False
+        self.__wakeup_read_fd, self.__wakeup_write_fd = os.pipe()
+        os.set_blocking(self.__wakeup_write_fd, False)
+
+    def wants_text(self):
+        return self.__on_line is not None
+
+    # 'text' is the already decoded 'data'. If it is not given, the listener decodes 'data' itself
+    def feed(self, data, stream_name = "stdout", text = None):
+        if self.__stop_requested:
+            return
+
+        if self.__on_chunk is not None:
+            if self.__on_chunk(data) is False:
+                self.request_stop()
+                return
+
+        if self.__on_line is not None:
+            if text is None:
+                text = self.__decoder(stream_name).decode(data)
+
+            lines = (self.__partial_lines.pop(stream_name, "") + text).split("\n")
+            if lines[-1]:
+                self.__partial_lines[stream_name] = lines[-1]
+
+            for line in lines[:-1]:
+                if self.__emit_line(line):
+                    return
+
+    def finish(self):
+        for stream_name, decoder in self.__decoders.items():
+            rest = decoder.decode(b"", final = True)
+            if rest:
+                self.__partial_lines[stream_name] = self.__partial_lines.get(stream_name, "") + rest
+
+        partial_lines = self.__partial_lines
+        self.__partial_lines = {}
+        self.__decoders = {}
+
+        for line in partial_lines.values():
+            if self.__stop_requested or self.__emit_line(line):
+                return
+
+    def __decoder(self, stream_name):
+        if stream_name not in self.__decoders:
+            self.__decoders[stream_name] = _create_output_decoder()
+        return self.__decoders[stream_name]
+
+    def __emit_line(self, line):
+        if self.__on_line(line.rstrip("\r")) is False:
+            self.request_stop()
+        return self.__stop_requested
+
+    def request_stop(self):
+        if not self.__stop_requested:
+            self.__stop_requested = True
+            try:
+                os.write(self.__wakeup_write_fd, b"\0")
+            except (BlockingIOError, OSError):
+                pass
+
+    def stop_requested(self):
+        return self.__stop_requested
+
+    # becomes readable once the stop is requested, so that the output pump wakes up
+    def fileno(self):
+        return self.__wakeup_read_fd
+
+    def close(self):
+        for fd in (self.__wakeup_read_fd, self.__wakeup_write_fd):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _create_output_listener(on_chunk, on_line):
+    if on_chunk is None and on_line is None:
+        return contextlib.nullcontext()
+    return OutputListener(on_chunk, on_line)
+
+
+# how long a stopped process is given to exit after SIGTERM before it is killed
+_PROCESS_TERMINATE_TIMEOUT = 5.0
+
+def _stop_process(sub_process):
+    if sub_process.poll() is not None:
+        return
+
+    sub_process.terminate()
+    try:
+        sub_process.wait(_PROCESS_TERMINATE_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        sub_process.kill()
+        sub_process.wait()
+
+
+# used while waiting for the whole process group to exit
+_PROCESS_GROUP_POLL_INTERVAL = 0.05
+
+def _signal_process_group(pgid, signum):
+    try:
+        os.killpg(pgid, signum)
+        return True
+    except ProcessLookupError:
+        return False
+
+# the sub-process should be the leader of its own session, so that its whole process group is stopped
+def _stop_process_group(sub_process):
+    pgid = sub_process.pid
+
+    if _signal_process_group(pgid, signal.SIGTERM):
+        deadline = time.monotonic() + _PROCESS_TERMINATE_TIMEOUT
+
+        while time.monotonic() < deadline:
+            # the exited leader is reaped, so that its zombie does not keep the group alive
+            sub_process.poll()
+            if not _signal_process_group(pgid, 0):
+                break
+            time.sleep(_PROCESS_GROUP_POLL_INTERVAL)
+        else:
+            _signal_process_group(pgid, signal.SIGKILL)
+
+    sub_process.wait()
+
+
+class _ProcessTerminator:
+    """
+    Stops the sub-process, when its task is cancelled. Like on a timeout, the process or its group gets SIGTERM
+    and then SIGKILL, if it is still alive after _PROCESS_TERMINATE_TIMEOUT. The escalation runs in its own thread,
+    so that the cancelling thread does not wait for it.
+    """
+
+    def __init__(self, sub_process, own_session):
+        self.__sub_process = sub_process
+        self.__own_session = own_session
+        self.__thread = None
+
+    def __call__(self):
+        if self.__sub_process.poll() is not None:
+            return
+        stop = _stop_process_group if self.__own_session else _stop_process
+        self.__thread = threading.Thread(target = stop, args = (self.__sub_process,), daemon = True)
+        self.__thread.start()
+
+    def wait(self):
+        # the children, which ignore SIGTERM, can outlive the exited sub-process
+        if self.__thread is not None:
+            self.__thread.join()
+
+
+def _report_truncated_capture(capture, stream_name):
+    if capture.truncated():
+        logger.warning(f"Collected {stream_name} was truncated to '{capture.size()}' bytes. "
+                       f"Total produced amount is '{capture.total_size()}' bytes.")
+
+
 class SSHCommandOutput:
+
+    # the maximum SSH packet size, which paramiko uses
+    __READ_SIZE = 32768
+    # how long to wait for the remaining output after the exit status has arrived
+    __DRAIN_TIMEOUT = 0.1
+
     def __init__(self, exec_mode, stdin, stdout, stderr,
                  avoid_printing_command_output,
                  avoid_printing_command_output_reason,
-                 interaction_mode):
-        self.stdout = ""
-        self.stderr = ""
+                 interaction_mode,
+                 capture_mode = None,
+                 output_listener = None):
+        self.stdout_capture = _create_output_capture(capture_mode)
+        self.stderr_capture = _create_output_capture(capture_mode)
+        self.stopped = False
+
+        self.__exec_mode = exec_mode
+        self.__avoid_printing_command_output = avoid_printing_command_output
+        self.__avoid_printing_command_output_reason = avoid_printing_command_output_reason
+        self.__output_listener = output_listener
+        self.__output_reason_logged = False
+        self.__file_prefixer = _create_line_prefixer()
+        # each chunk is decoded once and the text is shared by the logger and the output listener
+        decode_output = output_listener is not None and output_listener.wants_text()
+        self.__decode_output = {"stdout": decode_output,
+                                "stderr": decode_output or self.__prints_output()}
+        self.__decoders = {"stdout": _create_output_decoder(), "stderr": _create_output_decoder()}
+        self.__console = _create_console_sink(interaction_mode, translate_newlines = False)
 
         logger.info(f"Command output:")
 
         chan = stdin.channel
 
         # Interactive shell
-        if common.isatty(sys.stdin):
-            oldtty = termios.tcgetattr(sys.stdin)
-        try:
-            if common.isatty(sys.stdin):
-                tty.setraw(sys.stdin.fileno())
-                tty.setcbreak(sys.stdin.fileno())
+        with _raw_console_mode(_set_ssh_console_mode):
+            try:
+                self.__pump(chan, stdin, interaction_mode)
+            finally:
+                self.__console.finish()
 
-            log_to_file_cache = ""
+        self.__finish_output()
 
-            while True:
-                try:
-                    r, w, e = select.select([chan, sys.stdin], [], [])
-                except select.error as e:
-                    if e.errno != errno.EINTR:
-                        raise
-
-                if chan in r:
-                    if chan.recv_ready():
-
-                        nbytes=len(stdout.channel.in_buffer)
-
-                        if nbytes > 0:
-                            if chan.recv_ready():
-                                output = stdout.read(nbytes)
-
-                                if exec_mode == ExecutionMode.PRINT\
-                                or exec_mode == ExecutionMode.COLLECT_DATA:
-
-                                    if not avoid_printing_command_output:
-                                        sys.stdout.buffer.write(output)
-                                    else:
-                                        sys.stdout.buffer.write(avoid_printing_command_output_reason)
-                                    sys.stdout.flush()
-
-                                    decoded_output = ""
-
-                                    if logger.log_to_file() or exec_mode == ExecutionMode.COLLECT_DATA:
-                                        decoded_output = output.decode(encoding='utf-8', errors='ignore')
-
-                                    if logger.log_to_file():
-                                        if decoded_output and decoded_output != "":
-                                            if "\n" in decoded_output:
-                                                log_to_file_cache = log_to_file_cache + decoded_output
-                                                if not avoid_printing_command_output:
-                                                    logger.non_formatted_info_to_file(log_to_file_cache.rstrip("\n"))
-                                                else:
-                                                    logger.non_formatted_info_to_file(avoid_printing_command_output_reason)
-                                                log_to_file_cache = ""
-                                            else:
-                                                log_to_file_cache = log_to_file_cache + decoded_output
-
-                                    if exec_mode == ExecutionMode.COLLECT_DATA:
-                                        if decoded_output and decoded_output != "":
-                                            self.stdout=self.stdout + decoded_output
-
-                            if chan.recv_stderr_ready():
-                                error = stderr.read(nbytes)
-
-                                if exec_mode == ExecutionMode.PRINT\
-                                or exec_mode == ExecutionMode.COLLECT_DATA:
-
-                                    decoded_error = error.decode(encoding='utf-8', errors='ignore')
-
-                                    if decoded_error and decoded_error != "":
-
-                                        stripped_error = decoded_error.rstrip("\n")
-
-                                        if logger.log_to_file():
-                                            if "\n" in decoded_error:
-                                                log_to_file_cache = log_to_file_cache + stripped_error
-                                                if not avoid_printing_command_output:
-                                                    logger.non_formatted_info_to_file(log_to_file_cache)
-                                                else:
-                                                    logger.non_formatted_info_to_file(avoid_printing_command_output_reason)
-                                                log_to_file_cache = ""
-                                            else:
-                                                log_to_file_cache = log_to_file_cache + decoded_error
-
-                                        if not avoid_printing_command_output:
-                                            logger.error(stripped_error)
-                                        else:
-                                            logger.error(avoid_printing_command_output_reason)
-
-                                        if exec_mode == ExecutionMode.COLLECT_DATA:
-                                            self.stderr=self.stderr + decoded_error
-
-                    if chan.exit_status_ready():
-                        if self.stdout:
-                            self.stdout = self.stdout.rstrip("\r\n")
-                        if self.stderr:
-                            self.stderr = self.stderr.rstrip("\r\n")
-                        break
+        if not self.stopped:
+            self.stdout_capture.rstrip(b"\r\n")
+            self.stderr_capture.rstrip(b"\r\n")
 
-                if sys.stdin in r and interaction_mode == InteractionMode.PROCESS_INPUT:
-                    bytes_to_read = common.bytes_to_read(sys.stdin)
-                    x = sys.stdin.read(bytes_to_read)
-                    if len(x) == 0:
-                        break
-                    stdin.write(x)
-                    stdin.flush()
-        finally:
-            if common.isatty(sys.stdin):
-                termios.tcsetattr(sys.stdin, termios.TCSADRAIN, oldtty)
+        _report_truncated_capture(self.stdout_capture, "stdout")
+        _report_truncated_capture(self.stderr_capture, "stderr")
+
+        # the exit status never arrives on a channel, which was closed on our side
+        self.exit_code = -1 if self.stopped else chan.recv_exit_status()
+
+    def __prints_output(self):
+        return self.__exec_mode == ExecutionMode.PRINT\
+            or self.__exec_mode == ExecutionMode.COLLECT_DATA
+
+    def __pump(self, chan, stdin, interaction_mode):
+
+        # the channel becomes readable when either its stdout or its stderr buffer receives data
+        select_objects = [chan]
+
+        if interaction_mode == InteractionMode.PROCESS_INPUT and common.has_fileno(sys.stdin):
+            select_objects.append(sys.stdin)
+
+        if self.__output_listener is not None:
+            select_objects.append(self.__output_listener)
+
+        while True:
+            r, _, _ = select.select(select_objects, [], [], self.__console.flush_timeout())
+
+            self.__read_channel(chan)
+            self.__console.flush_if_due()
+
+            if self.__output_listener is not None and self.__output_listener.stop_requested():
+                self.__console.flush()
+                logger.info("Closing the SSH channel on the output listener's request.")
+                chan.close()
+                self.stopped = True
+                return
+
+            if chan.exit_status_ready():
+                self.__drain_channel(chan)
+                return
+
+            if sys.stdin in r:
+                bytes_to_read = common.bytes_to_read(sys.stdin)
+                x = sys.stdin.read(bytes_to_read)
+                if len(x) == 0:
+                    select_objects.remove(sys.stdin)
+                    continue
+                stdin.write(x)
+                stdin.flush()
+
+    # reads stdout and stderr in turns, so that none of them is starved by the other one
+    def __read_channel(self, chan):
+
+        while self.__output_listener is None or not self.__output_listener.stop_requested():
+            has_output = False
+
+            if chan.recv_ready():
+                self.__process_output(chan.recv(SSHCommandOutput.__READ_SIZE), "stdout")
+                has_output = True
+
+            if chan.recv_stderr_ready():
+                self.__process_output(chan.recv_stderr(SSHCommandOutput.__READ_SIZE), "stderr")
+                has_output = True
+
+            if not has_output:
+                return
+
+    def __drain_channel(self, chan):
+
+        # the remote side may send the exit status before the end of its output
+        while not chan.eof_received and not chan.closed:
+            r, _, _ = select.select([chan], [], [], SSHCommandOutput.__DRAIN_TIMEOUT)
+
+            if not r:
+                break
+
+            self.__read_channel(chan)
+
+        self.__read_channel(chan)
+
+    def __process_output(self, output, stream_name):
+
+        if not output:
+            return
+
+        decoded_output = None
+
+        if self.__decode_output[stream_name]:
+            decoded_output = self.__decoders[stream_name].decode(output)
+
+        if self.__prints_output():
+
+            if stream_name == "stdout":
+                if not self.__avoid_printing_command_output:
+                    self.__console.write(sys.stdout, output)
+                else:
+                    self.__console.write(sys.stdout, bytes(self.__avoid_printing_command_output_reason, encoding='utf-8') + b'\r\n')
+            elif decoded_output:
+                # the logger writes to the console directly
+                self.__console.flush()
+                if not self.__avoid_printing_command_output:
+                    logger.error(decoded_output.rstrip("\n"))
+                else:
+                    logger.error(self.__avoid_printing_command_output_reason)
 
-        self.exit_code = stdout.channel.recv_exit_status()
+            if logger.log_to_file():
+                self.__log_output_to_file(output)
+
+            if self.__exec_mode == ExecutionMode.COLLECT_DATA:
+                capture = self.stdout_capture if stream_name == "stdout" else self.stderr_capture
+                capture.append(output)
+
+        if self.__output_listener is not None:
+            self.__output_listener.feed(output, stream_name, decoded_output)
+
+    def __finish_output(self):
+
+        if self.__file_prefixer is not None:
+            logger.output_to_file(self.__file_prefixer.finish())
+        logger.flush_output_to_file()
+
+        if self.__output_listener is not None:
+            self.__output_listener.finish()
+
+    def __log_output_to_file(self, output):
+        if not self.__avoid_printing_command_output:
+            if self.__file_prefixer is not None:
+                output = self.__file_prefixer.feed(output)
+            logger.output_to_file(output)
+        elif not self.__output_reason_logged:
+            logger.non_formatted_info_to_file(self.__avoid_printing_command_output_reason)
+            self.__output_reason_logged = True
+
+    @property
+    def stdout(self):
+        return self.stdout_capture.as_str()
+
+    @property
+    def stderr(self):
+        return self.stderr_capture.as_str()
+
+def _chain_connection_key(connection_key, jumphost):
+    # the same host:port behind the different jump hosts might be the different machines
+    return f"{connection_key} via {jumphost.get_connection_key()}" if jumphost else connection_key
+
+class SSHHop:
+    """One host of a jump chain."""
+
+    def __init__(self, host, user, port = 22, password = "", key_filename = [], passphrase = None):
+        self.host = host
+        self.user = user
+        self.port = port
+        self.password = password
+        self.key_filename = key_filename
+        self.passphrase = passphrase
+
+    @staticmethod
+    def parse(hop):
+        """Accepts an SSHHop or a 'user@host[:port]' string. The latter is authenticated by the default SSH keys."""
+        if isinstance(hop, SSHHop):
+            return hop
+
+        match = re.match(r"^([^@]+)@([^:@]+)(?::(\d+))?$", hop)
+        if not match:
+            raise Exception(f"Jump host '{hop}' should be declared as user@host[:port]")
+        return SSHHop(match.group(2), match.group(1), int(match.group(3) or 22))
 
 class SSHConnection:
     def __init__(self, host, user, port = 22, password = "", key_filename = [], jumphost = None, passphrase = None):
@@ -333,8 +1572,11 @@ class SSHConnection:
         self.__password = password
         self.__key_filename = key_filename
         self.__port = port
-        self.__connection_key = SSHConnection.create_connection_key(host, user, port)
+        self.__connection_key = _chain_connection_key(SSHConnection.create_connection_key(host, user, port), jumphost)
         self.__passphrase = passphrase
+        self.__jumphost = jumphost
+        self.__reconnect_lock = threading.Lock()
+        self.__connected = False
         self.connect(jumphost)
 
     def connect(self, jumphost = None):
@@ -344,10 +1586,7 @@ class SSHConnection:
 
         if jumphost:
 
-            jumphost_transport = jumphost.__client.get_transport()
-            src_addr = (jumphost.__host, jumphost.__port)
-            dest_addr = (self.__host, self.__port)
-            jumphost_channel = jumphost_transport.open_channel("direct-tcpip", dest_addr, src_addr)
+            jumphost_channel = jumphost.open_channel(self.__host, self.__port)
 
             self.__client.connect(hostname=self.__host,
                 username=self.__user,
@@ -364,15 +1603,73 @@ class SSHConnection:
                 port=self.__port,
                 passphrase = self.__passphrase)
 
+        keepalive_interval = Config.get_ssh_keepalive_interval()
+        if keepalive_interval:
+            # the keepalives detect the dead peer, e.g. the rebooted target, while the connection is not used
+            self.__client.get_transport().set_keepalive(keepalive_interval)
+
         self.__connected = True
 
         logger.info(f"connection to the {self.__connection_key} was successfully created.")
 
     def disconnect(self):
+        self.__connected = False
         self.__client.close()
 
         logger.info(f"connection to the {self.__connection_key} was closed.")
 
+    def is_alive(self):
+        transport = self.__client.get_transport()
+        return self.__connected and transport is not None and transport.is_active()
+
+    def ensure_connected(self):
+        """Reconnects, if the transport of the connection, which was not closed, is dead."""
+        if self.__connected and not self.is_alive():
+            logger.warning(f"connection to the {self.__connection_key} is broken.")
+            self.reconnect()
+
+    def reconnect(self):
+        """Opens the connection again. The attempts are repeated with the growing delay."""
+        with self.__reconnect_lock:
+            # another thread might have already restored the connection
+            if self.is_alive():
+                return
+
+            attempts = Config.get_ssh_reconnect_attempts()
+            delay = 1
+
+            for attempt in range(1, attempts + 1):
+                _check_not_cancelled()
+                self.__client.close()
+
+                try:
+                    self.connect(self.__jumphost)
+                    return
+                except paramiko.AuthenticationException:
+                    self.__client.close()
+                    raise
+                except (paramiko.SSHException, EOFError, OSError) as e:
+                    # the transport of the failed attempt might be still active
+                    self.__client.close()
+
+                    if attempt == attempts:
+                        raise Exception(f"Reconnection to the {self.__connection_key} has failed after "
+                                        f"{attempts} attempts: {e}") from e
+
+                    logger.warning(f"Reconnection to the {self.__connection_key} has failed: {e}. "
+                                   f"Next attempt in {delay}s.")
+                    time.sleep(delay)
+                    delay = min(delay * 2, Config.get_ssh_reconnect_max_delay())
+
+    def open_sftp(self):
+        self.ensure_connected()
+        return self.__client.open_sftp()
+
+    def open_channel(self, host, port):
+        """Channel to the host:port, which is forwarded by this connection. Used to connect to the hosts behind it."""
+        self.ensure_connected()
+        return self.__client.get_transport().open_channel("direct-tcpip", (host, port), (self.__host, self.__port))
+
     def exec_command(self,
                      cmd,
                      timeout = 0,
@@ -383,7 +1680,11 @@ class SSHConnection:
                      avoid_printing_command_reason = "The command contains a sensitive information",
                      avoid_printing_command_output = False,
                      avoid_printing_command_output_reason = "The command output contains a sensitive information",
-                     interaction_mode = None):
+                     interaction_mode = None,
+                     capture_mode = None,
+                     output_listener = None):
+
+        _check_not_cancelled()
 
         if exec_mode == None:
             exec_mode = Config.get_default_execution_mode()
@@ -419,16 +1720,32 @@ class SSHConnection:
             else:
                 logger.info(f"{avoid_printing_command_reason}")
 
+        self.ensure_connected()
+
         if True == self.__connected:
             terminal_width, terminal_height = common.get_terminal_dimensions()
-            stdin, stdout, stderr = common.exec_command(self.__client, result_cmd, timeout,
-                                                        terminal_width = terminal_width, terminal_height = terminal_height)
 
-            result = SSHCommandOutput(exec_mode, stdin, stdout, stderr,
-                                      avoid_printing_command_output, avoid_printing_command_output_reason,
-                                      interaction_mode)
-
-            if result.exit_code == 0:
+            try:
+                stdin, stdout, stderr = common.exec_command(self.__client, result_cmd, timeout,
+                                                            terminal_width = terminal_width, terminal_height = terminal_height)
+            except (paramiko.SSHException, EOFError, OSError) as e:
+                # the command was not started yet, so it is safe to execute it again over the restored connection
+                logger.warning(f"Failed to open a session on the {self.__connection_key} connection: {e}")
+                self.reconnect()
+                stdin, stdout, stderr = common.exec_command(self.__client, result_cmd, timeout,
+                                                            terminal_width = terminal_width, terminal_height = terminal_height)
+
+            with _stop_on_cancel(lambda: stdin.channel.close()):
+                result = SSHCommandOutput(exec_mode, stdin, stdout, stderr,
+                                          avoid_printing_command_output, avoid_printing_command_output_reason,
+                                          interaction_mode, _resolve_capture_mode(capture_mode), output_listener)
+
+            if _is_cancelled():
+                result.stopped = True
+
+            if result.stopped:
+                logger.info(f"Command was stopped on request.")
+            elif result.exit_code == 0:
                 logger.info(f"Command was successfully executed. Returned result code is '{result.exit_code}'")
             else:
                 logger.error(f"Command has failed with the result code '{result.exit_code}'")
@@ -446,11 +1763,179 @@ class SSHConnection:
     def get_connection_key(self):
         return self.__connection_key
 
+class SSHPoolUtilization:
+    def __init__(self, connection_key, connections, max_connections, max_sessions, active_sessions, peak_sessions,
+                 commands, waits, wait_time):
+        self.connection_key = connection_key
+        self.connections = connections
+        self.max_connections = max_connections
+        # per connection
+        self.max_sessions = max_sessions
+        self.active_sessions = active_sessions
+        self.peak_sessions = peak_sessions
+        self.commands = commands
+        # number of the commands, which have waited for a free session, and their total waiting time
+        self.waits = waits
+        self.wait_time = wait_time
+
+    def __str__(self):
+        return (f"SSH pool {self.connection_key}: {self.connections} of {self.max_connections} connections, "
+                f"peak {self.peak_sessions} of {self.connections * self.max_sessions} sessions, "
+                f"{self.commands} commands, {self.waits} waited for {self.wait_time:.1f}s")
+
+class _PooledConnection:
+    def __init__(self, connection):
+        self.connection = connection
+        self.active_sessions = 0
+
+class SSHConnectionPool:
+    """
+    Connections to the same user@host:port. Each command gets a session on the least loaded connection.
+    A new connection is opened only once all connections have reached the session limit. Once the limit of
+    the connections is reached as well, the commands wait for a free session.
+    """
+
+    def __init__(self, connection_key, create_connection, max_connections, max_sessions):
+        if max_connections < 1 or max_sessions < 1:
+            raise Exception(f"Limits of the SSH pool should be positive, got {max_connections} connections "
+                            f"and {max_sessions} sessions")
+
+        self.__connection_key = connection_key
+        self.__create_connection = create_connection
+        self.__max_connections = max_connections
+        self.__max_sessions = max_sessions
+        self.__condition = threading.Condition()
+        self.__connections: List[_PooledConnection] = []
+        self.__opening = 0
+        self.__peak_sessions = 0
+        self.__commands = 0
+        self.__waits = 0
+        self.__wait_time = 0.0
+
+    def get_connection_key(self):
+        return self.__connection_key
+
+    def __active_sessions(self):
+        return sum(pooled.active_sessions for pooled in self.__connections)
+
+    def __start_session(self, pooled):
+        pooled.active_sessions += 1
+        self.__peak_sessions = max(self.__peak_sessions, self.__active_sessions())
+        return pooled
+
+    # shared - any connection is used regardless of its sessions. Only the first connection is opened
+    def __acquire(self, shared = False):
+        started = None
+
+        with self.__condition:
+            while True:
+                _check_not_cancelled()
+
+                available = [pooled for pooled in self.__connections
+                             if shared or pooled.active_sessions < self.__max_sessions]
+                if available:
+                    pooled = self.__start_session(min(available, key = lambda pooled: pooled.active_sessions))
+                    break
+
+                # the shared users wait for the connection, which is being opened, instead of opening another one
+                if not (shared and self.__opening) and \
+                        len(self.__connections) + self.__opening < self.__max_connections:
+                    pooled = None
+                    self.__opening += 1
+                    break
+
+                if started is None and not shared:
+                    started = time.monotonic()
+                    self.__waits += 1
+                    logger.info(f"Waiting for a free session of the {self.__connection_key} connections")
+                self.__condition.wait(0.1)
+
+            if started is not None:
+                self.__wait_time += time.monotonic() - started
+
+        if pooled:
+            return pooled
+
+        # the connection is opened outside of the lock, so that the other commands can use the opened ones
+        try:
+            connection = self.__create_connection()
+        except BaseException:
+            with self.__condition:
+                self.__opening -= 1
+                self.__condition.notify_all()
+            raise
+
+        with self.__condition:
+            self.__opening -= 1
+            pooled = _PooledConnection(connection)
+            self.__connections.append(pooled)
+            self.__start_session(pooled)
+            self.__condition.notify_all()
+
+        return pooled
+
+    def __release(self, pooled):
+        with self.__condition:
+            pooled.active_sessions -= 1
+            self.__condition.notify_all()
+
+    @contextlib.contextmanager
+    def session(self):
+        """Reserves a session on one of the connections for the duration of the block."""
+        pooled = self.__acquire()
+        try:
+            yield pooled.connection
+        finally:
+            self.__release(pooled)
+
+    @contextlib.contextmanager
+    def sftp_session(self):
+        """SFTP session on one of the connections, which takes one of its sessions for the duration of the block."""
+        with self.session() as connection:
+            sftp = connection.open_sftp()
+            try:
+                yield sftp
+            finally:
+                sftp.close()
+
+    def get_connection(self):
+        """
+        The least loaded connection, e.g. to forward the connections to the hosts behind it.
+        The first connection is opened, if there is none yet.
+        """
+        pooled = self.__acquire(shared = True)
+        try:
+            pooled.connection.ensure_connected()
+            return pooled.connection
+        finally:
+            self.__release(pooled)
+
+    def exec_command(self, cmd, *args, **kwargs):
+        with self.__condition:
+            self.__commands += 1
+
+        with self.session() as connection:
+            return connection.exec_command(cmd, *args, **kwargs)
+
+    def get_utilization(self):
+        with self.__condition:
+            return SSHPoolUtilization(self.__connection_key, len(self.__connections), self.__max_connections,
+                                      self.__max_sessions, self.__active_sessions(), self.__peak_sessions,
+                                      self.__commands, self.__waits, self.__wait_time)
+
+    def disconnect(self):
+        with self.__condition:
+            connections = [pooled.connection for pooled in self.__connections]
+            self.__connections = []
+
+        for connection in connections:
+            connection.disconnect()
+
 class SSHConnectionCache():
 
     __instance = None
 
-    def find_or_create_connection(self,
+    def find_or_create_pool(self,
         host,
         user,
         port = 22,
@@ -458,26 +1943,69 @@ class SSHConnectionCache():
         key_filename = [],
         jumphost = None,
         passphrase = None):
-        connection_key = SSHConnection.create_connection_key(host,user,port)
-        connection = self.__SSHConnections.get(connection_key)
+        # the hops are resolved before the lock, as they are cached by this method as well
+        jumphost = self.__resolve_jumphost(jumphost)
+        connection_key = _chain_connection_key(SSHConnection.create_connection_key(host,user,port), jumphost)
 
-        if not connection:
-            logger.info(f"Creating new connection to the {connection_key}")
+        with self.__lock:
+            pool = self.__SSHConnectionPools.get(connection_key)
 
-            if key_filename:
-                logger.info(f"Used SSH keys are: " + str(key_filename))
+            if not pool:
+                def create_connection():
+                    logger.info(f"Creating new connection to the {connection_key}")
 
-            if jumphost:
-                logger.info("Used jumphost is: " + str(jumphost))
+                    if key_filename:
+                        logger.info(f"Used SSH keys are: " + str(key_filename))
 
-            connection = SSHConnection(host, user, port, password=password,
-                key_filename=key_filename, jumphost=jumphost, passphrase=passphrase)
-            self.__SSHConnections[connection_key] = connection
-        else:
-            logger.info(f"Using cached connection to the {connection.get_connection_key()}")
+                    if jumphost:
+                        logger.info("Used jumphost is: " + jumphost.get_connection_key())
 
-        return connection
+                    return SSHConnection(host, user, port, password=password,
+                        key_filename=key_filename, jumphost=jumphost, passphrase=passphrase)
 
+                pool = SSHConnectionPool(connection_key, create_connection,
+                                         Config.get_ssh_max_connections_per_host(),
+                                         Config.get_ssh_max_sessions_per_connection())
+                self.__SSHConnectionPools[connection_key] = pool
+            else:
+                logger.info(f"Using cached connection to the {pool.get_connection_key()}")
+
+        return pool
+
+    def find_or_create_connection(self,
+        host,
+        user,
+        port = 22,
+        password = "",
+        key_filename = [],
+        jumphost = None,
+        passphrase = None):
+        return self.find_or_create_pool(host, user, port, password, key_filename, jumphost, passphrase).get_connection()
+
+    def find_or_create_jump_chain(self, hops):
+        """
+        Connection to the last of the hops, each of which is connected through the previous one. Each hop is cached,
+        so the chains with the same beginning share its connections. None, if there are no hops.
+        """
+        jumphost = None
+        for hop in hops:
+            hop = SSHHop.parse(hop)
+            jumphost = self.find_or_create_connection(hop.host, hop.user, hop.port, hop.password, hop.key_filename,
+                                                      jumphost, hop.passphrase)
+        return jumphost
+
+    # jumphost - an SSHConnection, a hop or a list of the hops. See SSHHop.parse
+    def __resolve_jumphost(self, jumphost):
+        if isinstance(jumphost, (str, SSHHop)):
+            return self.find_or_create_jump_chain([jumphost])
+        if isinstance(jumphost, (list, tuple)):
+            return self.find_or_create_jump_chain(jumphost)
+        return jumphost
+
+    def get_pool_utilization(self):
+        with self.__lock:
+            pools = list(self.__SSHConnectionPools.values())
+        return [pool.get_utilization() for pool in pools]
 
     @staticmethod
     def getInstance():
@@ -486,7 +2014,8 @@ class SSHConnectionCache():
         return SSHConnectionCache.__instance
 
     def __init__(self):
-            self.__SSHConnections = {}
+            self.__lock = threading.Lock()
+            self.__SSHConnectionPools = {}
 
     def exec_command(self,
                      cmd,
@@ -505,16 +2034,18 @@ class SSHConnectionCache():
                      avoid_printing_command_reason = "The command contains a sensitive information",
                      avoid_printing_command_output = False,
                      avoid_printing_command_output_reason = "The command output contains a sensitive information",
-                     interaction_mode = None):
+                     interaction_mode = None,
+                     capture_mode = None,
+                     output_listener = None):
         if exec_mode == None:
             exec_mode = Config.get_default_execution_mode()
 
         if interaction_mode == None:
             interaction_mode = Config.get_default_interaction_mode()
 
-        connection = self.find_or_create_connection(host, user, port, password, key_filename, jumphost, passphrase)
+        pool = self.find_or_create_pool(host, user, port, password, key_filename, jumphost, passphrase)
 
-        return connection.exec_command(cmd,
+        return pool.exec_command(cmd,
                                        timeout,
                                        substitute_params = substitute_params,
                                        exec_mode = exec_mode,
@@ -523,7 +2054,9 @@ class SSHConnectionCache():
                                        avoid_printing_command_reason = avoid_printing_command_reason,
                                        avoid_printing_command_output = avoid_printing_command_output,
                                        avoid_printing_command_output_reason = avoid_printing_command_output_reason,
-                                       interaction_mode = interaction_mode)
+                                       interaction_mode = interaction_mode,
+                                       capture_mode = capture_mode,
+                                       output_listener = output_listener)
 
 def set_tty_mode(fd, when=termios.TCSAFLUSH):
     """Put terminal into a raw mode."""
@@ -537,218 +2070,307 @@ def set_tty_mode(fd, when=termios.TCSAFLUSH):
     mode[tty.CC][termios.VTIME] = 0
     termios.tcsetattr(fd, when, mode)
 
-class SubprocessCommandOutput:
-    def __init__(self, exec_mode, sub_process, timeout, communication_mode, master_fd,
-                 avoid_printing_command_output, avoid_printing_command_output_reason,
-                 interaction_mode):
+class _RawConsoleMode:
+    """
+    Keeps the console in the raw mode while at least one command is running.
+    The original mode is saved by the first command and restored by the last one,
+    so that the commands of the tasks executed in parallel do not restore each other's raw mode.
+    """
+    lock = threading.Lock()
+    users = 0
+    saved_mode: Optional[List[Any]] = None
+
+
+@contextlib.contextmanager
+def _raw_console_mode(set_raw_mode):
+    if not common.isatty(sys.stdin):
+        yield
+        return
+
+    with _RawConsoleMode.lock:
+        if _RawConsoleMode.users == 0:
+            _RawConsoleMode.saved_mode = termios.tcgetattr(sys.stdin)
+            set_raw_mode(sys.stdin.fileno())
+        _RawConsoleMode.users += 1
+
+    try:
+        yield
+    finally:
+        with _RawConsoleMode.lock:
+            _RawConsoleMode.users -= 1
+            if _RawConsoleMode.users == 0:
+                termios.tcsetattr(sys.stdin, termios.TCSADRAIN, cast(List[Any], _RawConsoleMode.saved_mode))
+
+
+def _set_ssh_console_mode(fd):
+    tty.setraw(fd)
+    tty.setcbreak(fd)
+
+
+def _open_process_fd(pid):
+    # pidfd becomes readable as soon as the process exits, so the output pump does not need to poll
+    try:
+        return os.pidfd_open(pid)
+    except (AttributeError, OSError):
+        return None
 
-        self.stdout = ""
-        self.stderr = ""
-        self.exit_code = 0
+class SubprocessCommandOutput:
 
-        exit_code = None
+    # used only if the kernel does not support pidfd
+    __PROCESS_POLL_INTERVAL = 0.05
+    # how long to wait for the remaining output after the process has exited
+    __DRAIN_TIMEOUT = 0.1
+    __READ_SIZE = 10240
 
-        if common.isatty(sys.stdin):
-            oldtty = termios.tcgetattr(sys.stdin)
+    __STDIN = "stdin"
+    __PROCESS_EXIT = "process_exit"
+    __STOP_REQUEST = "stop_request"
 
-        try:
+    def __init__(self, exec_mode, sub_process, timeout, communication_mode, master_fd,
+                 avoid_printing_command_output, avoid_printing_command_output_reason,
+                 interaction_mode, capture_mode = None, output_listener = None, idle_timeout = 0):
 
-            if common.isatty(sys.stdin):
-                set_tty_mode(sys.stdin.fileno())
+        self.stdout_capture = _create_output_capture(capture_mode)
+        self.stderr_capture = _create_output_capture(capture_mode)
+        self.exit_code = 0
+        self.stopped = False
+        self.timed_out = False
+        self.timeout_kind: Optional[TimeoutKind] = None
+
+        self.__exec_mode = exec_mode
+        self.__avoid_printing_command_output = avoid_printing_command_output
+        self.__avoid_printing_command_output_reason = avoid_printing_command_output_reason
+        self.__output_reason_logged = False
+        self.__file_prefixer = _create_line_prefixer()
+        self.__output_listener = output_listener
+        # the output listener decodes only the chunks, which were not decoded here
+        self.__decode_output = output_listener is not None and output_listener.wants_text()
+        self.__decoders = {"stdout": _create_output_decoder(), "stderr": _create_output_decoder()}
+        # 0 means no limit
+        self.__timeout = timeout
+        self.__idle_timeout = idle_timeout
+        self.__last_output_time = time.monotonic()
+        self.__console = _create_console_sink(interaction_mode)
+
+        with _raw_console_mode(set_tty_mode):
+            exit_code = self.__pump(sub_process, communication_mode, master_fd, interaction_mode)
+
+        _report_truncated_capture(self.stdout_capture, "stdout")
+        _report_truncated_capture(self.stderr_capture, "stderr")
 
-            if communication_mode == CommunicationMode.USE_PTY:
+        self.exit_code = exit_code if exit_code is not None else -1
 
-                log_to_file_cache = ""
+    @property
+    def stdout(self):
+        return self.stdout_capture.as_str()
 
-                while True:
+    @property
+    def stderr(self):
+        return self.stderr_capture.as_str()
 
-                    select_fds = [master_fd]
-                    stdin_fd = None
-                    if interaction_mode == InteractionMode.PROCESS_INPUT and common.has_fileno(sys.stdin):
-                        stdin_fd = sys.stdin.fileno()
-                        select_fds.append(stdin_fd)
+    def __pump(self, sub_process, communication_mode, master_fd, interaction_mode):
 
-                    try:
+        selector = selectors.DefaultSelector()
+        process_fd = _open_process_fd(sub_process.pid)
 
-                        r, _, e = select.select(select_fds, [], [], 0.05)
-                    except select.error as e:
+        try:
+            if communication_mode == CommunicationMode.USE_PTY:
+                selector.register(master_fd, selectors.EVENT_READ, (sys.stdout, self.stdout_capture, "stdout"))
 
-                        if e.errno != errno.EINTR:
-                            raise
+                def write_input(data):
+                    os.write(master_fd, data)
+            else:
+                selector.register(sub_process.stdout.fileno(), selectors.EVENT_READ,
+                                  (sys.stdout, self.stdout_capture, "stdout"))
+                selector.register(sub_process.stderr.fileno(), selectors.EVENT_READ,
+                                  (sys.stderr, self.stderr_capture, "stderr"))
 
-                    if master_fd in r:
+                def write_input(data):
+                    sub_process.stdin.write(data)
+                    sub_process.stdin.flush()
 
-                        output = os.read(master_fd, 10240)
+            if interaction_mode == InteractionMode.PROCESS_INPUT and common.has_fileno(sys.stdin):
+                try:
+                    selector.register(sys.stdin.fileno(), selectors.EVENT_READ, SubprocessCommandOutput.__STDIN)
+                except PermissionError:
+                    # epoll can not poll the regular files and /dev/null, e.g. the stdin of CI jobs and cron.
+                    # There is no interactive input to forward then
+                    pass
 
-                        if exec_mode == ExecutionMode.PRINT\
-                        or exec_mode == ExecutionMode.COLLECT_DATA:
+            if self.__output_listener is not None:
+                selector.register(self.__output_listener.fileno(), selectors.EVENT_READ,
+                                  SubprocessCommandOutput.__STOP_REQUEST)
 
-                            if not avoid_printing_command_output:
-                                output_for_console = output.replace(b'\n',b'\r\n')
-                                sys.stdout.buffer.write(output_for_console)
-                            else:
-                                sys.stdout.buffer.write(bytes(avoid_printing_command_output_reason, encoding='utf-8') + b'\r\n')
+            poll_interval = None
 
-                            sys.stdout.flush()
+            if process_fd is not None:
+                selector.register(process_fd, selectors.EVENT_READ, SubprocessCommandOutput.__PROCESS_EXIT)
+            else:
+                poll_interval = SubprocessCommandOutput.__PROCESS_POLL_INTERVAL
 
-                            decoded_output = ""
+            deadline = time.monotonic() + self.__timeout if self.__timeout else None
 
-                            if logger.log_to_file() or exec_mode == ExecutionMode.COLLECT_DATA:
-                                decoded_output = output.decode(encoding='utf-8', errors='ignore')
+            exit_code = sub_process.poll()
 
-                            if logger.log_to_file():
-                                if decoded_output and decoded_output != "":
-                                    if "\n" in decoded_output:
-                                        log_to_file_cache = log_to_file_cache + decoded_output
-                                        if not avoid_printing_command_output:
-                                            logger.non_formatted_info_to_file(log_to_file_cache.rstrip("\n"))
-                                        else:
-                                            logger.non_formatted_info_to_file(avoid_printing_command_output_reason)
-                                        log_to_file_cache = ""
-                                    else:
-                                        log_to_file_cache = log_to_file_cache + decoded_output
+            while exit_code is None:
 
-                            if exec_mode == ExecutionMode.COLLECT_DATA:
-                                if decoded_output and decoded_output != "":
-                                    self.stdout=self.stdout + decoded_output
+                for key, _ in selector.select(self.__select_timeout(poll_interval, deadline)):
 
-                    if stdin_fd in r:
+                    if key.data == SubprocessCommandOutput.__STDIN:
 
-                        x = os.read(sys.stdin.fileno(), 10240)
+                        x = os.read(key.fd, SubprocessCommandOutput.__READ_SIZE)
                         #logger.info("input x - " + str(x) + ";\r")
                         if len(x) == 0:
-                            break
+                            selector.unregister(key.fd)
+                            continue
 
                         if x == b'\x03':
-                            os.write(master_fd, x)
+                            write_input(x)
                             sub_process.wait(1.0)
                             raise KeyboardInterrupt()
 
-                        os.write(master_fd, x)
+                        write_input(x)
+                    elif isinstance(key.data, tuple):
+                        self.__read_output(selector, key)
 
-                    exit_code = sub_process.poll()
+                self.__console.flush_if_due()
 
-                    if exit_code is not None:
-                        break
+                if self.__output_listener is not None and self.__output_listener.stop_requested():
+                    self.__console.flush()
+                    logger.info("Stopping the sub-process on the output listener's request.")
+                    _stop_process(sub_process)
+                    self.stopped = True
 
-            elif communication_mode == CommunicationMode.PIPE_OUTPUT:
+                timeout_kind = self.__expired_timeout(deadline)
+                if timeout_kind is not None and sub_process.poll() is None:
+                    self.__console.flush()
+                    logger.error(f"The sub-process has exceeded its {timeout_kind.name.lower()} timeout. "
+                                 f"Killing its process group.")
+                    _stop_process_group(sub_process)
+                    self.timed_out = True
+                    self.timeout_kind = timeout_kind
 
-                log_to_file_cache = ""
+                exit_code = sub_process.poll()
 
-                while True:
+            self.__drain(selector)
+            self.__finish_output()
 
-                    stdout_fd = sub_process.stdout.fileno()
-                    stderr_fd = sub_process.stderr.fileno()
-                    select_fds = [stdout_fd, stderr_fd]
-                    stdin_fd = None
-                    if interaction_mode == InteractionMode.PROCESS_INPUT and common.has_fileno(sys.stdin):
-                        stdin_fd = sys.stdin.fileno()
-                        select_fds.append(stdin_fd)
+            return exit_code
+        finally:
+            self.__console.finish()
+            selector.close()
+            if process_fd is not None:
+                os.close(process_fd)
 
-                    try:
-                        r, _, _ = select.select(select_fds, [], [])
-                    except select.error as e:
-                        if e.errno != errno.EINTR:
-                            raise
+    def __select_timeout(self, poll_interval, deadline):
+        timeouts = [] if poll_interval is None else [poll_interval]
 
-                    if stdout_fd in r:
+        flush_timeout = self.__console.flush_timeout()
+        if flush_timeout is not None:
+            timeouts.append(flush_timeout)
 
-                        output = sub_process.stdout.read1()
+        if deadline is not None:
+            timeouts.append(deadline - time.monotonic())
 
-                        if exec_mode == ExecutionMode.PRINT\
-                        or exec_mode == ExecutionMode.COLLECT_DATA:
+        if self.__idle_timeout:
+            timeouts.append(self.__last_output_time + self.__idle_timeout - time.monotonic())
 
-                            if not avoid_printing_command_output:
-                                output_for_console = output.replace(b'\n',b'\r\n')
-                                sys.stdout.buffer.write(output_for_console)
-                            else:
-                                sys.stdout.buffer.write(bytes(avoid_printing_command_output_reason, encoding='utf-8') + b'\r\n')
+        return max(min(timeouts), 0) if timeouts else None
 
-                            sys.stdout.flush()
+    def __expired_timeout(self, deadline):
+        now = time.monotonic()
 
-                            decoded_output = ""
+        if deadline is not None and now >= deadline:
+            return TimeoutKind.OVERALL
 
-                            if logger.log_to_file() or exec_mode == ExecutionMode.COLLECT_DATA:
-                                decoded_output = output.decode(encoding='utf-8', errors='ignore')
+        if self.__idle_timeout and now >= self.__last_output_time + self.__idle_timeout:
+            return TimeoutKind.IDLE
 
-                            if logger.log_to_file():
-                                if decoded_output and decoded_output != "":
-                                    if "\n" in decoded_output:
-                                        log_to_file_cache = log_to_file_cache + decoded_output
+        return None
 
-                                        if not avoid_printing_command_output:
-                                            logger.non_formatted_info_to_file(log_to_file_cache.rstrip("\n"))
-                                        else:
-                                            logger.non_formatted_info_to_file(avoid_printing_command_output_reason)
+    def __drain(self, selector):
 
-                                        log_to_file_cache = ""
-                                    else:
-                                        log_to_file_cache = log_to_file_cache + decoded_output
+        for key in list(selector.get_map().values()):
+            if not isinstance(key.data, tuple):
+                selector.unregister(key.fd)
 
-                            if exec_mode == ExecutionMode.COLLECT_DATA:
-                                if decoded_output and decoded_output != "":
-                                    self.stdout=self.stdout + decoded_output
+        # the streams are closed once all writers have exited, so normally this loop ends without waiting.
+        # The timeout covers the background processes, which keep the streams open.
+        while selector.get_map():
+            events = selector.select(SubprocessCommandOutput.__DRAIN_TIMEOUT)
 
-                    if stderr_fd in r:
+            if not events:
+                break
 
-                        error = sub_process.stderr.read1()
+            for key, _ in events:
+                self.__read_output(selector, key)
 
-                        if exec_mode == ExecutionMode.PRINT\
-                        or exec_mode == ExecutionMode.COLLECT_DATA:
+            self.__console.flush_if_due()
 
-                            if not avoid_printing_command_output:
-                                error_for_console = error.replace(b'\n',b'\r\n')
-                                sys.stderr.buffer.write(error_for_console)
-                            else:
-                                sys.stderr.buffer.write(bytes(avoid_printing_command_output_reason, encoding='utf-8') + b'\r\n')
+    def __read_output(self, selector, key):
 
-                            sys.stderr.flush()
+        try:
+            output = os.read(key.fd, SubprocessCommandOutput.__READ_SIZE)
+        except OSError as e:
+            # reading from the PTY master fails with EIO once the slave side is closed
+            if e.errno != errno.EIO:
+                raise
+            output = b""
 
-                            decoded_error = ""
+        if not output:
+            selector.unregister(key.fd)
+            return
 
-                            if logger.log_to_file() or exec_mode == ExecutionMode.COLLECT_DATA:
-                                decoded_error = error.decode(encoding='utf-8', errors='ignore')
+        self.__last_output_time = time.monotonic()
 
-                            if logger.log_to_file():
-                                if decoded_error and decoded_error != "":
-                                    if "\n" in decoded_error:
-                                        log_to_file_cache = log_to_file_cache + decoded_error
-                                        if not avoid_printing_command_output:
-                                            logger.non_formatted_info_to_file(log_to_file_cache.rstrip("\n"))
-                                        else:
-                                            logger.non_formatted_info_to_file(avoid_printing_command_output)
-                                        log_to_file_cache = ""
-                                    else:
-                                        log_to_file_cache = log_to_file_cache + decoded_error
+        console_stream, capture, stream_name = key.data
+        self.__process_output(output, console_stream, capture, stream_name)
 
-                            if exec_mode == ExecutionMode.COLLECT_DATA:
-                                if decoded_error and decoded_error != "":
-                                    self.stderr=self.stderr + decoded_error
+    def __process_output(self, output, console_stream, capture, stream_name):
 
-                    if stdin_fd in r:
-                        x = os.read(sys.stdin.fileno(), 10240)
-                        #logger.info("input x - " + str(x) + ";\r")
-                        if len(x) == 0:
-                            break
+        decoded_output = None
 
-                        if x == b'\x03':
-                            sub_process.stdin.write(x)
-                            sub_process.stdin.flush()
-                            sub_process.wait(1.0)
-                            raise KeyboardInterrupt()
+        if self.__decode_output:
+            decoded_output = self.__decoders[stream_name].decode(output)
 
-                        sub_process.stdin.write(x)
-                        sub_process.stdin.flush()
+        if self.__exec_mode == ExecutionMode.PRINT\
+        or self.__exec_mode == ExecutionMode.COLLECT_DATA:
 
-                    exit_code = sub_process.poll()
+            if not self.__avoid_printing_command_output:
+                self.__console.write(console_stream, output)
+            else:
+                self.__console.write(console_stream, bytes(self.__avoid_printing_command_output_reason, encoding='utf-8') + b'\n')
 
-                    if exit_code is not None:
-                        break
-        finally:
-            if common.isatty(sys.stdin):
-                termios.tcsetattr(sys.stdin, termios.TCSADRAIN, oldtty)
+            if logger.log_to_file():
+                self.__log_output_to_file(output)
 
-        self.exit_code = exit_code if exit_code is not None else -1
+            if self.__exec_mode == ExecutionMode.COLLECT_DATA:
+                capture.append(output)
+
+        if self.__output_listener is not None:
+            self.__output_listener.feed(output, stream_name, decoded_output)
+
+    def __finish_output(self):
+
+        # the incomplete trailing characters are dropped, the same as the invalid ones
+        for decoder in self.__decoders.values():
+            decoder.reset()
+
+        if self.__file_prefixer is not None:
+            logger.output_to_file(self.__file_prefixer.finish())
+        logger.flush_output_to_file()
+
+        if self.__output_listener is not None:
+            self.__output_listener.finish()
+
+    def __log_output_to_file(self, output):
+        if not self.__avoid_printing_command_output:
+            if self.__file_prefixer is not None:
+                output = self.__file_prefixer.feed(output)
+            logger.output_to_file(output)
+        elif not self.__output_reason_logged:
+            logger.non_formatted_info_to_file(self.__avoid_printing_command_output_reason)
+            self.__output_reason_logged = True
 
 class Subprocess:
 
@@ -769,14 +2391,18 @@ class Subprocess:
                         shell,
                         exec_mode,
                         communication_mode,
-                        master_fd,
-                        slave_fd,
                         params,
                         avoid_printing_command,
                         avoid_printing_command_reason,
                         avoid_printing_command_output,
                         avoid_printing_command_output_reason,
-                        interaction_mode):
+                        interaction_mode,
+                        capture_mode = None,
+                        output_listener = None,
+                        idle_timeout = 0,
+                        environment = None):
+
+        _check_not_cancelled()
 
         post_processed_cmd: Union[str, List[str]] = ""
         str_cmd = ""
@@ -859,32 +2485,58 @@ class Subprocess:
             env["COLUMNS"] = str(terminal_width)
             env["LINES"] = str(terminal_height)
 
+        if environment:
+            env.update(environment)
+
+        if _jobserver is not None:
+            _jobserver.export(env)
+
         def signal_winsize_handler(signum, frame):
             if signum == signal.SIGWINCH:
                 os.kill(sub_process.pid, signal.SIGWINCH)
 
-        old_action = signal.getsignal(signal.SIGWINCH)
-        signal.signal(signal.SIGWINCH, signal_winsize_handler)
+        # signal handlers can be installed only from the main thread
+        handle_winsize = threading.current_thread() is threading.main_thread()
+
+        if handle_winsize:
+            old_action = signal.getsignal(signal.SIGWINCH)
+            signal.signal(signal.SIGWINCH, signal_winsize_handler)
+
+        # with a deadline or inside of a cancellable task the sub-process gets its own session, so that the whole
+        # process group can be killed. Otherwise it stays in paf's session and keeps access to the controlling terminal.
+        start_new_session = bool(timeout or idle_timeout or _get_cancellation_scope())
 
         if communication_mode == CommunicationMode.USE_PTY:
+            # each sub-process gets its own PTY pair. As soon as the parent's copy of the slave side is closed,
+            # the master side reports the end of the output right after the last writer exits.
+            master_fd, slave_fd = pty.openpty()
             try:
-                sub_process = subprocess.Popen(result_cmd,
-                    shell = shell,
-                    stdout = slave_fd,
-                    stderr = slave_fd,
-                    stdin = slave_fd,
-                    executable = executable,
-                    env = env)
-
                 try:
-                    result = SubprocessCommandOutput(exec_mode, sub_process, timeout, communication_mode, master_fd,
-                                                     avoid_printing_command_output, avoid_printing_command_output_reason,
-                                                     interaction_mode)
+                    sub_process = subprocess.Popen(result_cmd,
+                        shell = shell,
+                        stdout = slave_fd,
+                        stderr = slave_fd,
+                        stdin = slave_fd,
+                        executable = executable,
+                        env = env,
+                        start_new_session = start_new_session)
+                finally:
+                    os.close(slave_fd)
+
+                terminator = _ProcessTerminator(sub_process, start_new_session)
+                try:
+                    with _stop_on_cancel(terminator):
+                        result = SubprocessCommandOutput(exec_mode, sub_process, timeout, communication_mode, master_fd,
+                                                         avoid_printing_command_output, avoid_printing_command_output_reason,
+                                                         interaction_mode, capture_mode, output_listener, idle_timeout)
+                    terminator.wait()
                 except:
                     sub_process.kill()
                     raise
             finally:
-                signal.signal(signal.SIGWINCH, old_action)
+                os.close(master_fd)
+                if handle_winsize:
+                    signal.signal(signal.SIGWINCH, old_action)
         elif communication_mode == CommunicationMode.PIPE_OUTPUT:
             try:
 
@@ -894,19 +2546,32 @@ class Subprocess:
                     stderr = subprocess.PIPE,
                     stdin = subprocess.PIPE,
                     executable = executable,
-                    env = env)
+                    env = env,
+                    start_new_session = start_new_session)
 
+                terminator = _ProcessTerminator(sub_process, start_new_session)
                 try:
-                    result = SubprocessCommandOutput(exec_mode, sub_process, timeout, communication_mode, None,
-                                                     avoid_printing_command_output, avoid_printing_command_output_reason,
-                                                     interaction_mode)
+                    with _stop_on_cancel(terminator):
+                        result = SubprocessCommandOutput(exec_mode, sub_process, timeout, communication_mode, None,
+                                                         avoid_printing_command_output, avoid_printing_command_output_reason,
+                                                         interaction_mode, capture_mode, output_listener, idle_timeout)
+                    terminator.wait()
                 except:
                     sub_process.kill()
                     raise
             finally:
-                signal.signal(signal.SIGWINCH, old_action)
-
-        if result.exit_code == 0:
+                if handle_winsize:
+                    signal.signal(signal.SIGWINCH, old_action)
+
+        if _is_cancelled():
+            result.stopped = True
+
+        if result.stopped:
+            logger.info(f"Command was stopped on request. Returned result code is '{result.exit_code}'")
+        elif result.timeout_kind is not None:
+            logger.error(f"Command was killed after its {result.timeout_kind.name.lower()} timeout. "
+                         f"Returned result code is '{result.exit_code}'")
+        elif result.exit_code == 0:
             logger.info(f"Command was successfully executed. Returned result code is '{result.exit_code}'")
         else:
             logger.error(f"Command has failed with the result code '{result.exit_code}'")
@@ -976,12 +2641,20 @@ class Environment:
 
 class Task:
 
-    __master_fd, __slave_fd = pty.openpty()
+    # maximum amount of lines buffered between the sub-process and the consumer of stream_subprocess
+    __STREAM_QUEUE_SIZE = 1024
 
     def __init__(self):
         self.__environment = Environment()
         self.__name = ""
         self.__ssh_connection_cache = SSHConnectionCache.getInstance()
+        self.__input_params = []
+        self.__input_files = []
+        self.__output_files = []
+        self.__resources = None
+        self.__cores_param = None
+        self.__granted_cores = None
+        self.__prefetchable = False
 
     def has_environment_param(self, param_name):
         return param_name in self.__environment.getVariables()
@@ -1025,17 +2698,129 @@ class Task:
         template = Template(cmd)
         return template.substitute(self.__dict__)
 
+    # the task is skipped, if its declared input parameters, input files and output files
+    # did not change since its last successful execution
+    def add_input_params(self, *param_names):
+        self.__input_params.extend(param_names)
+
+    # glob patterns. PAF parameters are substituted. '**' matches any number of directories
+    def add_input_files(self, *patterns):
+        self.__input_files.extend(patterns)
+
+    def add_output_files(self, *patterns):
+        self.__output_files.extend(patterns)
+
+    # resources needed by the task. A task is started only once they are available. The tasks without
+    # the declaration are not limited.
+    # memory - megabytes. exclusive - tags, e.g. "qemu", which only one running task can hold.
+    # The granted number of the cores is exported to the task as PAF_GRANTED_CORES and, if set, as cores_param.
+    # PAF_GRANTED_CORES is also set in the environment of the local commands
+    def set_resources(self, cores = 1, memory = 0, exclusive = (), cores_param = None):
+        self.__resources = scheduler.ResourceRequest(cores, memory, exclusive)
+        self.__cores_param = cores_param
+
+    def get_resources(self):
+        return self.__resources
+
+    # whether the task can be executed in the background ahead of its turn in the prefetch mode,
+    # e.g. a network-bound download, which does not depend on the tasks before it
+    def set_prefetchable(self, val = True):
+        self.__prefetchable = val
+
+    def is_prefetchable(self):
+        return self.__prefetchable
+
+    def set_granted_cores(self, cores):
+        self.__granted_cores = str(cores)
+        self.__dict__["PAF_GRANTED_CORES"] = str(cores)
+        if self.__cores_param:
+            self.__dict__[self.__cores_param] = str(cores)
+
+    def __is_forced(self):
+        forced_tasks = Config.get_forced_tasks()
+        return Config.get_force_all_tasks() \
+            or self.__name in forced_tasks \
+            or type(self).__name__ in forced_tasks \
+            or self.__get_task_path() in forced_tasks
+
+    def __get_task_path(self):
+        return f"{type(self).__module__}.{type(self).__qualname__}"
+
+    def __create_up_to_date_check(self):
+        if not (self.__input_params or self.__input_files or self.__output_files):
+            return None
+
+        parameters = {name: self.get_environment_param(name) for name in self.__input_params}
+        # the fingerprints of the different parameter values are stored separately, e.g. one per ARCH_TYPE
+        task_key = f"{self.__get_task_path()}:{task_state.hash_value(parameters)}"
+
+        return task_state.UpToDateCheck(task_state.TaskStateDB(Config.get_task_state_db_path()),
+                                        task_key,
+                                        parameters,
+                                        [self.substitute_parameters(pattern) for pattern in self.__input_files],
+                                        [self.substitute_parameters(pattern) for pattern in self.__output_files])
+
+    # the outputs are cached only for the tasks, which declare both the inputs and the outputs
+    def __create_artifact_cache(self, up_to_date_check):
+        cache_dir = Config.get_artifact_cache_dir()
+        if not cache_dir or not up_to_date_check or not self.__output_files \
+                or not (self.__input_params or self.__input_files):
+            return None
+
+        cache = artifact_cache.ArtifactCache(cache_dir, Config.get_artifact_cache_max_size())
+        key = f"{self.__get_task_path()}:{up_to_date_check.get_content_fingerprint()}"
+        return cache, key, [self.substitute_parameters(pattern) for pattern in self.__output_files]
+
+    def __restore_outputs(self, cache, key, output_patterns):
+        result = cache.restore(key, output_patterns)
+
+        if result is None:
+            logger.info(f"Artifact cache miss for the task '{self.__name}'.")
+            return False
+
+        logger.info(f"Artifact cache hit for the task '{self.__name}'. "
+                    f"Restored {result.files} files, {result.size} bytes. Skip its execution.")
+        return True
+
+    def __store_outputs(self, cache, key, output_patterns):
+        result = cache.store(key, output_patterns)
+        logger.info(f"Stored {result.files} output files, {result.size} bytes of the task '{self.__name}' "
+                    f"to the artifact cache.")
+
+    # returns False, if the task was skipped
     def start(self):
 
         logger.info("-------------------------------------")
         logger.info(f"Starting the task '{self.__name}'. Used environment:");
         self.__environment.dump()
 
+        up_to_date_check = self.__create_up_to_date_check()
+        forced = self.__is_forced()
+
+        if up_to_date_check and not forced and up_to_date_check.is_up_to_date():
+            logger.info(f"Task '{self.__name}' is up to date. Skip its execution.")
+            logger.info("-------------------------------------")
+            return False
+
+        cache = self.__create_artifact_cache(up_to_date_check)
+
+        if cache and not forced and self.__restore_outputs(*cache):
+            up_to_date_check.store()
+            logger.info("-------------------------------------")
+            return False
+
         self.init()
         self.execute()
 
+        if up_to_date_check:
+            up_to_date_check.store()
+
+        if cache:
+            self.__store_outputs(*cache)
+
         logger.info(f"Finished the task '{self.__name}'.");
         logger.info("-------------------------------------")
+        return True
 
     def __run_subprocess(self,
                          cmd,
@@ -1048,22 +2833,34 @@ class Task:
                          avoid_printing_command_reason,
                          avoid_printing_command_output,
                          avoid_printing_command_output_reason,
-                         interaction_mode):
+                         interaction_mode,
+                         capture_mode,
+                         output_listener,
+                         idle_timeout):
         process = Subprocess()
-        return process.exec_subprocess(cmd,
+        with _timed("command", self.__name, _command_timing_name(cmd, avoid_printing_command)):
+            return process.exec_subprocess(cmd,
                                        timeout,
                                        substitute_params,
                                        shell = shell,
                                        exec_mode = _resolve_execution_mode(exec_mode),
                                        communication_mode = _resolve_communication_mode(communication_mode),
-                                       master_fd = Task.__master_fd,
-                                       slave_fd = Task.__slave_fd,
-                                       params = self.__dict__,
-                                       avoid_printing_command = avoid_printing_command,
-                                       avoid_printing_command_reason = avoid_printing_command_reason,
-                                       avoid_printing_command_output = avoid_printing_command_output,
-                                       avoid_printing_command_output_reason = avoid_printing_command_output_reason,
-                                       interaction_mode = _resolve_interaction_mode(interaction_mode))
+                                           params = self.__dict__,
+                                           avoid_printing_command = avoid_printing_command,
+                                           avoid_printing_command_reason = avoid_printing_command_reason,
+                                           avoid_printing_command_output = avoid_printing_command_output,
+                                           avoid_printing_command_output_reason = avoid_printing_command_output_reason,
+                                           interaction_mode = _resolve_interaction_mode(interaction_mode),
+                                           capture_mode = _resolve_capture_mode(capture_mode),
+                                           output_listener = output_listener,
+                                           idle_timeout = idle_timeout,
+                                           environment = self.__get_command_environment())
+
+    def __get_command_environment(self):
+        # the grant is also visible to the tools, which read it from the environment instead of the command line
+        if self.__granted_cores is None:
+            return None
+        return {"PAF_GRANTED_CORES": self.__granted_cores}
 
     def subprocess_must_succeed(self,
                                 cmd,
@@ -1077,19 +2874,29 @@ class Task:
                                 avoid_printing_command_reason = "The command contains a sensitive information",
                                 avoid_printing_command_output = False,
                                 avoid_printing_command_output_reason = "The command output contains a sensitive information",
-                                interaction_mode = None):
-        command_output = self.__run_subprocess(cmd,
-                                               timeout,
-                                               substitute_params,
-                                               shell,
-                                               exec_mode,
-                                               communication_mode,
-                                               avoid_printing_command,
-                                               avoid_printing_command_reason,
-                                               avoid_printing_command_output,
-                                               avoid_printing_command_output_reason,
-                                               interaction_mode)
-        return _check_expected_return_code(command_output, expected_return_codes, "Subprocess should succeed!")
+                                interaction_mode = None,
+                                capture_mode = None,
+                                on_chunk = None,
+                                on_line = None,
+                                idle_timeout = 0,
+                                return_capture = False):
+        with _create_output_listener(on_chunk, on_line) as output_listener:
+            command_output = self.__run_subprocess(cmd,
+                                                   timeout,
+                                                   substitute_params,
+                                                   shell,
+                                                   exec_mode,
+                                                   communication_mode,
+                                                   avoid_printing_command,
+                                                   avoid_printing_command_reason,
+                                                   avoid_printing_command_output,
+                                                   avoid_printing_command_output_reason,
+                                                   interaction_mode,
+                                                   capture_mode,
+                                                   output_listener,
+                                                   idle_timeout)
+        return _check_expected_return_code(command_output, expected_return_codes, "Subprocess should succeed!",
+                                           return_capture)
 
     def exec_subprocess(self,
                         cmd,
@@ -1102,18 +2909,99 @@ class Task:
                         avoid_printing_command_reason = "The command contains a sensitive information",
                         avoid_printing_command_output = False,
                         avoid_printing_command_output_reason = "The command output contains a sensitive information",
-                        interaction_mode = None):
-        return self.__run_subprocess(cmd,
-                                     timeout,
-                                     substitute_params,
-                                     shell,
-                                     exec_mode,
-                                     communication_mode,
-                                     avoid_printing_command,
-                                     avoid_printing_command_reason,
-                                     avoid_printing_command_output,
-                                     avoid_printing_command_output_reason,
-                                     interaction_mode)
+                        interaction_mode = None,
+                        capture_mode = None,
+                        on_chunk = None,
+                        on_line = None,
+                        idle_timeout = 0):
+        with _create_output_listener(on_chunk, on_line) as output_listener:
+            return self.__run_subprocess(cmd,
+                                         timeout,
+                                         substitute_params,
+                                         shell,
+                                         exec_mode,
+                                         communication_mode,
+                                         avoid_printing_command,
+                                         avoid_printing_command_reason,
+                                         avoid_printing_command_output,
+                                         avoid_printing_command_output_reason,
+                                         interaction_mode,
+                                         capture_mode,
+                                         output_listener,
+                                         idle_timeout)
+
+    def stream_subprocess(self,
+                          cmd,
+                          timeout = 0,
+                          expected_return_codes = [0],
+                          substitute_params = True,
+                          shell = True,
+                          communication_mode = None,
+                          avoid_printing_command = False,
+                          avoid_printing_command_reason = "The command contains a sensitive information",
+                          avoid_printing_command_output = False,
+                          avoid_printing_command_output_reason = "The command output contains a sensitive information",
+                          interaction_mode = None,
+                          idle_timeout = 0):
+        """
+        Executes the command as a sub-process and yields its output line by line, while the command is running.
+        The output is printed, but not collected. Leaving the loop early stops the sub-process.
+        Once all lines are consumed, the return code is checked against 'expected_return_codes'.
+        """
+        lines: queue.Queue = queue.Queue(maxsize = Task.__STREAM_QUEUE_SIZE)
+        finished = object()
+        result: Dict[str, Any] = {}
+
+        output_prefix = _get_output_prefix()
+        cancellation_scope = _get_cancellation_scope()
+
+        with OutputListener(on_line = lines.put) as output_listener:
+
+            def run():
+                try:
+                    with _task_output_context(output_prefix, cancellation_scope):
+                        result["output"] = self.__run_subprocess(cmd,
+                                                             timeout,
+                                                             substitute_params,
+                                                             shell,
+                                                             ExecutionMode.PRINT,
+                                                             communication_mode,
+                                                             avoid_printing_command,
+                                                             avoid_printing_command_reason,
+                                                             avoid_printing_command_output,
+                                                             avoid_printing_command_output_reason,
+                                                             interaction_mode,
+                                                             None,
+                                                             output_listener,
+                                                             idle_timeout)
+                except BaseException as e:
+                    result["error"] = e
+                finally:
+                    lines.put(finished)
+
+            worker = threading.Thread(target = run, name = f"{self.__name}-stream", daemon = True)
+            worker.start()
+
+            try:
+                while True:
+                    line = lines.get()
+                    if line is finished:
+                        break
+                    yield line
+            finally:
+                output_listener.request_stop()
+                # unblock the worker, if it waits for the free space in the queue
+                while worker.is_alive():
+                    try:
+                        lines.get(timeout = 0.1)
+                    except queue.Empty:
+                        pass
+                worker.join()
+
+        if "error" in result:
+            raise result["error"]
+
+        return _check_expected_return_code(result["output"], expected_return_codes, "Subprocess should succeed!")
 
     def ensure_docker_image(self, image_alias):
         from paf import docker_runtime
@@ -1130,7 +3018,11 @@ class Task:
                                avoid_printing_command_reason = "The command contains a sensitive information",
                                avoid_printing_command_output = False,
                                avoid_printing_command_output_reason = "The command output contains a sensitive information",
-                               interaction_mode = None):
+                               interaction_mode = None,
+                               capture_mode = None,
+                               on_chunk = None,
+                               on_line = None,
+                               idle_timeout = 0):
         from paf import docker_runtime
         docker_cmd = docker_runtime.docker_run_command(self, container_alias, cmd)
         return self.exec_subprocess(docker_cmd,
@@ -1143,7 +3035,11 @@ class Task:
                                     avoid_printing_command_reason = avoid_printing_command_reason,
                                     avoid_printing_command_output = avoid_printing_command_output,
                                     avoid_printing_command_output_reason = avoid_printing_command_output_reason,
-                                    interaction_mode = interaction_mode)
+                                    interaction_mode = interaction_mode,
+                                    capture_mode = capture_mode,
+                                    on_chunk = on_chunk,
+                                    on_line = on_line,
+                                    idle_timeout = idle_timeout)
 
     def docker_subprocess_must_succeed(self,
                                        container_alias,
@@ -1157,7 +3053,12 @@ class Task:
                                        avoid_printing_command_reason = "The command contains a sensitive information",
                                        avoid_printing_command_output = False,
                                        avoid_printing_command_output_reason = "The command output contains a sensitive information",
-                                       interaction_mode = None):
+                                       interaction_mode = None,
+                                       capture_mode = None,
+                                       on_chunk = None,
+                                       on_line = None,
+                                       idle_timeout = 0,
+                                       return_capture = False):
         command_output = self.docker_exec_subprocess(
             container_alias,
             cmd,
@@ -1169,8 +3070,13 @@ class Task:
             avoid_printing_command_reason = avoid_printing_command_reason,
             avoid_printing_command_output = avoid_printing_command_output,
             avoid_printing_command_output_reason = avoid_printing_command_output_reason,
-            interaction_mode = interaction_mode)
-        return _check_expected_return_code(command_output, expected_return_codes, "Docker subprocess should succeed!")
+            interaction_mode = interaction_mode,
+            capture_mode = capture_mode,
+            on_chunk = on_chunk,
+            on_line = on_line,
+            idle_timeout = idle_timeout)
+        return _check_expected_return_code(command_output, expected_return_codes, "Docker subprocess should succeed!",
+                                           return_capture)
 
     def __run_ssh_command(self,
                           cmd,
@@ -1188,13 +3094,18 @@ class Task:
                           avoid_printing_command_reason,
                           avoid_printing_command_output,
                           avoid_printing_command_output_reason,
-                          interaction_mode):
-        return self.__ssh_connection_cache.exec_command(cmd, host, user, port,
-            password = password, key_filename = key_filename, timeout = timeout, substitute_params = substitute_params,
-            exec_mode = _resolve_execution_mode(exec_mode), params = self.__dict__, jumphost = jumphost, passphrase = passphrase,
-            avoid_printing_command = avoid_printing_command, avoid_printing_command_reason = avoid_printing_command_reason,
-            avoid_printing_command_output = avoid_printing_command_output, avoid_printing_command_output_reason = avoid_printing_command_output_reason,
-            interaction_mode = _resolve_interaction_mode(interaction_mode))
+                          interaction_mode,
+                          capture_mode,
+                          output_listener):
+        with _timed("command", self.__name, _command_timing_name(cmd, avoid_printing_command)):
+            return self.__ssh_connection_cache.exec_command(cmd, host, user, port,
+                password = password, key_filename = key_filename, timeout = timeout, substitute_params = substitute_params,
+                exec_mode = _resolve_execution_mode(exec_mode), params = self.__dict__, jumphost = jumphost, passphrase = passphrase,
+                avoid_printing_command = avoid_printing_command, avoid_printing_command_reason = avoid_printing_command_reason,
+                avoid_printing_command_output = avoid_printing_command_output, avoid_printing_command_output_reason = avoid_printing_command_output_reason,
+                interaction_mode = _resolve_interaction_mode(interaction_mode),
+                capture_mode = _resolve_capture_mode(capture_mode),
+                output_listener = output_listener)
 
     def ssh_command_must_succeed(self,
                              cmd,
@@ -1213,13 +3124,19 @@ class Task:
                              avoid_printing_command_reason = "The command contains a sensitive information",
                              avoid_printing_command_output = False,
                              avoid_printing_command_output_reason = "The command output contains a sensitive information",
-                             interaction_mode = None):
-        command_output = self.__run_ssh_command(cmd, host, user, port, password, key_filename, timeout,
-                                                substitute_params, exec_mode, jumphost, passphrase,
-                                                avoid_printing_command, avoid_printing_command_reason,
-                                                avoid_printing_command_output, avoid_printing_command_output_reason,
-                                                interaction_mode)
-        return _check_expected_return_code(command_output, expected_return_codes, "SSH command should succeed!")
+                             interaction_mode = None,
+                             capture_mode = None,
+                             on_chunk = None,
+                             on_line = None,
+                             return_capture = False):
+        with _create_output_listener(on_chunk, on_line) as output_listener:
+            command_output = self.__run_ssh_command(cmd, host, user, port, password, key_filename, timeout,
+                                                    substitute_params, exec_mode, jumphost, passphrase,
+                                                    avoid_printing_command, avoid_printing_command_reason,
+                                                    avoid_printing_command_output, avoid_printing_command_output_reason,
+                                                    interaction_mode, capture_mode, output_listener)
+        return _check_expected_return_code(command_output, expected_return_codes, "SSH command should succeed!",
+                                           return_capture)
 
     def exec_ssh_command(self,
                      cmd,
@@ -1237,12 +3154,137 @@ class Task:
                      avoid_printing_command_reason = "The command contains a sensitive information",
                      avoid_printing_command_output = False,
                      avoid_printing_command_output_reason = "The command output contains a sensitive information",
-                     interaction_mode = None):
-        return self.__run_ssh_command(cmd, host, user, port, password, key_filename, timeout,
-                                      substitute_params, exec_mode, jumphost, passphrase,
-                                      avoid_printing_command, avoid_printing_command_reason,
-                                      avoid_printing_command_output, avoid_printing_command_output_reason,
-                                      interaction_mode)
+                     interaction_mode = None,
+                     capture_mode = None,
+                     on_chunk = None,
+                     on_line = None):
+        with _create_output_listener(on_chunk, on_line) as output_listener:
+            return self.__run_ssh_command(cmd, host, user, port, password, key_filename, timeout,
+                                          substitute_params, exec_mode, jumphost, passphrase,
+                                          avoid_printing_command, avoid_printing_command_reason,
+                                          avoid_printing_command_output, avoid_printing_command_output_reason,
+                                          interaction_mode, capture_mode, output_listener)
+
+    def __ssh_transfer(self, source_path, target_path, upload, host, user, port, password, key_filename, jumphost,
+                       passphrase, streams, resume, substitute_params):
+        if substitute_params:
+            source_path = Template(source_path).substitute(self.__dict__)
+            target_path = Template(target_path).substitute(self.__dict__)
+
+        pool = self.__ssh_connection_cache.find_or_create_pool(host, user, port, password, key_filename,
+                                                               jumphost, passphrase)
+
+        local_file = ssh_transfer.LocalFile(source_path if upload else target_path)
+        remote_file = ssh_transfer.RemoteFile(pool.sftp_session, target_path if upload else source_path,
+                                              pool.get_connection_key())
+        source, target = (local_file, remote_file) if upload else (remote_file, local_file)
+
+        state_path = ssh_transfer.get_state_path(Config.get_transfer_state_dir(), source, target)
+
+        logger.info(f"Transferring '{source}' to '{target}'")
+
+        with _timed("command", self.__name, f"transfer {source} {target}"):
+            result = ssh_transfer.transfer(source, target, state_path,
+                streams = streams or Config.get_transfer_streams(),
+                parallel_threshold = Config.get_transfer_parallel_threshold(),
+                resume = resume,
+                check_cancelled = _check_not_cancelled,
+                stream_context = self.__transfer_stream_context())
+
+        logger.info(str(result))
+        return result
+
+    @staticmethod
+    def __transfer_stream_context():
+        # the streams are executed in the context of the task, so that they are stopped along with it
+        output_prefix = _get_output_prefix()
+        cancellation_scope = _get_cancellation_scope()
+        return lambda: _task_output_context(output_prefix, cancellation_scope)
+
+    # Copies the local file to the host over SFTP. The files above Config.get_transfer_parallel_threshold()
+    # are transferred by several streams. An interrupted transfer is continued by the next call, if resume is set.
+    # Returns the TransferResult
+    def ssh_upload(self,
+                   local_path,
+                   remote_path,
+                   host,
+                   user,
+                   port = 22,
+                   password = "",
+                   key_filename = [],
+                   jumphost = None,
+                   passphrase = None,
+                   streams = None,
+                   resume = True,
+                   substitute_params = True):
+        return self.__ssh_transfer(local_path, remote_path, True, host, user, port, password, key_filename,
+                                   jumphost, passphrase, streams, resume, substitute_params)
+
+    # Copies the file from the host to the local path over SFTP. See ssh_upload
+    def ssh_download(self,
+                     remote_path,
+                     local_path,
+                     host,
+                     user,
+                     port = 22,
+                     password = "",
+                     key_filename = [],
+                     jumphost = None,
+                     passphrase = None,
+                     streams = None,
+                     resume = True,
+                     substitute_params = True):
+        return self.__ssh_transfer(remote_path, local_path, False, host, user, port, password, key_filename,
+                                   jumphost, passphrase, streams, resume, substitute_params)
+
+    # Uploads only the files of the local directory, which differ from the remote ones by the size or
+    # the modification time. If checksum is set, the files, which differ only by the modification time, are
+    # compared by the checksums computed on the host. If delete is set, the remote files, which do not exist
+    # locally, are removed. Returns the SyncResult
+    def ssh_sync_dir(self,
+                     local_dir,
+                     remote_dir,
+                     host,
+                     user,
+                     port = 22,
+                     password = "",
+                     key_filename = [],
+                     jumphost = None,
+                     passphrase = None,
+                     checksum = False,
+                     delete = False,
+                     streams = None,
+                     substitute_params = True):
+        if substitute_params:
+            local_dir = Template(local_dir).substitute(self.__dict__)
+            remote_dir = Template(remote_dir).substitute(self.__dict__)
+
+        pool = self.__ssh_connection_cache.find_or_create_pool(host, user, port, password, key_filename,
+                                                               jumphost, passphrase)
+
+        def exec_command(cmd):
+            return self.ssh_command_must_succeed(cmd, host, user, port, password = password,
+                key_filename = key_filename, substitute_params = False, jumphost = jumphost,
+                passphrase = passphrase, avoid_printing_command_output = True,
+                avoid_printing_command_output_reason = "Checksums of the remote files",
+                interaction_mode = InteractionMode.IGNORE_INPUT,
+                # the checksums are parsed from the returned string, whatever the configured capture mode is
+                capture_mode = CaptureMode.MEMORY)
+
+        logger.info(f"Synchronizing '{local_dir}' to '{pool.get_connection_key()}:{remote_dir}'")
+
+        with _timed("command", self.__name, f"sync {local_dir} {pool.get_connection_key()}:{remote_dir}"):
+            result = ssh_transfer.sync_directory(local_dir, remote_dir, pool.sftp_session, pool.get_connection_key(),
+                exec_command, Config.get_transfer_state_dir(),
+                streams = streams or Config.get_transfer_streams(),
+                parallel_threshold = Config.get_transfer_parallel_threshold(),
+                checksum = checksum,
+                delete = delete,
+                check_cancelled = _check_not_cancelled,
+                stream_context = self.__transfer_stream_context())
+
+        logger.info(str(result))
+        return result
 
     def get_name(self):
         return self.__name
@@ -1319,13 +3361,20 @@ class Scenario:
 class Phase:
     def __init__(self):
         self.__tasks = []
+        self.__dependencies = []
 
-    def add_task(self, task_name, conditions):
+    # depends_on - names of the tasks of the phase, which should be finished before this one.
+    # None means, that the task depends on the previous task of the phase
+    def add_task(self, task_name, conditions, depends_on = None):
         self.__tasks.append((task_name, conditions))
+        self.__dependencies.append(depends_on)
 
     def get_tasks(self):
         return self.__tasks
 
+    def get_dependencies(self):
+        return self.__dependencies
+
 class ExecutionElement:
     ExecutionElementType_Task = 0
     ExecutionElementType_Phase = 1
@@ -1347,8 +3396,18 @@ class ExecutionContext:
         self.__available_phases = {}
         self.__available_scenarios = {}
         self.__imported_modules = {}
-
-        os.makedirs(log_dir, exist_ok=True)
+        self.__jobs = 1
+        self.__prefetch = False
+        self.__prefetcher = None
+        self.__log_dir = log_dir
+        self.__journal = journal.RunJournal(None)
+        # guards the environment shared by the tasks of a phase executed in parallel
+        self.__environment_lock = threading.Lock()
+        self.__resource_pool = scheduler.ResourcePool(Config.get_resource_cores(), Config.get_resource_memory())
+
+        # without the log directory, there is no log file, journal or timings database
+        if log_dir:
+            os.makedirs(log_dir, exist_ok=True)
 
         logger.set_log_dir(log_dir)
         logger.init()
@@ -1356,13 +3415,36 @@ class ExecutionContext:
     def import_modules(self, import_module_dirs):
         self.__imported_modules = common.load_all_modules_in_dirs(import_module_dirs)
 
+    # modules, which were already imported via common.load_all_modules_in_dirs
+    def set_imported_modules(self, imported_modules):
+        self.__imported_modules = imported_modules
+
     def add_execution_element(self, execution_element_type, execution_element_name):
         execution_element = ExecutionElement(execution_element_type, execution_element_name)
         self.__execution_elements.append(execution_element)
 
+    # sets the maximum number of the tasks of a phase, which are executed in parallel
+    def set_jobs(self, jobs):
+        if jobs < 1:
+            raise Exception(f"Number of jobs should be positive. Got '{jobs}'")
+        self.__jobs = jobs
+
+    def get_jobs(self):
+        return self.__jobs
+
+    # enables the execution of the prefetchable tasks of the next phases of a scenario in the background
+    def set_prefetch(self, val):
+        self.__prefetch = val
+
+    def get_prefetch(self):
+        return self.__prefetch
+
     def add_available_phase(self, phase_name, phase_object):
         self.__available_phases[phase_name] = phase_object
 
+    def get_available_phase(self, phase_name):
+        return self.__available_phases.get(phase_name)
+
     def add_available_scenario(self, scenario_name, scenario_object):
         self.__available_scenarios[scenario_name] = scenario_object
 
@@ -1387,22 +3469,136 @@ class ExecutionContext:
 
         return result
 
-    def __execute_task(self, task_name, environment):
+    def __execute_task(self, task_name, environment, scenario_name = None, phase_name = None):
+        occurrence = self.__journal.start_step(scenario_name, phase_name, task_name)
+        environment_hash = journal.environment_hash(environment)
+        completed = self.__journal.find_completed(scenario_name, phase_name, task_name, occurrence, environment_hash)
+
+        prefetcher = self.__prefetcher
+        prefetched_changes = None
+
+        if completed:
+            logger.info(f"Execution context: skip the task '{task_name}', which was completed in the resumed run")
+            changes = completed["environment_changes"]
+            journal.apply_environment_changes(environment, changes)
+            if prefetcher:
+                # the task is not interrupted halfway, e.g. after removing the sources and before cloning them again
+                prefetcher.discard((phase_name, task_name), cancel = False)
+        else:
+            if prefetcher:
+                prefetched_changes = prefetcher.take((phase_name, task_name), environment_hash)
+
+            if prefetched_changes is not None:
+                logger.info(f"Execution context: the task '{task_name}' was prefetched")
+                changes = prefetched_changes
+                journal.apply_environment_changes(environment, changes)
+            else:
+                changes = self.__run_task(task_name, environment, phase_name)
+
+        self.__journal.record(scenario_name, phase_name, task_name, occurrence, environment_hash, changes)
+        return changes
+
+    # returns the changes, which the task made to the environment
+    def __run_task(self, task_name, environment, phase_name):
+        variables_before = dict(environment.getVariables())
+
         klass = common.create_class_instance(task_name, self.__imported_modules)
         task_instance = klass()
         task_instance.set_environment(environment)
-        task_instance.start()
+        resources = task_instance.get_resources()
 
-    def __execute_phase(self, phase_name, environment):
+        if resources:
+            task_instance.set_granted_cores(self.__acquire_resources(task_name, resources))
+
+        try:
+            with _timed("task", phase_name or "", task_name) as measurement:
+                measurement.skipped = task_instance.start() is False
+        finally:
+            if resources:
+                self.__resource_pool.release(resources)
+
+        return journal.environment_changes(variables_before, environment.getVariables())
+
+    def __prefetch_tasks(self, prefetcher, phases, environment, scenario_name):
+        """
+        Starts the prefetchable tasks of the phases, whose conditions are met by the current environment.
+        The tasks completed in the resumed run are not started, as they are likely to be skipped at their turn.
+        """
+        for phase_name, phase_conditions in phases:
+            phase = self.__available_phases.get(phase_name)
+            if not phase or not self.__conditions_met(phase_conditions, environment):
+                continue
+
+            for task_name, task_conditions in phase.get_tasks():
+                key = (phase_name, task_name)
+                if prefetcher.is_started(key) or not self.__conditions_met(task_conditions, environment):
+                    continue
+                if self.__journal.has_completed(scenario_name, phase_name, task_name):
+                    continue
+                if not common.create_class_instance(task_name, self.__imported_modules)().is_prefetchable():
+                    continue
+
+                # the task gets a copy of the environment, which is compared with the actual one at its turn
+                snapshot = copy.deepcopy(environment)
+                output_prefix = _get_output_prefix() + f"[prefetch {task_name.rsplit('.', 1)[-1]}] "
+                cancellation_scope = CancellationScope()
+
+                def run(task_name = task_name, snapshot = snapshot, phase_name = phase_name,
+                        output_prefix = output_prefix, cancellation_scope = cancellation_scope):
+                    with _task_output_context(output_prefix, cancellation_scope):
+                        return self.__run_task(task_name, snapshot, phase_name)
+
+                logger.info(f"Execution context: prefetch the task '{task_name}' of the phase '{phase_name}'")
+                prefetcher.start(key, journal.environment_hash(snapshot), run, cancellation_scope.cancel)
+
+    def __acquire_resources(self, task_name, resources):
+        granted_cores = self.__resource_pool.try_acquire(resources)
+
+        if granted_cores is None:
+            logger.info(f"Execution context: the task '{task_name}' waits for the resources - {resources}")
+            granted_cores = self.__resource_pool.acquire(resources, _is_cancelled)
+
+            if granted_cores is None:
+                raise TaskCancelledError(f"The task '{task_name}' was cancelled while waiting for the resources.")
+
+        return granted_cores
+
+    def __execute_phase(self, phase_name, environment, scenario_name = None):
         phase = self.__available_phases.get(phase_name)
         if phase:
             tasks = phase.get_tasks()
+            dependencies = scheduler.resolve_dependencies([task_name for task_name, _ in tasks],
+                                                          phase.get_dependencies())
+            parallel = self.__jobs > 1
+            # the tasks are cancelled only after a failure of a parallel task
+            cancellation_scope = CancellationScope() if parallel else None
+
+            def run_task(index):
+                task_name, condition = tasks[index]
+                output_prefix = _get_output_prefix()
+                if parallel:
+                    output_prefix += f"[{task_name.rsplit('.', 1)[-1]}] "
+                with _task_output_context(output_prefix, cancellation_scope):
+                    # a parallel task gets its own copy of the environment, so that the tasks do not see and
+                    # record the changes of each other. Its changes are merged, once it is finished
+                    if parallel:
+                        with self.__environment_lock:
+                            task_environment = copy.deepcopy(environment)
+                    else:
+                        task_environment = environment
+
+                    if self.__check_conditions(condition, task_environment):
+                        changes = self.__execute_task(task_name, task_environment, scenario_name, phase_name)
+                        if parallel:
+                            with self.__environment_lock:
+                                journal.apply_environment_changes(environment, changes)
+                    else:
+                        logger.warning(f"Skip execution of the task '{task_name}'.")
+
             logger.info(f"Execution context: start execution of the phase '{phase_name}'")
-            for task_name, condition in tasks:
-                if self.__check_conditions(condition, environment):
-                    self.__execute_task(task_name, environment)
-                else:
-                    logger.warning(f"Skip execution of the task '{task_name}'.")
+            with _timed("phase", scenario_name or "", phase_name):
+                scheduler.run_graph(dependencies, self.__jobs, run_task,
+                                    cancellation_scope.cancel if cancellation_scope else None)
             logger.info(f"Execution context: execution of the phase '{phase_name}' was finished")
         else:
             raise Exception(f"Phase '{phase_name}' was not found!")
@@ -1413,19 +3609,56 @@ class ExecutionContext:
         if scenario:
             phases = scenario.get_phases()
             logger.info(f"Execution context: start execution of the scenario '{scenario_name}'")
-            for phase_name, condition in phases:
-                if self.__check_conditions(condition, environment):
-                    self.__execute_phase(phase_name, environment)
-                else:
-                    logger.warning(f"Skip execution of the phase '{phase_name}'.")
+            prefetcher = prefetch.Prefetcher() if self.__prefetch else None
+            self.__prefetcher = prefetcher
+            try:
+                with _timed("scenario", "", scenario_name):
+                    for index, (phase_name, condition) in enumerate(phases):
+                        if self.__check_conditions(condition, environment):
+                            self.__execute_phase(phase_name, environment, scenario_name)
+                        else:
+                            logger.warning(f"Skip execution of the phase '{phase_name}'.")
+
+                        # the look-ahead starts after the first phase, which usually prepares the workspace
+                        if prefetcher:
+                            self.__prefetch_tasks(prefetcher, phases[index + 1:], environment, scenario_name)
+            finally:
+                if prefetcher:
+                    prefetcher.close()
+                self.__prefetcher = None
             logger.info(f"Execution context: execution of the scenario '{scenario_name}' was finished")
         else:
             raise Exception(f"Scenario '{scenario_name}' was not found!")
 
-    def execute(self, environment):
+    # resume_journal - journal of a previous run or the log directory, which contains it. The tasks, which were
+    # completed in that run with the same environment, are skipped
+    def execute(self, environment, resume_journal = None):
 
         logger.info(f"Execution context: start execution")
 
+        if resume_journal:
+            logger.info(f"Execution context: resume the run from the journal '{resume_journal}'")
+
+        journal_path = os.path.join(self.__log_dir, journal.JOURNAL_FILE_NAME) if self.__log_dir else None
+        self.__journal = journal.RunJournal(journal_path, resume_journal)
+
+        global _timing_db
+        _timing_db = self.__open_timing_db()
+        self.__resource_pool = scheduler.ResourcePool(Config.get_resource_cores(), Config.get_resource_memory())
+
+        try:
+            with _shared_jobserver():
+                self.__execute_elements(environment)
+        finally:
+            self.__journal.close()
+            _timing_db = None
+
+            for utilization in SSHConnectionCache.getInstance().get_pool_utilization():
+                logger.info(f"{utilization}")
+
+        logger.info(f"Execution context: finished execution")
+
+    def __execute_elements(self, environment):
         for element in self.__execution_elements:
             element_type = element.get_element_type()
             if element_type == ExecutionElement.ExecutionElementType_Task:
@@ -1438,7 +3671,87 @@ class ExecutionContext:
                 scenario_name = element.get_element_name()
                 self.__execute_scenario(scenario_name, environment)
 
-        logger.info(f"Execution context: finished execution")
+    def __open_timing_db(self):
+        if not self.__log_dir:
+            return None
+        return timing.TimingDB(os.path.join(self.__log_dir, timing.TIMING_DB_FILE_NAME))
+
+    def __conditions_met(self, conditions, environment):
+        return all(environment.getVariableValue(name) == value for name, value in conditions.items())
+
+    def __plan_phase(self, phase_name, environment, timing_db, lines, indent):
+        phase = self.__available_phases.get(phase_name)
+        if not phase:
+            raise Exception(f"Phase '{phase_name}' was not found!")
+
+        tasks = phase.get_tasks()
+        dependencies = scheduler.resolve_dependencies([task_name for task_name, _ in tasks], phase.get_dependencies())
+        executed = [self.__conditions_met(conditions, environment) for _, conditions in tasks]
+        expected = [timing_db.expected_duration("task", task_name) if timing_db else None for task_name, _ in tasks]
+        durations = [(duration or 0) if executed[index] else 0 for index, duration in enumerate(expected)]
+
+        if self.__jobs > 1:
+            length, path = scheduler.critical_path(dependencies, durations)
+        else:
+            length, path = sum(durations), list(range(len(tasks)))
+
+        lines.append(f"{indent}phase '{phase_name}': expected {timing.format_duration(length)}")
+
+        for index, (task_name, _) in enumerate(tasks):
+            if not executed[index]:
+                state = "condition is not met now"
+            else:
+                state = f"expected {timing.format_duration(expected[index])}"
+                if index in path and self.__jobs > 1:
+                    state += ", critical path"
+            lines.append(f"{indent}    task '{task_name}': {state}")
+
+        return length, [tasks[index][0] for index in path if executed[index]]
+
+    def plan(self, environment):
+        """
+        Returns the lines of the execution plan - the elements to be executed with their expected durations,
+        based on the durations recorded in the log directory, and the critical path.
+        The conditions are evaluated against the current environment, so the parameters set by the tasks are not
+        taken into account.
+        """
+        timing_db = self.__open_timing_db()
+        lines = ["Execution plan:"]
+        total = 0.0
+        critical_path = []
+
+        def plan_phase(phase_name, indent):
+            nonlocal total
+            length, path = self.__plan_phase(phase_name, environment, timing_db, lines, indent)
+            total += length
+            critical_path.extend(path)
+
+        for element in self.__execution_elements:
+            element_type = element.get_element_type()
+            element_name = element.get_element_name()
+
+            if element_type == ExecutionElement.ExecutionElementType_Task:
+                expected = timing_db.expected_duration("task", element_name) if timing_db else None
+                lines.append(f"task '{element_name}': expected {timing.format_duration(expected)}")
+                total += expected or 0
+                critical_path.append(element_name)
+            elif element_type == ExecutionElement.ExecutionElementType_Phase:
+                plan_phase(element_name, "")
+            elif element_type == ExecutionElement.ExecutionElementType_Scenario:
+                scenario = self.__available_scenarios.get(element_name)
+                if not scenario:
+                    raise Exception(f"Scenario '{element_name}' was not found!")
+
+                lines.append(f"scenario '{element_name}'")
+                for phase_name, conditions in scenario.get_phases():
+                    if self.__conditions_met(conditions, environment):
+                        plan_phase(phase_name, "    ")
+                    else:
+                        lines.append(f"    phase '{phase_name}': condition is not met now")
+
+        lines.append(f"Expected duration: {timing.format_duration(total)}")
+        lines.append("Critical path: " + " -> ".join(critical_path))
+        return lines
 
     def __parse_conditions(self, base_element):
         conditions = {}
@@ -1463,8 +3776,7 @@ class ExecutionContext:
 
     def parse_config(self, config_path, execution_context, environment):
         logger.info("Attempt to parse config file '" + config_path + "'")
-        tree = ET.parse(config_path)
-        root = tree.getroot()
+        root = _parse_xml_config(config_path)
 
         if root and root.tag == "paf_config":
             for child in root:
@@ -1497,8 +3809,9 @@ class ExecutionContext:
                                 raise Exception("Required attribute 'name' was not found in the 'task' tag!")
 
                             conditions = self.__parse_conditions(sub)
+                            depends_on = scheduler.parse_depends_on(sub.attrib.get("depends_on"))
 
-                            phase.add_task(task_name, conditions)
+                            phase.add_task(task_name, conditions, depends_on)
                             execution_context.add_available_phase(phase_name, phase)
                         else:
                             raise Exception(f"Unexpected XML tag '${sub.tag}'!")
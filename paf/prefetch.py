@@ -0,0 +1,104 @@
+'''
+Speculative execution of the prefetchable tasks ahead of their turn.
+'''
+
+import threading
+
+
+class PrefetchedTask:
+    def __init__(self, environment_hash, cancel):
+        self.environment_hash = environment_hash
+        self.cancel = cancel
+        self.changes = None
+        self.error = None
+        self.thread = None
+
+
+class Prefetcher:
+    """
+    Executes the tasks in the background threads. A prefetched task is used at its turn only if it was started
+    with the same environment, as the one it would be executed with. Otherwise it is executed again.
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__tasks = {}
+        self.__started_keys = set()
+
+    def is_started(self, key):
+        with self.__lock:
+            return key in self.__started_keys
+
+    # run - returns the changes, which the task made to the environment. cancel - stops it
+    def start(self, key, environment_hash, run, cancel = None):
+        prefetched = PrefetchedTask(environment_hash, cancel)
+
+        def execute():
+            try:
+                prefetched.changes = run()
+            except BaseException as e:
+                prefetched.error = e
+
+        with self.__lock:
+            if key in self.__started_keys:
+                return
+            self.__started_keys.add(key)
+            self.__tasks[key] = prefetched
+
+        prefetched.thread = threading.Thread(target = execute, daemon = True)
+        prefetched.thread.start()
+
+    def take(self, key, environment_hash):
+        """
+        Waits for the task prefetched under the key and returns its environment changes. Re-raises its error.
+        None, if the task was not prefetched or was prefetched with another environment.
+        """
+        with self.__lock:
+            prefetched = self.__tasks.pop(key, None)
+
+        if prefetched is None:
+            return None
+
+        if prefetched.environment_hash != environment_hash:
+            # the stale task is stopped and awaited, so that it does not run along with its second execution
+            self.__stop([prefetched])
+            return None
+
+        prefetched.thread.join()
+
+        if prefetched.error is not None:
+            raise prefetched.error
+        return prefetched.changes
+
+    def discard(self, key, cancel = True):
+        """
+        Awaits the task prefetched under the key, e.g. as it is not executed at its turn. Stops it first,
+        unless cancel is False. Its result is dropped.
+        """
+        with self.__lock:
+            prefetched = self.__tasks.pop(key, None)
+
+        if prefetched is None:
+            return
+
+        if cancel:
+            self.__stop([prefetched])
+        else:
+            prefetched.thread.join()
+
+    def close(self):
+        """Stops and awaits the prefetched tasks, which were not taken."""
+        with self.__lock:
+            pending = list(self.__tasks.values())
+            self.__tasks.clear()
+
+        self.__stop(pending)
+
+    @staticmethod
+    def __stop(prefetched_tasks):
+        for prefetched in prefetched_tasks:
+            if prefetched.cancel:
+                prefetched.cancel()
+
+        for prefetched in prefetched_tasks:
+            prefetched.thread.join()
@@ -0,0 +1,272 @@
+'''
+Dependency-aware scheduling of the tasks of a phase.
+'''
+
+import collections
+import heapq
+import re
+import threading
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from typing import Deque, Optional
+
+
+def parse_depends_on(value):
+    """Splits the 'depends_on' value into the task names. None means, that the attribute is not set."""
+    if value is None:
+        return None
+    return [name for name in re.split(r"[\s,]+", value.strip()) if name]
+
+
+def _find_task(task_names, reference, task_name):
+    matches = [index for index, name in enumerate(task_names)
+               if name == reference or name.rsplit(".", 1)[-1] == reference]
+
+    if not matches:
+        raise Exception(f"Task '{task_name}' depends on the unknown task '{reference}'!")
+
+    if len(matches) > 1:
+        raise Exception(f"Task '{task_name}' depends on the ambiguous task name '{reference}'!")
+
+    return matches[0]
+
+
+def _check_cycles(dependencies, task_names):
+    # 0 - not visited, 1 - in progress, 2 - done
+    states = [0] * len(dependencies)
+
+    def visit(index, path):
+        if states[index] == 2:
+            return
+        if states[index] == 1:
+            cycle = path[path.index(index):] + [index]
+            raise Exception("Cyclic task dependencies: " + " -> ".join(task_names[i] for i in cycle))
+
+        states[index] = 1
+        for dependency in dependencies[index]:
+            visit(dependency, path + [index])
+        states[index] = 2
+
+    for index in range(len(dependencies)):
+        visit(index, [])
+
+
+def resolve_dependencies(task_names, depends_on):
+    """
+    Resolves the 'depends_on' names of the tasks into the indexes of the tasks they depend on.
+    A task without 'depends_on' depends on the previous task, so the phases without the attribute
+    are executed in the declared order. A task can be referenced by its full or its class name.
+    """
+    dependencies = []
+
+    for index, task_name in enumerate(task_names):
+        references = depends_on[index]
+
+        if references is None:
+            dependencies.append([index - 1] if index > 0 else [])
+        else:
+            dependencies.append(sorted({_find_task(task_names, reference, task_name) for reference in references}))
+
+    _check_cycles(dependencies, task_names)
+    return dependencies
+
+
+def run_graph(dependencies, jobs, run, cancel = None):
+    """
+    Calls run(index) for each node once all its dependencies have finished. The ready nodes are started
+    in the order of their indexes. Up to 'jobs' nodes are executed at once. With a single job the nodes are
+    executed in the calling thread.
+    After the first failure no new nodes are started and cancel() is called to stop the running ones.
+    The first error is re-raised once the running nodes have finished.
+    """
+    dependents: list[list[int]] = [[] for _ in dependencies]
+    remaining = [len(node_dependencies) for node_dependencies in dependencies]
+
+    for index, node_dependencies in enumerate(dependencies):
+        for dependency in node_dependencies:
+            dependents[dependency].append(index)
+
+    ready = [index for index, count in enumerate(remaining) if count == 0]
+    heapq.heapify(ready)
+
+    def finished(index):
+        for dependent in dependents[index]:
+            remaining[dependent] -= 1
+            if remaining[dependent] == 0:
+                heapq.heappush(ready, dependent)
+
+    if jobs <= 1:
+        while ready:
+            index = heapq.heappop(ready)
+            run(index)
+            finished(index)
+        return
+
+    error = None
+
+    with ThreadPoolExecutor(max_workers = jobs) as executor:
+        running: dict[Future, int] = {}
+
+        try:
+            while ready or running:
+                while ready and len(running) < jobs and error is None:
+                    index = heapq.heappop(ready)
+                    running[executor.submit(run, index)] = index
+
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when = FIRST_COMPLETED)
+
+                for future in done:
+                    index = running.pop(future)
+                    future_error = future.exception()
+
+                    if future_error is None:
+                        finished(index)
+                    elif error is None:
+                        error = future_error
+                        if cancel is not None:
+                            cancel()
+        except BaseException:
+            # e.g. KeyboardInterrupt in the main thread. The running nodes are stopped before leaving
+            if cancel is not None:
+                cancel()
+            wait(running)
+            raise
+
+    if error is not None:
+        raise error
+
+
+def critical_path(dependencies, durations):
+    """
+    Returns the length and the node indexes of the longest path through the graph, where each node
+    takes its duration. That is the lower bound of the execution time with any number of jobs.
+    """
+    finish: dict[int, float] = {}
+    previous: dict[int, Optional[int]] = {}
+
+    def visit(index):
+        if index not in finish:
+            longest = None
+            for dependency in dependencies[index]:
+                if longest is None or visit(dependency) > finish[longest]:
+                    longest = dependency
+            previous[index] = longest
+            finish[index] = (finish[longest] if longest is not None else 0) + durations[index]
+        return finish[index]
+
+    if not dependencies:
+        return 0, []
+
+    last = max(range(len(dependencies)), key = visit)
+    path = []
+    index: Optional[int] = last
+
+    while index is not None:
+        path.append(index)
+        index = previous[index]
+
+    return finish[last], path[::-1]
+
+
+class ResourceRequest:
+    """
+    Resources, which a task needs while it is running.
+    cores - number of the CPU cores. memory - amount of the memory in megabytes.
+    exclusive - tags, e.g. "qemu". Only one running task can hold a tag.
+    """
+
+    def __init__(self, cores = 1, memory = 0, exclusive = ()):
+        if cores < 1 or memory < 0:
+            raise Exception(f"Wrong resource request: cores - '{cores}', memory - '{memory}'")
+
+        self.cores = cores
+        self.memory = memory
+        self.exclusive = frozenset(exclusive)
+
+    def __str__(self):
+        description = f"{self.cores} cores, {self.memory} MB of memory"
+        if self.exclusive:
+            description += ", exclusive " + ", ".join(sorted(self.exclusive))
+        return description
+
+
+class ResourcePool:
+    """
+    Admits the tasks only while their requests fit into the budget. The waiting tasks are admitted in the order
+    of their requests, so a big request is not starved by the small ones.
+    A request bigger than the budget is reduced to the budget, so such task runs alone.
+    """
+
+    # how often the waiting tasks check, whether they were cancelled
+    __CANCEL_CHECK_INTERVAL = 0.1
+
+    def __init__(self, cores, memory):
+        self.__condition = threading.Condition()
+        self.__cores = cores
+        self.__memory = memory
+        self.__free_cores = cores
+        self.__free_memory = memory
+        self.__held_tags: set[str] = set()
+        self.__waiting: Deque[int] = collections.deque()
+        self.__next_ticket = 0
+
+    def __fits(self, cores, memory, exclusive):
+        return cores <= self.__free_cores and memory <= self.__free_memory and not (exclusive & self.__held_tags)
+
+    def __granted(self, request):
+        return min(request.cores, self.__cores), min(request.memory, self.__memory)
+
+    def try_acquire(self, request):
+        """Returns the number of the granted cores or None, if the request does not fit right now."""
+        with self.__condition:
+            if self.__waiting:
+                return None
+            return self.__take(request)
+
+    def __take(self, request):
+        cores, memory = self.__granted(request)
+        if not self.__fits(cores, memory, request.exclusive):
+            return None
+
+        self.__free_cores -= cores
+        self.__free_memory -= memory
+        self.__held_tags |= request.exclusive
+        return cores
+
+    def acquire(self, request, cancelled = None):
+        """
+        Waits until the request fits and returns the number of the granted cores.
+        Returns None, if cancelled() became true while waiting.
+        """
+        with self.__condition:
+            ticket = self.__next_ticket
+            self.__next_ticket += 1
+            self.__waiting.append(ticket)
+
+            try:
+                while True:
+                    if self.__waiting[0] == ticket:
+                        cores = self.__take(request)
+                        if cores is not None:
+                            return cores
+
+                    if cancelled is not None and cancelled():
+                        return None
+
+                    self.__condition.wait(ResourcePool.__CANCEL_CHECK_INTERVAL)
+            finally:
+                self.__waiting.remove(ticket)
+                self.__condition.notify_all()
+
+    def release(self, request):
+        with self.__condition:
+            cores, memory = self.__granted(request)
+            self.__free_cores += cores
+            self.__free_memory += memory
+            self.__held_tags -= request.exclusive
+            self.__condition.notify_all()
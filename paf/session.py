@@ -0,0 +1,95 @@
+'''
+In-process API for the execution of the PAF elements.
+'''
+
+import os
+
+from paf import common
+from paf import paf_impl
+from paf import yaml_config
+
+
+class Session:
+    """
+    Executes the runs in the current process. Each run gets its own execution context and environment, while
+    the imported task modules are kept between the runs. The parsed configs and the SSH connections
+    are reused by all runs of the process.
+    """
+
+    def __init__(self):
+        self.__imported_modules = {}
+
+    def import_modules(self, import_module_dirs):
+        key = tuple(os.path.abspath(import_module_dir) for import_module_dir in import_module_dirs)
+        imported_modules = self.__imported_modules.get(key)
+
+        if imported_modules is None:
+            imported_modules = common.load_all_modules_in_dirs(import_module_dirs)
+            self.__imported_modules[key] = imported_modules
+
+        return imported_modules
+
+    # params - dict of the parameters, which override the ones from the configs.
+    # Returns the lines of the plan, if plan is set. Otherwise executes the elements
+    def run(self, configs = None, scenarios = None, params = None, phases = None, tasks = None,
+            import_module_dirs = None, log_dir = None, jobs = 1, prefetch = False,
+            yaml_configs = None, yaml_schemas = None, yaml_parameters = None, domain_yaml_parameters = None,
+            resume_journal = None, plan = False):
+        execution_context = paf_impl.ExecutionContext(log_dir)
+        execution_context.set_jobs(jobs)
+        execution_context.set_prefetch(prefetch)
+
+        environment = paf_impl.Environment()
+
+        if import_module_dirs:
+            execution_context.set_imported_modules(self.import_modules(import_module_dirs))
+
+        yaml_domains = yaml_config.discover_domains_with_overrides(import_module_dirs, domain_yaml_parameters)
+
+        for task_name in tasks or []:
+            execution_context.add_execution_element(paf_impl.ExecutionElement.ExecutionElementType_Task, task_name)
+
+        for phase_name in phases or []:
+            execution_context.add_execution_element(paf_impl.ExecutionElement.ExecutionElementType_Phase, phase_name)
+
+        for scenario_name in scenarios or []:
+            execution_context.add_execution_element(paf_impl.ExecutionElement.ExecutionElementType_Scenario, scenario_name)
+
+        # parse configuration files in order to get list of defined scenarios and phases
+        for config_path in configs or []:
+            execution_context.parse_config(config_path, execution_context, environment)
+
+        if yaml_configs:
+            case_config = yaml_config.load_case_config(yaml_configs, None)
+            case_config = yaml_config.apply_domain_defaults(case_config, yaml_domains)
+            yaml_config.apply_yaml_parameters(case_config, yaml_parameters)
+            schema_paths = yaml_config.resolve_schema_paths(case_config, yaml_domains, yaml_schemas)
+            yaml_config.validate_case_config(case_config, schema_paths)
+            yaml_config.register_phases(case_config, execution_context)
+            generated_config_path = yaml_config.write_expanded_config(case_config, log_dir or ".paf")
+
+            environment.setYamlConfig(case_config)
+            environment.setVariableValue("YAML_CONF_FILE", generated_config_path)
+            environment.setVariableValue("YAML_CONF_SOURCE_FILES", " ".join(yaml_configs))
+            if schema_paths:
+                environment.setVariableValue("YAML_CONF_SCHEMA_FILES", " ".join(schema_paths))
+
+            for name, value in yaml_config.project_config(case_config).items():
+                environment.setVariableValue(name, value)
+
+        for name, value in (params or {}).items():
+            environment.setVariableValue(name, value)
+
+        if plan:
+            return execution_context.plan(environment)
+
+        execution_context.execute(environment, resume_journal)
+        return None
+
+
+_default_session = Session()
+
+
+def run(configs = None, scenarios = None, params = None, **kwargs):
+    """Executes the elements in the default session of the process. See Session.run for the arguments."""
+    return _default_session.run(configs, scenarios, params, **kwargs)
@@ -0,0 +1,484 @@
+'''
+File transfer over the SFTP sessions of the cached SSH connections.
+'''
+
+import contextlib
+import errno
+import hashlib
+import json
+import os
+import posixpath
+import re
+import shlex
+import stat
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict
+
+
+# amount of bytes read and written at once
+_CHUNK_SIZE = 1024 * 1024
+# amount of bytes written by a stream between the saved checkpoints of its progress
+_SEGMENT_SIZE = 16 * 1024 * 1024
+
+# maximum length of a batched command, which computes the checksums of the remote files
+_MAX_COMMAND_LENGTH = 64 * 1024
+
+PART_SUFFIX = ".part"
+
+
+def format_size(size):
+    for unit in ("B", "KiB", "MiB"):
+        if size < 1024:
+            return f"{size:.1f} {unit}" if unit != "B" else f"{int(size)} B"
+        size /= 1024
+    return f"{size:.1f} GiB"
+
+
+class TransferResult:
+    def __init__(self, source, target, size, transferred, duration, streams, resumed):
+        self.source = source
+        self.target = target
+        self.size = size
+        # amount of bytes transferred during this call. Less than the size, if the transfer was resumed
+        self.transferred = transferred
+        self.duration = duration
+        self.streams = streams
+        self.resumed = resumed
+
+    def get_throughput(self):
+        return self.transferred / self.duration if self.duration > 0 else 0.0
+
+    def __str__(self):
+        resumed = ", resumed" if self.resumed else ""
+        return (f"Transferred '{self.source}' to '{self.target}': {format_size(self.transferred)} of "
+                f"{format_size(self.size)} in {self.duration:.1f}s, {format_size(self.get_throughput())}/s, "
+                f"{self.streams} streams{resumed}")
+
+
+def split_ranges(size, streams):
+    """Splits the file into up to 'streams' contiguous [start, end) ranges, each of at least one chunk."""
+    streams = max(1, min(streams, -(-size // _CHUNK_SIZE)))
+    step = max(1, -(-size // streams))
+    return [[start, min(start + step, size)] for start in range(0, size, step)] or [[0, 0]]
+
+
+class _TransferProgress:
+    """
+    Transferred part of each range, saved to a JSON file after each segment. An interrupted transfer continues
+    from the saved progress, if the source has the same size and modification time.
+    """
+
+    def __init__(self, path, source_stamp, ranges):
+        self.__path = path
+        self.__lock = threading.Lock()
+        self.__source_stamp = source_stamp
+        # start, end and the position up to which the range was transferred
+        self.ranges = [[start, end, start] for start, end in ranges]
+
+    @staticmethod
+    def load(path, source_stamp):
+        try:
+            with open(path, "r", encoding = "utf-8") as stream:
+                state = json.load(stream)
+        except (OSError, ValueError):
+            return None
+
+        if state.get("source") != source_stamp:
+            return None
+
+        progress = _TransferProgress(path, source_stamp, [])
+        progress.ranges = state["ranges"]
+        return progress
+
+    def get_remaining(self):
+        return sum(end - position for _, end, position in self.ranges)
+
+    def advance(self, index, position):
+        with self.__lock:
+            self.ranges[index][2] = position
+            self.save()
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.__path) or ".", exist_ok = True)
+        temporary_path = self.__path + ".tmp"
+        with open(temporary_path, "w", encoding = "utf-8") as stream:
+            json.dump({"source": self.__source_stamp, "ranges": self.ranges}, stream)
+        os.replace(temporary_path, self.__path)
+
+    def remove(self):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self.__path)
+
+
+class LocalFile:
+    def __init__(self, path):
+        self.path = path
+
+    def __str__(self):
+        return self.path
+
+    @contextlib.contextmanager
+    def session(self):
+        yield None
+
+    def stat(self, client, path):
+        try:
+            return os.stat(path)
+        except FileNotFoundError:
+            return None
+
+    def open_reader(self, client, start, end):
+        reader = open(self.path, "rb")
+        reader.seek(start)
+        return reader
+
+    def open_writer(self, client, part_path, start):
+        writer = open(part_path, "r+b")
+        writer.seek(start)
+        return writer
+
+    def create(self, client, part_path):
+        os.makedirs(os.path.dirname(part_path) or ".", exist_ok = True)
+        open(part_path, "wb").close()
+
+    def set_times(self, client, path, source_stat):
+        os.utime(path, (source_stat.st_atime, source_stat.st_mtime))
+
+    def finish(self, client, part_path, source_stat, preserve_times):
+        os.chmod(part_path, stat.S_IMODE(source_stat.st_mode))
+        if preserve_times:
+            self.set_times(client, part_path, source_stat)
+        os.replace(part_path, self.path)
+
+
+class RemoteFile:
+    """File on the remote host. Each stream of a transfer uses its own SFTP session."""
+
+    def __init__(self, sftp_session, path, location):
+        self.path = path
+        self.__sftp_session = sftp_session
+        self.__location = location
+
+    def __str__(self):
+        return f"{self.__location}:{self.path}"
+
+    def session(self):
+        return self.__sftp_session()
+
+    def stat(self, client, path):
+        try:
+            return client.stat(path)
+        except IOError as e:
+            if getattr(e, "errno", None) == errno.ENOENT:
+                return None
+            raise
+
+    def open_reader(self, client, start, end):
+        reader = client.open(self.path, "rb")
+        reader.seek(start)
+        # the read requests of the whole range are sent at once, so the latency is paid once
+        reader.prefetch(end)
+        return reader
+
+    def open_writer(self, client, part_path, start):
+        writer = client.open(part_path, "r+b")
+        writer.seek(start)
+        # the writes are not awaited one by one. Their errors are reported by close
+        writer.set_pipelined(True)
+        return writer
+
+    def create(self, client, part_path):
+        client.open(part_path, "wb").close()
+
+    def set_times(self, client, path, source_stat):
+        client.utime(path, (source_stat.st_atime, source_stat.st_mtime))
+
+    def finish(self, client, part_path, source_stat, preserve_times):
+        client.chmod(part_path, stat.S_IMODE(source_stat.st_mode))
+        if preserve_times:
+            self.set_times(client, part_path, source_stat)
+        try:
+            client.posix_rename(part_path, self.path)
+        except IOError:
+            # the server does not support the posix-rename extension, which replaces the existing file
+            if self.stat(client, self.path) is not None:
+                client.remove(self.path)
+            client.rename(part_path, self.path)
+
+
+def _copy_range(source, target, part_path, progress, index, check_cancelled, stream_context):
+    _, end, position = progress.ranges[index]
+    if position >= end:
+        return
+
+    with stream_context(), source.session() as source_client, target.session() as target_client:
+        with source.open_reader(source_client, position, end) as reader:
+            while position < end:
+                segment_end = min(position + _SEGMENT_SIZE, end)
+
+                # the progress is saved only after the writer is closed, as it reports the failed writes
+                with target.open_writer(target_client, part_path, position) as writer:
+                    while position < segment_end:
+                        if check_cancelled:
+                            check_cancelled()
+
+                        data = reader.read(min(_CHUNK_SIZE, segment_end - position))
+                        if not data:
+                            raise Exception(f"Unexpected end of '{source}' at the offset {position}")
+
+                        writer.write(data)
+                        position += len(data)
+
+                progress.advance(index, position)
+
+
+def get_state_path(state_dir, source, target):
+    return os.path.join(state_dir, hashlib.sha256(f"{source} -> {target}".encode()).hexdigest() + ".json")
+
+
+# check_cancelled - called before each chunk, raises to stop the transfer.
+# stream_context - returns the context manager, which is entered by the thread of each stream.
+# preserve_times - whether the target gets the modification time of the source
+def transfer(source, target, state_path, streams = 4, parallel_threshold = 64 * 1024 * 1024, resume = True,
+             check_cancelled = None, stream_context = contextlib.nullcontext, preserve_times = False):
+    """
+    Copies the source file to the target one. The data is written to the target path with the '.part' suffix,
+    which is renamed to the target path at the end. The files of at least 'parallel_threshold' bytes are split into
+    the ranges, which are copied by the separate streams. If resume is set, an interrupted transfer of the same
+    source continues from the progress saved to the state path.
+    """
+    started = time.monotonic()
+    part_path = target.path + PART_SUFFIX
+
+    with source.session() as source_client, target.session() as target_client:
+        source_stat = source.stat(source_client, source.path)
+        if source_stat is None:
+            raise Exception(f"Source file '{source}' does not exist")
+
+        source_stamp = [str(source), str(target), source_stat.st_size, source_stat.st_mtime]
+        progress = None
+
+        if resume and target.stat(target_client, part_path) is not None:
+            progress = _TransferProgress.load(state_path, source_stamp)
+
+        resumed = progress is not None
+
+        if progress is None:
+            stream_count = streams if source_stat.st_size >= parallel_threshold else 1
+            progress = _TransferProgress(state_path, source_stamp, split_ranges(source_stat.st_size, stream_count))
+            target.create(target_client, part_path)
+            progress.save()
+
+    remaining = progress.get_remaining()
+
+    with ThreadPoolExecutor(max_workers = len(progress.ranges)) as executor:
+        futures = [executor.submit(_copy_range, source, target, part_path, progress, index, check_cancelled,
+                                   stream_context)
+                   for index in range(len(progress.ranges))]
+        for future in futures:
+            future.result()
+
+    with target.session() as target_client:
+        target.finish(target_client, part_path, source_stat, preserve_times)
+
+    progress.remove()
+    return TransferResult(str(source), str(target), source_stat.st_size, remaining, time.monotonic() - started,
+                          len(progress.ranges), resumed)
+
+
+class SyncResult:
+    def __init__(self, source, target):
+        self.source = source
+        self.target = target
+        # relative paths of the files
+        self.transferred = []
+        self.unchanged = []
+        self.deleted = []
+        self.transfers = []
+        self.duration = 0.0
+
+    def get_transferred_size(self):
+        return sum(result.transferred for result in self.transfers)
+
+    def __str__(self):
+        return (f"Synchronized '{self.source}' to '{self.target}': {len(self.transferred)} of "
+                f"{len(self.transferred) + len(self.unchanged)} files transferred, "
+                f"{format_size(self.get_transferred_size())} in {self.duration:.1f}s, "
+                f"{len(self.deleted)} deleted")
+
+
+def list_local_files(directory):
+    """Stats of the files under the directory by their relative paths."""
+    files = {}
+    for root, _, file_names in os.walk(directory):
+        for file_name in file_names:
+            path = os.path.join(root, file_name)
+            files[os.path.relpath(path, directory).replace(os.sep, "/")] = os.stat(path)
+    return files
+
+
+def list_remote_files(client, directory):
+    """Attributes of the files under the remote directory by their relative paths and the relative paths of its
+    subdirectories. The subdirectories are None, if the directory does not exist."""
+    files: Dict[str, Any] = {}
+    directories = set()
+    pending = [""]
+
+    while pending:
+        relative_directory = pending.pop()
+        try:
+            entries = client.listdir_attr(_join(directory, relative_directory))
+        except IOError as e:
+            if relative_directory or getattr(e, "errno", None) != errno.ENOENT:
+                raise
+            return files, None
+
+        for entry in entries:
+            relative_path = _join(relative_directory, entry.filename) if relative_directory else entry.filename
+            if stat.S_ISDIR(entry.st_mode):
+                directories.add(relative_path)
+                pending.append(relative_path)
+            else:
+                files[relative_path] = entry
+
+    return files, directories
+
+
+def _join(directory, relative_path):
+    return directory.rstrip("/") + "/" + relative_path if relative_path else directory
+
+
+def get_checksum_commands(directory, relative_paths):
+    """Commands, which print the SHA-256 of the files. The files are batched into as few commands as possible."""
+    prefix = f"cd {shlex.quote(directory)} && sha256sum"
+    commands = []
+    command = prefix
+
+    for relative_path in relative_paths:
+        argument = " " + shlex.quote("./" + relative_path)
+        if command != prefix and len(command) + len(argument) > _MAX_COMMAND_LENGTH:
+            commands.append(command)
+            command = prefix
+        command += argument
+
+    if command != prefix:
+        commands.append(command)
+    return commands
+
+
+def parse_checksums(output):
+    checksums = {}
+    for line in output.splitlines():
+        match = re.match(r"^([0-9a-fA-F]{64}) [ *]\./(.*)$", line.rstrip("\r"))
+        if match:
+            checksums[match.group(2)] = match.group(1).lower()
+    return checksums
+
+
+def get_local_checksum(path):
+    checksum = hashlib.sha256()
+    with open(path, "rb") as stream:
+        for data in iter(lambda: stream.read(_CHUNK_SIZE), b""):
+            checksum.update(data)
+    return checksum.hexdigest()
+
+
+def _make_remote_dirs(client, directory, existing):
+    if not directory or directory in existing:
+        return
+
+    parent = posixpath.dirname(directory.rstrip("/"))
+    if parent != directory:
+        _make_remote_dirs(client, parent, existing)
+
+    try:
+        client.stat(directory)
+    except IOError as e:
+        if getattr(e, "errno", None) != errno.ENOENT:
+            raise
+        client.mkdir(directory)
+    existing.add(directory)
+
+
+# exec_command - executes the command on the remote host and returns its output. Used only if checksum is set.
+# See transfer for the rest of the parameters
+def sync_directory(local_directory, remote_directory, sftp_session, location, exec_command, state_dir,
+                   streams = 4, parallel_threshold = 64 * 1024 * 1024, checksum = False, delete = False,
+                   check_cancelled = None, stream_context = contextlib.nullcontext):
+    """
+    Uploads the files of the local directory, which differ from the remote ones. A file is considered unchanged,
+    if the remote one has the same size and modification time. If checksum is set, the files of the same size,
+    but with another modification time, are compared by the SHA-256, computed on the remote host. The changed
+    files are transferred in parallel and get the modification time of the local ones. If delete is set,
+    the remote files, which do not exist locally, are removed.
+    """
+    started = time.monotonic()
+    result = SyncResult(local_directory, f"{location}:{remote_directory}")
+    local_files = list_local_files(local_directory)
+
+    with sftp_session() as client:
+        remote_files, remote_directories = list_remote_files(client, remote_directory)
+        existing_directories = set() if remote_directories is None else \
+            {_join(remote_directory, relative_path) for relative_path in remote_directories} | {remote_directory}
+
+        changed = []
+        same_size = []
+        for relative_path, local_stat in sorted(local_files.items()):
+            remote_stat = remote_files.get(relative_path)
+            if remote_stat is None or remote_stat.st_size != local_stat.st_size:
+                changed.append(relative_path)
+            elif int(remote_stat.st_mtime) == int(local_stat.st_mtime):
+                result.unchanged.append(relative_path)
+            else:
+                same_size.append(relative_path)
+
+        if checksum and same_size:
+            remote_checksums = {}
+            for command in get_checksum_commands(remote_directory, same_size):
+                remote_checksums.update(parse_checksums(str(exec_command(command))))
+
+            for relative_path in same_size:
+                local_path = os.path.join(local_directory, relative_path)
+                if remote_checksums.get(relative_path) == get_local_checksum(local_path):
+                    # the next synchronization does not need to compare the content again
+                    local_stat = local_files[relative_path]
+                    client.utime(_join(remote_directory, relative_path), (local_stat.st_atime, local_stat.st_mtime))
+                    result.unchanged.append(relative_path)
+                else:
+                    changed.append(relative_path)
+        else:
+            changed.extend(same_size)
+
+        changed.sort()
+        result.unchanged.sort()
+
+        for relative_path in changed:
+            _make_remote_dirs(client, _join(remote_directory, os.path.dirname(relative_path)), existing_directories)
+
+        if delete:
+            for relative_path in sorted(remote_files):
+                # the parts of the interrupted transfers are kept, so that they can be resumed
+                is_part = relative_path.endswith(PART_SUFFIX) and \
+                    relative_path[:-len(PART_SUFFIX)] in local_files
+                if relative_path not in local_files and not is_part:
+                    client.remove(_join(remote_directory, relative_path))
+                    result.deleted.append(relative_path)
+
+    def upload(relative_path):
+        with stream_context():
+            source = LocalFile(os.path.join(local_directory, relative_path))
+            target = RemoteFile(sftp_session, _join(remote_directory, relative_path), location)
+            return transfer(source, target, get_state_path(state_dir, source, target), streams, parallel_threshold,
+                            check_cancelled = check_cancelled, stream_context = stream_context,
+                            preserve_times = True)
+
+    with ThreadPoolExecutor(max_workers = max(1, streams)) as executor:
+        futures = [executor.submit(upload, relative_path) for relative_path in changed]
+        for relative_path, future in zip(changed, futures):
+            result.transfers.append(future.result())
+            result.transferred.append(relative_path)
+
+    result.duration = time.monotonic() - started
+    return result
@@ -0,0 +1,154 @@
+'''
+Persistent state of the tasks, used to skip the tasks, whose inputs and outputs did not change.
+'''
+
+import glob
+import hashlib
+import json
+import os
+import re
+import time
+
+from paf import common
+
+
+# amount of bytes read at once while hashing a file
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def _hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as stream:
+        for chunk in iter(lambda: stream.read(_HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_value(value):
+    return hashlib.sha256(json.dumps(value, sort_keys = True).encode("utf-8")).hexdigest()
+
+
+def pattern_root(pattern):
+    """The directory, which precedes the first component of the glob pattern with the wildcards."""
+    components = pattern.split(os.sep)
+
+    for index, component in enumerate(components):
+        if re.search(r"[*?[]", component):
+            return os.sep.join(components[:index]) or (os.sep if pattern.startswith(os.sep) else ".")
+
+    return os.path.dirname(pattern) or "."
+
+
+def expand_file_patterns(patterns):
+    """Returns the sorted files matched by each of the glob patterns. '**' matches any number of directories."""
+    return [(pattern, sorted(path for path in glob.glob(pattern, recursive = True) if os.path.isfile(path)))
+            for pattern in patterns]
+
+
+class TaskStateDB:
+    """
+    SQLite database with the fingerprints of the executed tasks.
+    The digests of the files are cached by their size and modification time, so that
+    the unchanged files are not read again.
+    """
+
+    def __init__(self, path):
+        self.__path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok = True)
+
+        with self.__connect() as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS task_state ("
+                               "task_key TEXT PRIMARY KEY, input_fingerprint TEXT, output_fingerprint TEXT, "
+                               "updated REAL)")
+            connection.execute("CREATE TABLE IF NOT EXISTS file_digest ("
+                               "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, digest TEXT)")
+
+    def __connect(self):
+        return common.connect_db(self.__path)
+
+    def get_fingerprints(self, task_key):
+        with self.__connect() as connection:
+            row = connection.execute("SELECT input_fingerprint, output_fingerprint FROM task_state WHERE task_key = ?",
+                                     (task_key,)).fetchone()
+        return tuple(row) if row else None
+
+    def set_fingerprints(self, task_key, input_fingerprint, output_fingerprint):
+        with self.__connect() as connection:
+            connection.execute("INSERT OR REPLACE INTO task_state VALUES (?, ?, ?, ?)",
+                               (task_key, input_fingerprint, output_fingerprint, time.time()))
+
+    def file_digests(self, paths):
+        """Returns the digests of the files. Only the files, which changed since the last call, are read."""
+        stats = {path: os.stat(path) for path in paths}
+        digests = {}
+
+        with self.__connect() as connection:
+            for path, stat in stats.items():
+                row = connection.execute("SELECT size, mtime_ns, digest FROM file_digest WHERE path = ?",
+                                         (os.path.abspath(path),)).fetchone()
+                if row and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+                    digests[path] = row[2]
+
+            for path, stat in stats.items():
+                if path not in digests:
+                    digests[path] = _hash_file(path)
+                    connection.execute("INSERT OR REPLACE INTO file_digest VALUES (?, ?, ?, ?)",
+                                       (os.path.abspath(path), stat.st_size, stat.st_mtime_ns, digests[path]))
+
+        return digests
+
+    def fingerprint_files(self, patterns):
+        """
+        Fingerprint of the content of the files matched by the patterns. None, if a pattern does not match
+        any file, so that the missing outputs are never considered up to date.
+        The paths are taken relative to the pattern roots, so the same files in another checkout have
+        the same fingerprint.
+        """
+        expanded = expand_file_patterns(patterns)
+
+        if any(not paths for _, paths in expanded):
+            return None
+
+        digests = self.file_digests([path for _, paths in expanded for path in paths])
+        return hash_value([[(os.path.relpath(path, pattern_root(pattern)), digests[path]) for path in paths]
+                           for pattern, paths in expanded])
+
+
+class UpToDateCheck:
+    """
+    Compares the fingerprints of the inputs and the outputs of a task with the ones stored after its last
+    successful execution.
+    """
+
+    def __init__(self, state_db, task_key, parameters, input_patterns, output_patterns):
+        self.__state_db = state_db
+        self.__task_key = task_key
+        self.__output_patterns = output_patterns
+
+        input_files_fingerprint = state_db.fingerprint_files(input_patterns) if input_patterns else ""
+        self.__input_fingerprint = hash_value([parameters, input_patterns, input_files_fingerprint])
+        self.__content_fingerprint = hash_value([parameters, input_files_fingerprint])
+
+    # fingerprint of the values of the inputs, which does not depend on the location of the input files
+    def get_content_fingerprint(self):
+        return self.__content_fingerprint
+
+    def is_up_to_date(self):
+        stored = self.__state_db.get_fingerprints(self.__task_key)
+
+        if stored is None or stored[0] != self.__input_fingerprint:
+            return False
+
+        output_fingerprint = self.__output_fingerprint()
+        return output_fingerprint is not None and stored[1] == output_fingerprint
+
+    def __output_fingerprint(self):
+        if not self.__output_patterns:
+            return ""
+        return self.__state_db.fingerprint_files(self.__output_patterns)
+
+    # to be called after the successful execution of the task
+    def store(self):
+        self.__state_db.set_fingerprints(self.__task_key, self.__input_fingerprint, self.__output_fingerprint())
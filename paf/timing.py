@@ -0,0 +1,62 @@
+'''
+Historical durations of the scenarios, phases, tasks and commands.
+'''
+
+import os
+import statistics
+import uuid
+
+from paf import common
+
+
+TIMING_DB_FILE_NAME = "timings.db"
+
+# number of the last successful executions, which are used to estimate the duration
+_ESTIMATION_WINDOW = 10
+
+
+class TimingDB:
+    """SQLite database with the durations of the executed elements. Each execution is a separate row."""
+
+    def __init__(self, path):
+        self.__path = path
+        self.__run_id = uuid.uuid4().hex
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok = True)
+
+        with self.__connect() as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS durations ("
+                               "run_id TEXT, kind TEXT, scope TEXT, name TEXT, "
+                               "started REAL, duration REAL, succeeded INTEGER)")
+            connection.execute("CREATE INDEX IF NOT EXISTS durations_by_name ON durations (kind, name, succeeded)")
+
+    def __connect(self):
+        return common.connect_db(self.__path)
+
+    # kind - "scenario", "phase", "task" or "command". scope - the name of the enclosing element
+    def record(self, kind, scope, name, started, duration, succeeded):
+        with self.__connect() as connection:
+            connection.execute("INSERT INTO durations VALUES (?, ?, ?, ?, ?, ?, ?)",
+                               (self.__run_id, kind, scope, name, started, duration, int(succeeded)))
+
+    def expected_duration(self, kind, name):
+        """Median of the last successful executions. None, if there were no such executions."""
+        with self.__connect() as connection:
+            rows = connection.execute("SELECT duration FROM durations WHERE kind = ? AND name = ? AND succeeded = 1 "
+                                      "ORDER BY started DESC LIMIT ?", (kind, name, _ESTIMATION_WINDOW)).fetchall()
+        return statistics.median(row[0] for row in rows) if rows else None
+
+
+def format_duration(seconds):
+    if seconds is None:
+        return "unknown"
+
+    minutes, seconds = divmod(round(seconds, 1), 60)
+    hours, minutes = divmod(int(minutes), 60)
+
+    if hours:
+        return f"{hours}h {minutes:02d}m {int(seconds):02d}s"
+    if minutes:
+        return f"{minutes}m {int(seconds):02d}s"
+    return f"{seconds:.1f}s"
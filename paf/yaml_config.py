@@ -12,6 +12,9 @@ import yaml
 from jsonschema import Draft202012Validator
 from jsonschema.exceptions import best_match
 
+from paf import common
+from paf import paf_impl
+from paf import scheduler
 from paf.paf_impl import logger
 
 
@@ -94,6 +97,44 @@ DOCKER_CONTAINER_SCHEMA = {
 }
 
 
+PHASE_TASK_SCHEMA = {
+    "oneOf": [
+        {"type": "string", "minLength": 1},
+        {
+            "type": "object",
+            "required": ["name"],
+            "properties": {
+                "name": {"type": "string", "minLength": 1},
+                "depends_on": {
+                    "type": ["string", "array"],
+                    "items": {"type": "string", "minLength": 1},
+                },
+                "conditions": {
+                    "type": "object",
+                    "additionalProperties": {
+                        "type": ["string", "number", "boolean"],
+                    },
+                },
+            },
+            "additionalProperties": False,
+        },
+    ],
+}
+
+
+PHASE_SCHEMA = {
+    "type": "object",
+    "required": ["tasks"],
+    "properties": {
+        "tasks": {
+            "type": "array",
+            "items": PHASE_TASK_SCHEMA,
+        },
+    },
+    "additionalProperties": False,
+}
+
+
 BUILTIN_CASE_SCHEMA = {
     "$schema": "https://json-schema.org/draft/2020-12/schema",
     "type": "object",
@@ -119,6 +160,10 @@ BUILTIN_CASE_SCHEMA = {
             },
             "additionalProperties": False,
         },
+        "phases": {
+            "type": "object",
+            "additionalProperties": PHASE_SCHEMA,
+        },
     },
     "additionalProperties": True,
 }
@@ -177,17 +222,28 @@ DOMAIN_DESCRIPTOR_SCHEMA = {
 }
 
 
+# parsed YAML files by their stamps, so that the runs in one process do not parse the unchanged files again
+_loaded_yaml_files: dict[tuple, dict] = {}
+
+
 def load_yaml_file(path):
-    with open(path, "r", encoding="utf-8") as stream:
-        loaded = yaml.safe_load(stream)
+    stamp = common.file_stamp(path)
+    loaded = _loaded_yaml_files.get(stamp)
 
     if loaded is None:
-        return {}
+        with open(path, "r", encoding="utf-8") as stream:
+            loaded = yaml.safe_load(stream)
 
-    if not isinstance(loaded, dict):
-        raise Exception(f"YAML config '{path}' must contain an object at the document root")
+        if loaded is None:
+            loaded = {}
 
-    return loaded
+        if not isinstance(loaded, dict):
+            raise Exception(f"YAML config '{path}' must contain an object at the document root")
+
+        _loaded_yaml_files[stamp] = loaded
+
+    # the callers modify the loaded config
+    return copy.deepcopy(loaded)
 
 
 def deep_merge(base, overlay):
@@ -482,3 +538,24 @@ def write_expanded_config(config, output_root):
         stream.write("\n")
 
     return output_path
+
+
+def _phase_task_depends_on(task):
+    depends_on = task.get("depends_on")
+    if isinstance(depends_on, str):
+        return scheduler.parse_depends_on(depends_on)
+    return depends_on
+
+
+def register_phases(config, execution_context):
+    for phase_name, phase_config in config.get("phases", {}).items():
+        phase = paf_impl.Phase()
+
+        for task in phase_config["tasks"]:
+            if isinstance(task, str):
+                task = {"name": task}
+
+            conditions = {name: _stringify_value(value) for name, value in task.get("conditions", {}).items()}
+            phase.add_task(task["name"], conditions, _phase_task_depends_on(task))
+
+        execution_context.add_available_phase(phase_name, phase)
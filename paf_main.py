@@ -4,14 +4,20 @@ Created on Dec 29, 2021
 @author: vladyslav_goncharuk
 '''
 
+import copy
+import os
 import re
+import shlex
+import time
 from argparse import ArgumentParser
+from functools import partial
 
+from paf import matrix
 from paf import paf_impl
-from paf import yaml_config
 from paf.paf_impl import logger
+from paf.session import Session
 
-def main():
+def create_argument_parser():
     parser = ArgumentParser()
     parser.add_argument("-t", "--task", dest="tasks",
                         help="task to be executed", metavar="TASK", action="append")
@@ -35,71 +41,188 @@ def main():
                         help="import module directories", metavar="IMP", action="append")
     parser.add_argument("-ld", "--log-dir", dest="log_dir",
                         help="output of the script will be stored to this directory. If not set - output is not stored.", metavar="LOG_FILE")
+    parser.add_argument("-j", "--jobs", dest="jobs", type=int, default=1,
+                        help="maximum number of the tasks of a phase, which are executed in parallel", metavar="JOBS")
+    parser.add_argument("-pf", "--prefetch", dest="prefetch", action="store_true",
+                        help="execute the prefetchable tasks of the next phases of a scenario in the background")
+    parser.add_argument("-f", "--force", dest="force", action="store_true",
+                        help="execute all tasks, even if they are up to date")
+    parser.add_argument("-ft", "--force-task", dest="force_tasks",
+                        help="task to be executed, even if it is up to date", metavar="FORCE_TASK", action="append")
+    parser.add_argument("-rc", "--cores", dest="cores", type=int,
+                        help="number of the CPU cores shared by the tasks executed in parallel. Machine's number by default", metavar="CORES")
+    parser.add_argument("-rm", "--memory", dest="memory", type=int,
+                        help="megabytes of the memory shared by the tasks executed in parallel. Machine's memory by default", metavar="MEMORY")
+    parser.add_argument("-js", "--jobserver", dest="jobserver", action="store_true",
+                        help="share one GNU make jobserver with the resource cores as its slots between all sub-processes. Requires GNU make 4.4+")
+    parser.add_argument("-ac", "--artifact-cache", dest="artifact_cache",
+                        help="directory of the cache of the task outputs. If not set - outputs are not cached", metavar="ARTIFACT_CACHE")
+    parser.add_argument("-acs", "--artifact-cache-size", dest="artifact_cache_size", type=int, default=10 * 1024,
+                        help="size limit of the artifact cache in megabytes", metavar="ARTIFACT_CACHE_SIZE")
+    parser.add_argument("-r", "--resume", dest="resume",
+                        help="skip the tasks completed in the run with this journal or log directory", metavar="JOURNAL")
+    parser.add_argument("-pl", "--plan", dest="plan", action="store_true",
+                        help="print the elements to be executed with their expected durations and the critical path instead of executing them")
+    parser.add_argument("-m", "--matrix", dest="matrix",
+                        help="execute the elements for each combination of the values in NAME=VALUE1,VALUE2 form", metavar="MATRIX", action="append")
+    parser.add_argument("-mj", "--matrix-jobs", dest="matrix_jobs", type=int, default=0,
+                        help="maximum number of the matrix cases, which are executed in parallel. 0 means all of them", metavar="MATRIX_JOBS")
+    parser.add_argument("-b", "--batch", dest="batch",
+                        help="file with the arguments of a run per line. The runs are executed one by one in this process", metavar="BATCH")
+
+    return parser
+
+# runs of the process share the imported modules
+session = Session()
+
+def parse_parameters(parameters):
+    result = {}
+
+    for parameter in parameters or []:
+        splited_parameter = re.compile("[ ]*=[ ]*").split(parameter)
+        if len(splited_parameter) == 2:
+            result[splited_parameter[0]] = splited_parameter[1]
+
+    return result
+
+def execute(args, matrix_parameters = {}, log_dir = None, resume_journal = None):
+    # matrix parameters override all other sources of the same parameter
+    params = parse_parameters(args.parameters)
+    params.update(matrix_parameters)
+
+    plan = session.run(configs = args.configs,
+                       scenarios = args.scenarios,
+                       params = params,
+                       phases = args.phases,
+                       tasks = args.tasks,
+                       import_module_dirs = args.import_module_dirs,
+                       log_dir = log_dir,
+                       jobs = args.jobs,
+                       prefetch = args.prefetch,
+                       yaml_configs = args.yaml_configs,
+                       yaml_schemas = args.yaml_schemas,
+                       yaml_parameters = args.yaml_parameters,
+                       domain_yaml_parameters = args.domain_yaml_parameters,
+                       resume_journal = resume_journal,
+                       plan = args.plan)
+
+    for line in plan or []:
+        logger.info(line)
+
+def execute_matrix_case(args, case):
+    # each case is resumed from the journal in its own sub-directory of the resumed log directory
+    resume_journal = matrix.case_log_dir(args.resume, case)
+    execute(args, case, matrix.case_log_dir(args.log_dir, case), resume_journal)
+
+def execute_matrix(args):
+    # the journals of the cases are found by their sub-directories, while a journal file belongs to one run
+    if args.resume and not os.path.isdir(args.resume):
+        raise Exception(f"In the matrix mode '--resume' takes the log directory of the resumed matrix run. "
+                        f"'{args.resume}' is not a directory.")
+
+    cases = matrix.expand_matrix(args.matrix)
+
+    logger.init()
+    logger.info(f"Matrix execution of {len(cases)} cases")
+
+    # the forked cases share one jobserver
+    with paf_impl._shared_jobserver():
+        results = matrix.run_matrix(cases, partial(execute_matrix_case, args), args.matrix_jobs)
+    summary = matrix.format_summary(results)
+
+    for line in summary:
+        logger.info(line)
+
+    if args.log_dir:
+        os.makedirs(args.log_dir, exist_ok=True)
+        with open(os.path.join(args.log_dir, "matrix_summary.log"), "w", encoding="utf-8") as stream:
+            stream.write("\n".join(summary) + "\n")
+
+    failed = [result for result in results if not result.succeeded]
+    if failed:
+        raise Exception(f"{len(failed)} of {len(results)} matrix cases failed")
+
+def configure(args):
+    paf_impl.Config.set_force_all_tasks(args.force)
+    paf_impl.Config.set_forced_tasks(args.force_tasks or [])
+    paf_impl.Config.set_artifact_cache_dir(args.artifact_cache)
+    if args.cores:
+        paf_impl.Config.set_resource_cores(args.cores)
+    if args.memory:
+        paf_impl.Config.set_resource_memory(args.memory)
+    paf_impl.Config.set_jobserver(args.jobserver)
+    paf_impl.Config.set_artifact_cache_max_size(args.artifact_cache_size * 1024 * 1024)
+
+def execute_arguments(args):
+    if args.matrix:
+        execute_matrix(args)
+    else:
+        execute(args, log_dir = args.log_dir, resume_journal = args.resume)
+
+def read_batch(path):
+    """Returns the arguments of each run. Empty lines and comments are skipped."""
+    with open(path, "r", encoding="utf-8") as stream:
+        return [arguments for arguments in (shlex.split(line, comments=True) for line in stream) if arguments]
+
+def execute_batch(parser, args):
+    # the arguments of each run are added to the ones of the command line. All runs are parsed before the first one
+    runs = []
+    for index, arguments in enumerate(read_batch(args.batch)):
+        run_args = parser.parse_args(arguments, namespace=copy.deepcopy(args))
+        run_args.batch = None
+        if args.log_dir and run_args.log_dir == args.log_dir:
+            run_args.log_dir = os.path.join(args.log_dir, f"batch_{index}")
+        runs.append((" ".join(arguments), run_args))
+
+    logger.init()
+    logger.info(f"Batch execution of {len(runs)} runs")
+
+    cores = paf_impl.Config.get_resource_cores()
+    memory = paf_impl.Config.get_resource_memory()
+    results = []
+
+    for label, run_args in runs:
+        started = time.monotonic()
+        error = None
+
+        try:
+            configure(run_args)
+            execute_arguments(run_args)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        finally:
+            paf_impl.Config.set_resource_cores(cores)
+            paf_impl.Config.set_resource_memory(memory)
+
+        result = matrix.MatrixCaseResult(label, error is None, time.monotonic() - started, error)
+        logger.info(f"Batch run '{label}' {'succeeded' if result.succeeded else 'failed'} after {result.duration:.1f}s")
+        results.append(result)
+
+    summary = matrix.format_summary(results, label=str)
+
+    for line in summary:
+        logger.info(line)
+
+    if args.log_dir:
+        os.makedirs(args.log_dir, exist_ok=True)
+        with open(os.path.join(args.log_dir, "batch_summary.log"), "w", encoding="utf-8") as stream:
+            stream.write("\n".join(summary) + "\n")
+
+    failed = [result for result in results if not result.succeeded]
+    if failed:
+        raise Exception(f"{len(failed)} of {len(results)} batch runs failed")
 
+def main():
+    parser = create_argument_parser()
     args = parser.parse_args()
 
-    execution_context = paf_impl.ExecutionContext(args.log_dir)
-
-    environment = paf_impl.Environment()
-
-    # Get import module search paths
-    import_module_dirs = args.import_module_dirs
-    if import_module_dirs:
-        execution_context.import_modules(import_module_dirs)
-
-    yaml_domains = yaml_config.discover_domains_with_overrides(import_module_dirs, args.domain_yaml_parameters)
-
-    # From the command line parse the elements, which we need to execute
-    tasks = args.tasks
-    if tasks:
-        for task_name in tasks:
-            execution_context.add_execution_element(paf_impl.ExecutionElement.ExecutionElementType_Task, task_name)
-
-    phases = args.phases
-    if phases:
-        for phase_name in phases:
-            execution_context.add_execution_element(paf_impl.ExecutionElement.ExecutionElementType_Phase, phase_name)
-
-    scenarios = args.scenarios
-    if scenarios:
-        for scenario_name in scenarios:
-            execution_context.add_execution_element(paf_impl.ExecutionElement.ExecutionElementType_Scenario, scenario_name)
-
-    # parse configuration files in order to get list of defined scenarios and phases
-    configs = args.configs
-    if configs:
-        for config_path in configs:
-            execution_context.parse_config(config_path, execution_context, environment)
-
-    if args.yaml_configs:
-        case_config = yaml_config.load_case_config(args.yaml_configs, None)
-        case_config = yaml_config.apply_domain_defaults(case_config, yaml_domains)
-        yaml_config.apply_yaml_parameters(case_config, args.yaml_parameters)
-        schema_paths = yaml_config.resolve_schema_paths(case_config, yaml_domains, args.yaml_schemas)
-        yaml_config.validate_case_config(case_config, schema_paths)
-        generated_root = args.log_dir or ".paf"
-        generated_config_path = yaml_config.write_expanded_config(case_config, generated_root)
-
-        environment.setYamlConfig(case_config)
-        environment.setVariableValue("YAML_CONF_FILE", generated_config_path)
-        environment.setVariableValue("YAML_CONF_SOURCE_FILES", " ".join(args.yaml_configs))
-        if schema_paths:
-            environment.setVariableValue("YAML_CONF_SCHEMA_FILES", " ".join(schema_paths))
-
-        for name, value in yaml_config.project_config(case_config).items():
-            environment.setVariableValue(name, value)
-
-    # From the command line parse parameters
-    parameters = args.parameters
-
-    if parameters:
-        for parameter in parameters:
-            splited_parameter = re.compile("[ ]*=[ ]*").split(parameter)
-            if len(splited_parameter) == 2:
-                environment.setVariableValue(splited_parameter[0], splited_parameter[1])
-
-    execution_context.execute(environment)
+    if args.batch:
+        execute_batch(parser, args)
+    else:
+        configure(args)
+        execute_arguments(args)
 
     logger.info(f"Last trace ...")
 
-main()
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+import hashlib
+import logging
+import os
+import threading
+
+import pytest
+from pathlib import Path
+
+from paf.artifact_cache import ArtifactCache
+from paf.paf_impl import Config
+from paf.paf_impl import Environment
+from paf.paf_impl import Task
+
+
+def write_file(path, content):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content, encoding="utf-8")
+
+
+def test_artifact_cache_restores_outputs_into_another_checkout(tmp_path):
+    cache = ArtifactCache(str(tmp_path / "cache"), 1024 * 1024)
+    first = tmp_path / "first" / "deploy"
+    write_file(first / "zImage", "kernel")
+    write_file(first / "dtbs" / "board.dtb", "dtb")
+    os.chmod(first / "zImage", 0o755)
+
+    stored = cache.store("kernel:abc", [str(first / "**" / "*")])
+    assert (stored.files, stored.size) == (2, 9)
+
+    second = tmp_path / "second" / "deploy"
+    assert cache.restore("kernel:other", [str(second / "**" / "*")]) is None
+
+    restored = cache.restore("kernel:abc", [str(second / "**" / "*")])
+
+    assert (restored.files, restored.size) == (2, 9)
+    assert (second / "dtbs" / "board.dtb").read_text(encoding="utf-8") == "dtb"
+    assert os.stat(second / "zImage").st_nlink == 1
+    assert os.stat(second / "zImage").st_mode & 0o777 == 0o755
+    assert os.stat(second / "dtbs" / "board.dtb").st_mode & 0o777 == 0o644
+
+
+def test_artifact_cache_objects_survive_writes_to_restored_files(tmp_path):
+    cache = ArtifactCache(str(tmp_path / "cache"), 1024 * 1024)
+    write_file(tmp_path / "first" / "zImage", "kernel")
+    cache.store("kernel", [str(tmp_path / "first" / "*")])
+
+    cache.restore("kernel", [str(tmp_path / "second" / "*")])
+    with open(tmp_path / "second" / "zImage", "w", encoding="utf-8") as stream:
+        stream.write("patched")
+
+    cache.restore("kernel", [str(tmp_path / "third" / "*")])
+    assert (tmp_path / "second" / "zImage").read_text(encoding="utf-8") == "patched"
+    assert (tmp_path / "third" / "zImage").read_text(encoding="utf-8") == "kernel"
+
+
+def set_entry_usage_time(cache_dir, key, usage_time):
+    entry = cache_dir / "entries" / (hashlib.sha256(key.encode("utf-8")).hexdigest() + ".json")
+    os.utime(entry, (usage_time, usage_time))
+
+
+def test_artifact_cache_evicts_least_recently_used_entries(tmp_path):
+    cache_dir = tmp_path / "cache"
+    cache = ArtifactCache(str(cache_dir), 10)
+    for name in ("a", "b", "c"):
+        write_file(tmp_path / name / "out.bin", name * 4)
+
+    cache.store("a", [str(tmp_path / "a" / "*.bin")])
+    cache.store("b", [str(tmp_path / "b" / "*.bin")])
+    set_entry_usage_time(cache_dir, "a", 2000)
+    set_entry_usage_time(cache_dir, "b", 1000)
+
+    cache.store("c", [str(tmp_path / "c" / "*.bin")])
+
+    assert cache.restore("b", [str(tmp_path / "b2" / "*.bin")]) is None
+    assert cache.restore("a", [str(tmp_path / "a2" / "*.bin")]) is not None
+    assert cache.restore("c", [str(tmp_path / "c2" / "*.bin")]) is not None
+    objects = [name for _, _, names in os.walk(cache_dir / "objects") for name in names]
+    assert len(objects) == 2
+
+
+def test_artifact_cache_keeps_stored_entry_larger_than_limit(tmp_path):
+    cache = ArtifactCache(str(tmp_path / "cache"), 10)
+    write_file(tmp_path / "small" / "out.bin", "small")
+    write_file(tmp_path / "big" / "out.bin", "b" * 20)
+
+    cache.store("small", [str(tmp_path / "small" / "*.bin")])
+    cache.store("big", [str(tmp_path / "big" / "*.bin")])
+
+    assert cache.restore("small", [str(tmp_path / "small2" / "*.bin")]) is None
+    assert cache.restore("big", [str(tmp_path / "big2" / "*.bin")]) is not None
+    assert (tmp_path / "big2" / "out.bin").read_text(encoding="utf-8") == "b" * 20
+
+
+def test_artifact_cache_eviction_waits_for_restore(tmp_path, monkeypatch):
+    cache = ArtifactCache(str(tmp_path / "cache"), 10)
+    write_file(tmp_path / "a" / "out.bin", "a" * 8)
+    write_file(tmp_path / "b" / "out.bin", "b" * 8)
+    cache.store("a", [str(tmp_path / "a" / "*.bin")])
+
+    restore_object = ArtifactCache._ArtifactCache__restore_object  # type: ignore[attr-defined]
+    restoring = threading.Event()
+    release = threading.Event()
+
+    def slow_restore_object(object_path, path):
+        restoring.set()
+        release.wait(5)
+        restore_object(object_path, path)
+
+    monkeypatch.setattr(ArtifactCache, "_ArtifactCache__restore_object", staticmethod(slow_restore_object))
+    result: dict[str, object] = {}
+    restore = threading.Thread(target=lambda: result.update(
+        restored=cache.restore("a", [str(tmp_path / "a2" / "*.bin")])))
+    restore.start()
+    restoring.wait(5)
+
+    # the new entry evicts the restored one, once the restore is finished
+    store = threading.Thread(target=lambda: cache.store("b", [str(tmp_path / "b" / "*.bin")]))
+    store.start()
+    store.join(0.3)
+    assert store.is_alive()
+
+    release.set()
+    restore.join(5)
+    store.join(5)
+
+    assert result["restored"] is not None
+    assert (tmp_path / "a2" / "out.bin").read_text(encoding="utf-8") == "a" * 8
+    assert cache.restore("a", [str(tmp_path / "a3" / "*.bin")]) is None
+
+
+class deploy_task(Task):
+    executions = 0
+
+    def __init__(self):
+        super().__init__()
+        self.set_name("deploy_task")
+        self.add_input_params("ARCH")
+        self.add_output_files("${DEPLOY_PATH}/*")
+
+    def execute(self):
+        deploy_task.executions += 1
+        write_file(Path(self.get_environment_param("DEPLOY_PATH")) / "image", self.get_environment_param("ARCH"))
+
+
+@pytest.fixture
+def artifact_cache_config(tmp_path):
+    old_state_db_path = Config.get_task_state_db_path()
+    Config.set_task_state_db_path(str(tmp_path / "task_state.db"))
+    Config.set_artifact_cache_dir(str(tmp_path / "cache"))
+    try:
+        yield
+    finally:
+        Config.set_task_state_db_path(old_state_db_path)
+        Config.set_artifact_cache_dir(None)
+
+
+def run_deploy_task(deploy_path):
+    environment = Environment()
+    environment.setVariableValue("ARCH", "ARM64")
+    environment.setVariableValue("DEPLOY_PATH", str(deploy_path))
+    task = deploy_task()
+    task.set_environment(environment)
+    task.start()
+
+
+def test_task_outputs_are_restored_from_artifact_cache(tmp_path, artifact_cache_config, caplog):
+    caplog.set_level(logging.INFO, logger="paf.paf_impl")
+    deploy_task.executions = 0
+
+    run_deploy_task(tmp_path / "checkout1" / "deploy")
+    run_deploy_task(tmp_path / "checkout2" / "deploy")
+
+    assert deploy_task.executions == 1
+    assert (tmp_path / "checkout2" / "deploy" / "image").read_text(encoding="utf-8") == "ARM64"
+    assert "Artifact cache miss for the task 'deploy_task'" in caplog.text
+    assert "Artifact cache hit for the task 'deploy_task'. Restored 1 files, 5 bytes" in caplog.text
@@ -1,4 +1,5 @@
 import os
+import sqlite3
 
 import pytest
 
@@ -100,3 +101,22 @@ def test_isatty_and_has_fileno_handle_plain_objects():
     assert common.has_fileno(WithoutFileno()) is False
     assert common.isatty(WithoutFileno()) is False
     assert common.has_fileno(open(os.devnull, "rb")) is True
+
+
+def test_connect_db_commits_and_closes_connection(tmp_path):
+    path = str(tmp_path / "state.db")
+
+    with common.connect_db(path) as connection:
+        connection.execute("CREATE TABLE state (value TEXT)")
+        connection.execute("INSERT INTO state VALUES ('stored')")
+
+    with pytest.raises(sqlite3.ProgrammingError, match="closed"):
+        connection.execute("SELECT value FROM state")
+
+    with pytest.raises(RuntimeError):
+        with common.connect_db(path) as connection:
+            connection.execute("INSERT INTO state VALUES ('rolled back')")
+            raise RuntimeError("failed operation")
+
+    with common.connect_db(path) as connection:
+        assert connection.execute("SELECT value FROM state").fetchall() == [("stored",)]
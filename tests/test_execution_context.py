@@ -1,5 +1,9 @@
+import json
+import time
+
 import pytest
 
+from paf.paf_impl import Config
 from paf.paf_impl import Environment
 from paf.paf_impl import ExecutionContext
 from paf.paf_impl import ExecutionElement
@@ -133,3 +137,314 @@ def test_execution_context_rejects_bad_config_shapes(tmp_path, xml, match):
 
     with pytest.raises(Exception, match=match):
         context.parse_config(str(config), context, env)
+
+
+PARALLEL_TASKS = (
+    "import os\n"
+    "from paf.paf_impl import Task\n"
+    "class sleeper(Task):\n"
+    "    def __init__(self):\n"
+    "        super().__init__()\n"
+    "        self.set_name(sleeper.__name__)\n"
+    "    def execute(self):\n"
+    "        self.subprocess_must_succeed('echo sleeping; sleep ' + self.SLEEP)\n"
+    "        self.set_environment_param('SLEPT', 'yes')\n"
+    "class failer(Task):\n"
+    "    def __init__(self):\n"
+    "        super().__init__()\n"
+    "        self.set_name(failer.__name__)\n"
+    "    def execute(self):\n"
+    "        self.subprocess_must_succeed('echo failing; exit 3')\n"
+    "class echoer(Task):\n"
+    "    def __init__(self):\n"
+    "        super().__init__()\n"
+    "        self.set_name(echoer.__name__)\n"
+    "    def execute(self):\n"
+    "        self.subprocess_must_succeed('echo echoing')\n"
+    "        self.set_environment_param('ECHOED', 'yes')\n"
+    "class marker(Task):\n"
+    "    def __init__(self):\n"
+    "        super().__init__()\n"
+    "        self.set_name(marker.__name__)\n"
+    "    def execute(self):\n"
+    "        open(self.MARKER, 'w').close()\n"
+)
+
+
+def prepare_parallel_phase(tmp_path, sleep, second_task):
+    module_dir = tmp_path / "modules"
+    module_dir.mkdir()
+    (module_dir / "tasks.py").write_text(PARALLEL_TASKS, encoding="utf-8")
+    marker = tmp_path / "marker.txt"
+    config = tmp_path / "phase.xml"
+    config.write_text(
+        "<paf_config>"
+        "  <param name='MARKER' value='" + str(marker) + "'/>"
+        "  <param name='SLEEP' value='" + sleep + "'/>"
+        "  <phase name='build'>"
+        "    <task name='modules.tasks.sleeper' depends_on=''/>"
+        "    <task name='modules.tasks." + second_task + "' depends_on=''/>"
+        "    <task name='modules.tasks.marker' depends_on='sleeper, " + second_task + "'/>"
+        "  </phase>"
+        "</paf_config>",
+        encoding="utf-8",
+    )
+    env = Environment()
+    context = ExecutionContext(str(tmp_path / "logs"))
+    context.set_jobs(2)
+    context.import_modules([str(module_dir)])
+    context.add_execution_element(ExecutionElement.ExecutionElementType_Phase, "build")
+    context.parse_config(str(config), context, env)
+    return context, env, marker
+
+
+def test_execution_context_runs_independent_tasks_in_parallel(tmp_path, capfd):
+    context, env, marker = prepare_parallel_phase(tmp_path, "0.1", "echoer")
+
+    context.execute(env)
+
+    assert marker.exists()
+    output = capfd.readouterr().out
+    assert "[sleeper] sleeping" in output
+    assert "[echoer] echoing" in output
+
+    # the tasks, which overlapped, record only their own changes of the environment
+    assert (env.getVariableValue("SLEPT"), env.getVariableValue("ECHOED")) == ("yes", "yes")
+    with open(tmp_path / "logs" / "journal.jsonl", encoding="utf-8") as stream:
+        changes = {entry["task"]: entry["environment_changes"]["set"] for entry in map(json.loads, stream)}
+    assert changes["modules.tasks.sleeper"] == {"SLEPT": "yes"}
+    assert changes["modules.tasks.echoer"] == {"ECHOED": "yes"}
+
+
+def test_execution_context_cancels_running_tasks_after_failure(tmp_path):
+    context, env, marker = prepare_parallel_phase(tmp_path, "30", "failer")
+    started = time.monotonic()
+
+    with pytest.raises(Exception, match="failer|3"):
+        context.execute(env)
+
+    assert time.monotonic() - started < 10
+    assert not marker.exists()
+
+
+def test_execution_context_rejects_wrong_jobs_number(tmp_path):
+    context = ExecutionContext(str(tmp_path / "logs"))
+
+    with pytest.raises(Exception, match="should be positive"):
+        context.set_jobs(0)
+
+
+RESUMED_TASKS = (
+    "import os\n"
+    "from paf.paf_impl import Task\n"
+    "class prepare(Task):\n"
+    "    def __init__(self):\n"
+    "        super().__init__()\n"
+    "        self.set_name(prepare.__name__)\n"
+    "    def execute(self):\n"
+    "        with open(self.COUNTER, 'a') as stream:\n"
+    "            stream.write('x')\n"
+    "        self.set_environment_param('PREPARED', 'yes')\n"
+    "class build(Task):\n"
+    "    def __init__(self):\n"
+    "        super().__init__()\n"
+    "        self.set_name(build.__name__)\n"
+    "    def execute(self):\n"
+    "        self.assertion(self.get_environment_param('PREPARED') == 'yes', 'not prepared')\n"
+    "        self.assertion(not os.path.exists(self.BROKEN), 'broken')\n"
+)
+
+
+def run_resumable_scenario(tmp_path, run_name, resume_journal=None, version="1"):
+    module_dir = tmp_path / "modules"
+    module_dir.mkdir(exist_ok=True)
+    (module_dir / "tasks.py").write_text(RESUMED_TASKS, encoding="utf-8")
+    config = tmp_path / "scenario.xml"
+    config.write_text(
+        "<paf_config>"
+        "  <param name='COUNTER' value='" + str(tmp_path / "counter") + "'/>"
+        "  <param name='BROKEN' value='" + str(tmp_path / "broken") + "'/>"
+        "  <param name='VERSION' value='" + version + "'/>"
+        "  <phase name='prepare'><task name='modules.tasks.prepare'/></phase>"
+        "  <phase name='build'><task name='modules.tasks.build'/></phase>"
+        "  <scenario name='default'><phase name='prepare'/><phase name='build'/></scenario>"
+        "</paf_config>",
+        encoding="utf-8",
+    )
+    env = Environment()
+    context = ExecutionContext(str(tmp_path / run_name))
+    context.import_modules([str(module_dir)])
+    context.add_execution_element(ExecutionElement.ExecutionElementType_Scenario, "default")
+    context.parse_config(str(config), context, env)
+    context.execute(env, resume_journal)
+
+
+def test_execution_context_resumes_after_failure(tmp_path):
+    (tmp_path / "broken").touch()
+    with pytest.raises(Exception, match="broken"):
+        run_resumable_scenario(tmp_path, "run1")
+
+    (tmp_path / "broken").unlink()
+    run_resumable_scenario(tmp_path, "run2", str(tmp_path / "run1"))
+    assert (tmp_path / "counter").read_text() == "x"
+
+    # the resumed run has recorded the skipped task as well
+    run_resumable_scenario(tmp_path, "run3", str(tmp_path / "run2" / "journal.jsonl"))
+    assert (tmp_path / "counter").read_text() == "x"
+
+    run_resumable_scenario(tmp_path, "run4", str(tmp_path / "run3"), version="2")
+    assert (tmp_path / "counter").read_text() == "xx"
+
+
+def test_execution_context_plans_with_recorded_durations(tmp_path):
+    context, env, _ = prepare_parallel_phase(tmp_path, "0.3", "echoer")
+    context.execute(env)
+
+    planned = ExecutionContext(str(tmp_path / "logs"))
+    planned.set_jobs(2)
+    planned.add_execution_element(ExecutionElement.ExecutionElementType_Phase, "build")
+    planned.parse_config(str(tmp_path / "phase.xml"), planned, env)
+    lines = planned.plan(env)
+
+    assert lines[0] == "Execution plan:"
+    assert lines[1].startswith("phase 'build': expected 0.")
+    assert lines[2].startswith("    task 'modules.tasks.sleeper': expected 0.3s, critical path")
+    assert "critical path" not in lines[3]
+    assert lines[-1] == "Critical path: modules.tasks.sleeper -> modules.tasks.marker"
+
+
+RESOURCE_TASKS = (
+    "from paf.paf_impl import Task\n"
+    "class emulator(Task):\n"
+    "    def __init__(self):\n"
+    "        super().__init__()\n"
+    "        self.set_name(emulator.__name__)\n"
+    "        self.set_resources(cores=64, exclusive=['qemu'], cores_param='BUILD_CORES')\n"
+    "    def execute(self):\n"
+    "        self.subprocess_must_succeed('echo start ${BUILD_CORES} >> ${LOG}; sleep 0.2; "
+    "echo end ${PAF_GRANTED_CORES} >> ${LOG}')\n"
+    "class second_emulator(emulator):\n"
+    "    def __init__(self):\n"
+    "        super().__init__()\n"
+    "        self.set_name(second_emulator.__name__)\n"
+)
+
+
+def test_execution_context_limits_tasks_by_resources(tmp_path):
+    module_dir = tmp_path / "modules"
+    module_dir.mkdir()
+    (module_dir / "tasks.py").write_text(RESOURCE_TASKS, encoding="utf-8")
+    log = tmp_path / "emulators.log"
+    config = tmp_path / "phase.xml"
+    config.write_text(
+        "<paf_config>"
+        "  <param name='LOG' value='" + str(log) + "'/>"
+        "  <phase name='emulate'>"
+        "    <task name='modules.tasks.emulator' depends_on=''/>"
+        "    <task name='modules.tasks.second_emulator' depends_on=''/>"
+        "  </phase>"
+        "</paf_config>",
+        encoding="utf-8",
+    )
+    cores = Config.get_resource_cores()
+    Config.set_resource_cores(3)
+    try:
+        env = Environment()
+        context = ExecutionContext(str(tmp_path / "logs"))
+        context.set_jobs(2)
+        context.import_modules([str(module_dir)])
+        context.add_execution_element(ExecutionElement.ExecutionElementType_Phase, "emulate")
+        context.parse_config(str(config), context, env)
+        context.execute(env)
+    finally:
+        Config.set_resource_cores(cores)
+
+    # the requested cores are capped to the budget, and the tasks holding "qemu" do not overlap
+    assert log.read_text(encoding="utf-8").split("\n") == ["start 3", "end 3", "start 3", "end 3", ""]
+
+
+PREFETCHED_TASKS = (
+    "import time\n"
+    "from paf.paf_impl import Task\n"
+    "def record(path, line):\n"
+    "    with open(path, 'a') as stream:\n"
+    "        stream.write(line + '\\n')\n"
+    "class prepare(Task):\n"
+    "    def __init__(self):\n"
+    "        super().__init__()\n"
+    "        self.set_name(prepare.__name__)\n"
+    "    def execute(self):\n"
+    "        record(self.LOG, 'prepare')\n"
+    "class build(Task):\n"
+    "    def __init__(self):\n"
+    "        super().__init__()\n"
+    "        self.set_name(build.__name__)\n"
+    "    def execute(self):\n"
+    "        record(self.LOG, 'build started')\n"
+    "        time.sleep(0.5)\n"
+    "        record(self.LOG, 'build finished')\n"
+    "class fetch(Task):\n"
+    "    def __init__(self):\n"
+    "        super().__init__()\n"
+    "        self.set_name(fetch.__name__)\n"
+    "        self.set_prefetchable()\n"
+    "    def execute(self):\n"
+    "        record(self.LOG, 'fetch')\n"
+    "        self.set_environment_param('FETCHED', 'yes')\n"
+    "class check(Task):\n"
+    "    def __init__(self):\n"
+    "        super().__init__()\n"
+    "        self.set_name(check.__name__)\n"
+    "    def execute(self):\n"
+    "        record(self.LOG, 'fetched ' + self.get_environment_param('FETCHED'))\n"
+)
+
+
+def run_prefetched_scenario(tmp_path, run_name, resume_journal=None):
+    module_dir = tmp_path / "modules"
+    module_dir.mkdir(exist_ok=True)
+    (module_dir / "tasks.py").write_text(PREFETCHED_TASKS, encoding="utf-8")
+    log = tmp_path / "run.log"
+    config = tmp_path / "scenario.xml"
+    config.write_text(
+        "<paf_config>"
+        "  <param name='LOG' value='" + str(log) + "'/>"
+        "  <phase name='prepare'><task name='modules.tasks.prepare'/></phase>"
+        "  <phase name='build'><task name='modules.tasks.build'/></phase>"
+        "  <phase name='fetch'><task name='modules.tasks.fetch'/><task name='modules.tasks.check'/></phase>"
+        "  <scenario name='default'><phase name='prepare'/><phase name='build'/><phase name='fetch'/></scenario>"
+        "</paf_config>",
+        encoding="utf-8",
+    )
+    env = Environment()
+    context = ExecutionContext(str(tmp_path / run_name))
+    context.set_prefetch(True)
+    context.import_modules([str(module_dir)])
+    context.add_execution_element(ExecutionElement.ExecutionElementType_Scenario, "default")
+    context.parse_config(str(config), context, env)
+
+    context.execute(env, resume_journal)
+    return env, log
+
+
+def test_execution_context_prefetches_tasks_of_next_phases(tmp_path):
+    env, log = run_prefetched_scenario(tmp_path, "logs")
+
+    # the fetch overlaps with the build and is executed once. Its environment changes are applied at its turn
+    lines = log.read_text(encoding="utf-8").splitlines()
+    assert lines[0] == "prepare"
+    assert lines.index("fetch") < lines.index("build finished")
+    assert lines.count("fetch") == 1
+    assert lines[-1] == "fetched yes"
+    assert env.getVariableValue("FETCHED") == "yes"
+
+
+def test_execution_context_does_not_prefetch_tasks_completed_in_resumed_run(tmp_path):
+    run_prefetched_scenario(tmp_path, "logs")
+    (tmp_path / "run.log").unlink()
+
+    env, log = run_prefetched_scenario(tmp_path, "logs_2", str(tmp_path / "logs"))
+
+    # all tasks are skipped, the changes of the fetch are applied from the journal
+    assert not log.exists()
+    assert env.getVariableValue("FETCHED") == "yes"
@@ -0,0 +1,64 @@
+import os
+
+import pytest
+
+from paf import jobserver
+from paf import paf_impl
+from paf.paf_impl import CommunicationMode
+from paf.paf_impl import Config
+from paf.paf_impl import InteractionMode
+from paf.paf_impl import Task
+
+
+def test_jobserver_holds_one_token_less_than_slots():
+    server = jobserver.Jobserver(4)
+    path = server.get_path()
+
+    fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+    try:
+        assert os.read(fd, 16) == b"+++"
+    finally:
+        os.close(fd)
+
+    env = {"MAKEFLAGS": "-k"}
+    server.export(env)
+    assert env["MAKEFLAGS"] == f"-j4 --jobserver-auth=fifo:{path} -k"
+
+    # the jobserver of an enclosing make is kept
+    inherited = {"MAKEFLAGS": "-j8 --jobserver-auth=3,4"}
+    server.export(inherited)
+    assert inherited["MAKEFLAGS"] == "-j8 --jobserver-auth=3,4"
+
+    server.close()
+    assert not os.path.exists(path)
+
+    with pytest.raises(Exception, match="should be positive"):
+        jobserver.Jobserver(0)
+
+
+def test_subprocesses_share_one_jobserver(monkeypatch):
+    monkeypatch.delenv("MAKEFLAGS", raising=False)
+    enabled = Config.get_jobserver()
+    cores = Config.get_resource_cores()
+    Config.set_jobserver(True)
+    Config.set_resource_cores(2)
+    task = Task()
+
+    try:
+        with paf_impl._shared_jobserver():
+            server = paf_impl._jobserver
+            assert server is not None
+            path = server.get_path()
+            # the nested execution reuses the jobserver
+            with paf_impl._shared_jobserver():
+                output = task.exec_subprocess("echo $$MAKEFLAGS",
+                                              communication_mode=CommunicationMode.PIPE_OUTPUT,
+                                              interaction_mode=InteractionMode.IGNORE_INPUT)
+            assert paf_impl._jobserver is server
+    finally:
+        Config.set_jobserver(enabled)
+        Config.set_resource_cores(cores)
+
+    assert output.stdout == f"-j2 --jobserver-auth=fifo:{path}\n"
+    assert paf_impl._jobserver is None
+    assert not os.path.exists(path)
@@ -0,0 +1,89 @@
+import os
+
+import pytest
+
+from paf import matrix
+from paf import paf_impl
+
+
+def test_expand_matrix_builds_all_combinations():
+    cases = matrix.expand_matrix(["ARCH=ARM,ARM64", "KERNEL=5.10, 6.1", "ARCH=ARM64,X86"])
+
+    assert cases == [
+        {"ARCH": "ARM", "KERNEL": "5.10"},
+        {"ARCH": "ARM", "KERNEL": "6.1"},
+        {"ARCH": "ARM64", "KERNEL": "5.10"},
+        {"ARCH": "ARM64", "KERNEL": "6.1"},
+        {"ARCH": "X86", "KERNEL": "5.10"},
+        {"ARCH": "X86", "KERNEL": "6.1"},
+    ]
+
+
+@pytest.mark.parametrize(
+    ("parameter", "match"),
+    [
+        ("ARCH", "Expected format"),
+        ("=ARM", "Expected format"),
+        ("ARCH= , ", "has no values"),
+    ],
+)
+def test_parse_matrix_parameter_rejects_wrong_format(parameter, match):
+    with pytest.raises(Exception, match=match):
+        matrix.parse_matrix_parameter(parameter)
+
+
+def test_case_log_dir_is_unique_per_case():
+    case = {"ARCH": "ARM64", "KERNEL": "6.1 rc/2"}
+
+    assert matrix.case_log_dir("logs", case) == os.path.join("logs", "ARCH-ARM64_KERNEL-6.1_rc_2")
+    assert matrix.case_log_dir(None, case) is None
+
+
+def record_case(case):
+    if case["ARCH"] == "BAD":
+        raise RuntimeError("unsupported\narchitecture")
+    with open(case["OUT"], "w", encoding="utf-8") as stream:
+        stream.write(f"{os.getpid()} {paf_impl._get_output_prefix()}")
+
+
+def test_run_matrix_executes_cases_in_separate_processes(tmp_path):
+    cases = [
+        {"ARCH": "ARM", "OUT": str(tmp_path / "arm")},
+        {"ARCH": "BAD", "OUT": str(tmp_path / "bad")},
+        {"ARCH": "ARM64", "OUT": str(tmp_path / "arm64")},
+    ]
+
+    results = matrix.run_matrix(cases, record_case, 2)
+
+    assert [result.succeeded for result in results] == [True, False, True]
+    assert results[1].error == "RuntimeError: unsupported\narchitecture"
+    pid, prefix = (tmp_path / "arm64").read_text(encoding="utf-8").split(" ", 1)
+    assert int(pid) != os.getpid()
+    assert prefix == f"[ARM64,{tmp_path / 'arm64'}] "
+
+    summary = matrix.format_summary(results)
+    assert summary[0].split(" | ")[:3] == ["Case".ljust(len(matrix.case_label(cases[2]))), "Result", "Duration"]
+    assert set(summary[1]) == {"-", "+"}
+    assert "FAILED" in summary[3]
+    assert summary[3].endswith("RuntimeError: unsupported")
+
+
+def log_case(case):
+    paf_impl.logger.info(f"before the context of {case['RUN']}")
+    paf_impl.ExecutionContext(case["LOG_DIR"])
+    paf_impl.logger.info(f"case {case['RUN']}")
+
+
+def test_run_matrix_logs_each_case_into_its_own_directory(tmp_path):
+    cases = [{"RUN": run, "LOG_DIR": str(tmp_path / run)} for run in ("one", "two")]
+
+    # one worker process executes both cases
+    results = matrix.run_matrix(cases, log_case, 1)
+
+    assert all(result.succeeded for result in results)
+    for run, other in (("one", "two"), ("two", "one")):
+        logs = list((tmp_path / run).glob("paf_*.log"))
+        assert len(logs) == 1
+        content = logs[0].read_text(encoding="utf-8")
+        assert f"case {run}" in content
+        assert other not in content
@@ -1,21 +1,42 @@
+import io
+import logging
+import os
+import signal
+import sys
+import threading
+import time
 import types
 from typing import Any
 
 import pytest
 
 from paf import paf_impl
+from paf.paf_impl import CancellationScope
+from paf.paf_impl import CaptureMode
+from paf.paf_impl import CommandFailedError
+from paf.paf_impl import CommandTimeoutError
+from paf.paf_impl import CommandOutputCapture
 from paf.paf_impl import CommunicationMode
 from paf.paf_impl import Config
+from paf.paf_impl import ConsoleSink
 from paf.paf_impl import Environment
 from paf.paf_impl import ExecutionElement
 from paf.paf_impl import ExecutionMode
 from paf.paf_impl import InteractionMode
+from paf.paf_impl import OutputLinePrefixer
+from paf.paf_impl import OutputListener
 from paf.paf_impl import Phase
+from paf.paf_impl import RawLogFileSink
 from paf.paf_impl import Scenario
+from paf.paf_impl import SSHCommandOutput
 from paf.paf_impl import SSHConnection
 from paf.paf_impl import SSHConnectionCache
 from paf.paf_impl import SSHLocalClient
+from paf.paf_impl import SpooledCommandOutputCapture
+from paf.paf_impl import TailCommandOutputCapture
+from paf.paf_impl import TaskCancelledError
 from paf.paf_impl import Task
+from paf.paf_impl import TimeoutKind
 
 
 def test_config_defaults_can_be_changed():
@@ -36,6 +57,504 @@ def test_config_defaults_can_be_changed():
         Config.set_default_communication_mode(old_communication)
 
 
+def test_command_output_capture_joins_chunks_once_and_limits_size():
+    capture = CommandOutputCapture()
+    capture.append(b"hel")
+    capture.append(b"")
+    capture.append(bytearray(b"lo\xd1\x97\r\n"))
+
+    assert capture.as_bytes() == b"hello\xd1\x97\r\n"
+    assert capture.as_memoryview().tobytes() == b"hello\xd1\x97\r\n"
+    assert str(capture) == "hello\u0457\r\n"
+    assert bytes(capture) == b"hello\xd1\x97\r\n"
+    capture.rstrip(b"\r\n")
+    assert capture.as_str() == "hello\u0457"
+    assert not capture.truncated()
+
+    limited = CommandOutputCapture(max_size=4)
+    limited.append(b"abc")
+    limited.append(b"def")
+    limited.append(b"ghi")
+
+    assert limited.as_str() == "abcd"
+    assert len(limited) == 4
+    assert limited.total_size() == 9
+    assert limited.truncated()
+
+
+def test_command_output_capture_search_helpers():
+    capture = CommandOutputCapture()
+    capture.append(b"one\r\ntwo\nthree\n")
+
+    assert capture.find("two") == 5
+    assert capture.find(b"missing") == -1
+    assert list(capture.splitlines()) == ["one", "two", "three"]
+    assert capture.tail(2) == ["two", "three"]
+    assert capture.tail(10) == ["one", "two", "three"]
+    assert capture.tail(0) == []
+    assert CommandOutputCapture().tail(1) == []
+
+
+def test_spooled_capture_moves_output_to_memory_mapped_file(tmp_path):
+    capture = SpooledCommandOutputCapture(8, str(tmp_path))
+    capture.append(b"line-1\n")
+    assert not capture.spooled()
+
+    capture.append(b"line-2\nline-3\n\n")
+    assert capture.spooled()
+    assert capture.find("line-3") == 14
+    assert list(capture.splitlines()) == ["line-1", "line-2", "line-3", ""]
+    assert capture.tail(2) == ["line-3", ""]
+
+    capture.rstrip(b"\n")
+    capture.append(b"!")
+    assert capture.as_str() == "line-1\nline-2\nline-3!"
+    assert len(capture) == 21
+
+    capture.close()
+    assert capture.as_bytes() == b""
+
+
+def test_subprocess_spools_large_output_when_requested(tmp_path, monkeypatch):
+    old_threshold = Config.get_default_capture_spool_threshold()
+    monkeypatch.setattr(paf_impl.logger, "_logger__log_dir", str(tmp_path))
+    monkeypatch.setattr(paf_impl.logger, "log_to_file", lambda: False)
+    try:
+        Config.set_default_capture_spool_threshold(1024)
+        output = Task().exec_subprocess(
+            "seq 1 5000",
+            communication_mode=CommunicationMode.PIPE_OUTPUT,
+            interaction_mode=InteractionMode.IGNORE_INPUT,
+            capture_mode=CaptureMode.SPOOL_TO_DISK,
+        )
+    finally:
+        Config.set_default_capture_spool_threshold(old_threshold)
+
+    assert output.stdout_capture.spooled()
+    assert output.stdout_capture.tail(1) == ["5000"]
+    assert output.stdout_capture.find("\n2500\n") > 0
+    output.stdout_capture.close()
+
+
+def test_must_succeed_returns_spooled_capture_without_decoding(tmp_path, monkeypatch):
+    old_threshold = Config.get_default_capture_spool_threshold()
+    monkeypatch.setattr(paf_impl.logger, "_logger__log_dir", str(tmp_path))
+    monkeypatch.setattr(paf_impl.logger, "log_to_file", lambda: False)
+
+    def fail_decode(self):
+        raise AssertionError("the whole spooled output was decoded")
+
+    monkeypatch.setattr(SpooledCommandOutputCapture, "as_str", fail_decode)
+    try:
+        Config.set_default_capture_spool_threshold(1024)
+        output = Task().subprocess_must_succeed(
+            "seq 1 5000",
+            communication_mode=CommunicationMode.PIPE_OUTPUT,
+            interaction_mode=InteractionMode.IGNORE_INPUT,
+            capture_mode=CaptureMode.SPOOL_TO_DISK,
+            return_capture=True,
+        )
+    finally:
+        Config.set_default_capture_spool_threshold(old_threshold)
+
+    assert isinstance(output, SpooledCommandOutputCapture)
+    assert output.spooled()
+    assert output.tail(1) == ["5000"]
+    output.close()
+
+
+def test_must_succeed_returns_string_in_spool_mode_by_default(tmp_path, monkeypatch):
+    monkeypatch.setattr(paf_impl.logger, "_logger__log_dir", str(tmp_path))
+
+    output = Task().subprocess_must_succeed(
+        "echo spooled",
+        communication_mode=CommunicationMode.PIPE_OUTPUT,
+        interaction_mode=InteractionMode.IGNORE_INPUT,
+        capture_mode=CaptureMode.SPOOL_TO_DISK,
+    )
+
+    assert output == "spooled\n"
+
+
+def test_tail_capture_keeps_last_bytes_and_lines():
+    by_size = TailCommandOutputCapture(max_size=5)
+    by_size.append(b"abc")
+    by_size.append(b"defgh")
+    by_size.append(b"ij")
+
+    assert by_size.as_str() == "fghij"
+    assert by_size.total_size() == 10
+    assert by_size.dropped_size() == 5
+
+    by_lines = TailCommandOutputCapture(max_lines=2)
+    by_lines.append(b"1\n2\n")
+    by_lines.append(b"3\n4")
+    assert by_lines.as_str() == "3\n4"
+    by_lines.append(b"\n5\n6\n")
+    assert by_lines.tail(10) == ["5", "6"]
+    by_lines.rstrip(b"\n")
+    assert by_lines.as_bytes() == b"5\n6"
+
+
+def test_failed_command_exception_carries_output_tail():
+    old_tail_lines = Config.get_default_capture_tail_lines()
+    try:
+        Config.set_default_capture_tail_lines(3)
+        with pytest.raises(CommandFailedError, match="Subprocess should succeed") as error:
+            Task().subprocess_must_succeed(
+                "seq 1 1000; echo broken >&2; exit 2",
+                communication_mode=CommunicationMode.PIPE_OUTPUT,
+                interaction_mode=InteractionMode.IGNORE_INPUT,
+                capture_mode=CaptureMode.TAIL,
+            )
+    finally:
+        Config.set_default_capture_tail_lines(old_tail_lines)
+
+    assert error.value.exit_code == 2
+    assert error.value.stdout_tail == ["998", "999", "1000"]
+    assert error.value.stdout_total_size == len("".join(f"{i}\n" for i in range(1, 1001)))
+    assert error.value.stderr_tail == ["broken"]
+
+
+def test_subprocess_output_respects_default_capture_max_size():
+    old_max_size = Config.get_default_capture_max_size()
+    try:
+        Config.set_default_capture_max_size(3)
+        output = Task().exec_subprocess(
+            ["/bin/echo", "hello"],
+            shell=False,
+            communication_mode=CommunicationMode.PIPE_OUTPUT,
+            interaction_mode=InteractionMode.IGNORE_INPUT,
+        )
+    finally:
+        Config.set_default_capture_max_size(old_max_size)
+
+    assert output.stdout == "hel"
+    assert output.stdout_capture.total_size() == 6
+
+
+def test_subprocess_pty_mode_collects_output_until_exit():
+    output = Task().exec_subprocess(
+        "printf 'first\\n'; printf 'second'",
+        communication_mode=CommunicationMode.USE_PTY,
+        interaction_mode=InteractionMode.IGNORE_INPUT,
+    )
+
+    assert output.exit_code == 0
+    assert output.stdout == "first\r\nsecond"
+
+
+def test_subprocess_pipe_mode_drains_streams_separately():
+    output = Task().exec_subprocess(
+        "head -c 300000 /dev/zero | tr '\\0' a; echo err >&2; exit 3",
+        communication_mode=CommunicationMode.PIPE_OUTPUT,
+        interaction_mode=InteractionMode.IGNORE_INPUT,
+    )
+
+    assert output.exit_code == 3
+    assert output.stdout == "a" * 300000
+    assert output.stderr == "err\n"
+
+
+def test_subprocess_processes_input_when_stdin_is_dev_null(monkeypatch):
+    with open(os.devnull, "r") as stdin:
+        monkeypatch.setattr(sys, "stdin", stdin)
+
+        output = Task().exec_subprocess(
+            "echo from-child",
+            communication_mode=CommunicationMode.PIPE_OUTPUT,
+            interaction_mode=InteractionMode.PROCESS_INPUT,
+        )
+
+    assert output.exit_code == 0
+    assert output.stdout == "from-child\n"
+
+
+def test_subprocess_sees_granted_cores_in_its_environment():
+    task = Task()
+    task.set_granted_cores(3)
+
+    output = task.exec_subprocess(
+        "bash -c 'echo cores=$$PAF_GRANTED_CORES'",
+        communication_mode=CommunicationMode.PIPE_OUTPUT,
+        interaction_mode=InteractionMode.IGNORE_INPUT,
+    )
+
+    assert output.stdout == "cores=3\n"
+
+
+def test_subprocess_pump_falls_back_to_polling_without_pidfd(monkeypatch):
+    monkeypatch.setattr(paf_impl, "_open_process_fd", lambda pid: None)
+
+    output = Task().exec_subprocess(
+        ["/bin/echo", "polled"],
+        shell=False,
+        communication_mode=CommunicationMode.PIPE_OUTPUT,
+        interaction_mode=InteractionMode.IGNORE_INPUT,
+    )
+
+    assert output.stdout == "polled\n"
+
+
+def test_exec_subprocess_kills_process_group_after_overall_timeout(tmp_path):
+    pid_file = tmp_path / "background.pid"
+    started = time.monotonic()
+
+    output = Task().exec_subprocess(
+        f"sleep 30 & echo $$! > {pid_file}; wait",
+        timeout=0.5,
+        communication_mode=CommunicationMode.PIPE_OUTPUT,
+        interaction_mode=InteractionMode.IGNORE_INPUT,
+    )
+
+    assert time.monotonic() - started < 5
+    assert output.timed_out
+    assert output.timeout_kind == TimeoutKind.OVERALL
+    with pytest.raises(ProcessLookupError):
+        os.kill(int(pid_file.read_text()), 0)
+
+
+def test_exec_subprocess_idle_timeout_escalates_to_sigkill(monkeypatch):
+    monkeypatch.setattr(paf_impl, "_PROCESS_TERMINATE_TIMEOUT", 0.2)
+
+    with pytest.raises(CommandTimeoutError) as error:
+        Task().subprocess_must_succeed(
+            "trap '' TERM; echo started; sleep 30",
+            idle_timeout=0.3,
+            communication_mode=CommunicationMode.PIPE_OUTPUT,
+            interaction_mode=InteractionMode.IGNORE_INPUT,
+        )
+
+    assert error.value.timeout_kind == TimeoutKind.IDLE
+    assert error.value.exit_code == -signal.SIGKILL
+    assert error.value.stdout_tail == ["started"]
+
+
+def test_exec_subprocess_output_resets_idle_timeout():
+    output = Task().exec_subprocess(
+        "for i in 1 2 3 4 5; do echo $$i; sleep 0.1; done",
+        idle_timeout=1,
+        communication_mode=CommunicationMode.PIPE_OUTPUT,
+        interaction_mode=InteractionMode.IGNORE_INPUT,
+    )
+
+    assert not output.timed_out
+    assert output.exit_code == 0
+
+
+class FakeConsoleStream:
+    def __init__(self, tty):
+        self.buffer = io.BytesIO()
+        self.tty = tty
+        self.flushes = 0
+
+    def isatty(self):
+        return self.tty
+
+    def flush(self):
+        self.flushes += 1
+
+
+def test_console_sink_batches_writes_until_size_or_stream_switch(monkeypatch):
+    monkeypatch.setattr(Config, "_Config__CONSOLE_FLUSH_SIZE", 8)
+    monkeypatch.setattr(Config, "_Config__CONSOLE_FLUSH_INTERVAL", 60)
+    tty = FakeConsoleStream(tty=True)
+    pipe = FakeConsoleStream(tty=False)
+    sink = ConsoleSink()
+
+    sink.write(tty, b"a\n")
+    sink.write(tty, b"b\n")
+    assert tty.buffer.getvalue() == b""
+    assert 0 < sink.flush_timeout() <= 60
+
+    sink.write(tty, b"cd\n")
+    assert tty.buffer.getvalue() == b"a\r\nb\r\ncd\r\n"
+
+    sink.write(pipe, b"e\n")
+    sink.write(tty, b"f\n")
+    assert pipe.buffer.getvalue() == b"e\n"
+    assert tty.buffer.getvalue().endswith(b"cd\r\n")
+
+    sink.flush()
+    assert tty.buffer.getvalue().endswith(b"f\r\n")
+    assert sink.flush_timeout() is None
+
+
+def test_console_sink_flushes_when_interval_passes_or_immediately(monkeypatch):
+    monkeypatch.setattr(Config, "_Config__CONSOLE_FLUSH_INTERVAL", 0)
+    stream = FakeConsoleStream(tty=False)
+    sink = ConsoleSink()
+
+    sink.write(stream, b"x")
+    sink.flush_if_due()
+    assert stream.buffer.getvalue() == b"x"
+
+    monkeypatch.setattr(Config, "_Config__CONSOLE_FLUSH_INTERVAL", 60)
+    immediate_sink = ConsoleSink(immediate=True)
+    immediate_sink.write(stream, b"y")
+    assert stream.buffer.getvalue() == b"xy"
+
+
+def test_output_listener_splits_lines_across_chunks():
+    chunks: list[bytes] = []
+    lines: list[str] = []
+    with OutputListener(on_chunk=chunks.append, on_line=lines.append) as listener:
+        listener.feed(b"fir", "stdout")
+        listener.feed(b"st\r\nsec", "stdout")
+        listener.feed(b"err\n", "stderr")
+        listener.feed(b"ond", "stdout")
+        listener.finish()
+
+    assert chunks == [b"fir", b"st\r\nsec", b"err\n", b"ond"]
+    assert lines == ["first", "err", "second"]
+
+
+def test_output_listener_decodes_characters_split_between_chunks():
+    lines: list[str] = []
+    with OutputListener(on_line=lines.append) as listener:
+        listener.feed(b"caf\xc3", "stdout")
+        listener.feed(b"\xa9\nna\xc3", "stdout")
+        listener.feed(b"\xafve", "stdout")
+        listener.finish()
+
+    assert lines == ["caf\u00e9", "na\u00efve"]
+
+
+def use_file_log(tmp_path, monkeypatch):
+    log_path = tmp_path / "paf.log"
+    file_logger = logging.getLogger(f"paf-test-{tmp_path.name}")
+    file_logger.propagate = False
+    file_logger.setLevel(logging.INFO)
+    file_handler = logging.FileHandler(log_path, mode="w")
+    file_handler.setFormatter(logging.Formatter("%(levelname)s %(message)s"))
+    file_logger.addHandler(file_handler)
+
+    monkeypatch.setattr(paf_impl.logger, "_logger__log_dir", str(tmp_path))
+    monkeypatch.setattr(paf_impl.logger, "_logger__logging_to_file", file_logger)
+    monkeypatch.setattr(paf_impl.logger, "_logger__output_sink", RawLogFileSink(file_handler))
+    return log_path
+
+
+def test_subprocess_decodes_split_characters_for_listener_and_logs_raw_output(tmp_path, monkeypatch):
+    log_path = use_file_log(tmp_path, monkeypatch)
+    lines: list[str] = []
+
+    output = Task().exec_subprocess(
+        "printf 'caf\\303'; sleep 0.1; printf '\\251\\n'; sleep 0.1; printf end",
+        communication_mode=CommunicationMode.PIPE_OUTPUT,
+        interaction_mode=InteractionMode.IGNORE_INPUT,
+        on_line=lines.append,
+    )
+
+    assert output.stdout == "caf\u00e9\nend"
+    assert lines == ["caf\u00e9", "end"]
+    # the last line without the line ending is terminated before the next record
+    assert "caf\u00e9\nend\nINFO Command was successfully executed" in log_path.read_text()
+
+
+def test_exec_subprocess_feeds_callbacks_and_stops_on_false():
+    lines: list[str] = []
+
+    def on_line(line):
+        lines.append(line)
+        return len(lines) < 3
+
+    output = Task().exec_subprocess(
+        "while true; do echo tick; sleep 0.01; done",
+        communication_mode=CommunicationMode.PIPE_OUTPUT,
+        interaction_mode=InteractionMode.IGNORE_INPUT,
+        on_line=on_line,
+    )
+
+    assert output.stopped
+    assert output.exit_code != 0
+    assert lines == ["tick", "tick", "tick"]
+
+
+def test_stream_subprocess_yields_lines_and_checks_return_code():
+    task = Task()
+
+    lines = list(task.stream_subprocess(
+        "echo one; echo two",
+        communication_mode=CommunicationMode.PIPE_OUTPUT,
+        interaction_mode=InteractionMode.IGNORE_INPUT,
+    ))
+    assert lines == ["one", "two"]
+
+    with pytest.raises(Exception, match="Subprocess should succeed"):
+        for _ in task.stream_subprocess(
+            "echo one; exit 4",
+            communication_mode=CommunicationMode.PIPE_OUTPUT,
+            interaction_mode=InteractionMode.IGNORE_INPUT,
+        ):
+            pass
+
+
+def test_stream_subprocess_stops_silent_process_on_early_exit():
+    started = time.monotonic()
+
+    for line in Task().stream_subprocess(
+        "echo ready; sleep 30",
+        communication_mode=CommunicationMode.PIPE_OUTPUT,
+        interaction_mode=InteractionMode.IGNORE_INPUT,
+    ):
+        assert line == "ready"
+        break
+
+    assert time.monotonic() - started < 10
+
+
+class FakeSSHChannel:
+    def __init__(self, stdout_chunks, stderr_chunks):
+        self.stdout_chunks = list(stdout_chunks)
+        self.stderr_chunks = list(stderr_chunks)
+        self.eof_received = True
+        self.closed = False
+        # always readable, as the channel's pipe is set while data is buffered
+        self.read_fd, self.write_fd = os.pipe()
+        os.write(self.write_fd, b"x")
+
+    def fileno(self):
+        return self.read_fd
+
+    def recv_ready(self):
+        return bool(self.stdout_chunks)
+
+    def recv_stderr_ready(self):
+        return bool(self.stderr_chunks)
+
+    def recv(self, nbytes):
+        return self.stdout_chunks.pop(0)
+
+    def recv_stderr(self, nbytes):
+        return self.stderr_chunks.pop(0)
+
+    def exit_status_ready(self):
+        return True
+
+    def recv_exit_status(self):
+        return 2
+
+    def close(self):
+        os.close(self.read_fd)
+        os.close(self.write_fd)
+
+
+def test_ssh_command_output_drains_stderr_independently_after_exit_status():
+    channel = FakeSSHChannel([b"out\n"], [b"err1\n", b"err2\n", b"err3\n"])
+    stdin = types.SimpleNamespace(channel=channel)
+
+    try:
+        output = SSHCommandOutput(ExecutionMode.COLLECT_DATA, stdin, None, None,
+                                  False, "", InteractionMode.IGNORE_INPUT)
+    finally:
+        channel.close()
+
+    assert output.exit_code == 2
+    assert output.stdout == "out"
+    assert output.stderr == "err1\nerr2\nerr3"
+
+
 def test_environment_dump_masks_sensitive_values(monkeypatch):
     messages = []
     monkeypatch.setattr(paf_impl.logger, "info", lambda msg, *args, **kwargs: messages.append(msg))
@@ -52,36 +571,25 @@ def test_environment_dump_masks_sensitive_values(monkeypatch):
     assert "export CUSTOM=<hidden>" in messages
 
 
-def test_logger_file_paths_with_fake_file_logger(monkeypatch):
-    calls = []
-
-    class FakeFileLogger:
-        def info(self, msg, *args, **kwargs):
-            calls.append(("info", msg))
-
-        def warning(self, msg, *args, **kwargs):
-            calls.append(("warning", msg))
-
-        def error(self, msg, *args, **kwargs):
-            calls.append(("error", msg))
-
-    monkeypatch.setattr(paf_impl.logger, "_logger__log_dir", "/tmp/paf-logs")
-    monkeypatch.setattr(paf_impl.logger, "_logger__logging_to_file", FakeFileLogger())
+def test_logger_writes_records_and_raw_output_to_one_file(tmp_path, monkeypatch):
+    log_path = use_file_log(tmp_path, monkeypatch)
 
     paf_impl.logger.info("plain")
+    paf_impl.logger.output_to_file(b"raw ")
+    paf_impl.logger.output_to_file(b"output")
     paf_impl.logger.warning("warn")
-    paf_impl.logger.error("err")
-    paf_impl.logger.non_formatted_info_to_file("nf-info")
-    paf_impl.logger.non_formatted_warning_to_file("nf-warn")
+    paf_impl.logger.non_formatted_info_to_file("nf-%s", "info")
     paf_impl.logger.non_formatted_error_to_file("nf-err")
-
-    assert calls == [
-        ("info", "plain"),
-        ("warning", "warn"),
-        ("error", "err"),
-        ("info", "nf-info"),
-        ("warning", "nf-warn"),
-        ("error", "nf-err"),
+    paf_impl.logger.error("err")
+    paf_impl.logger.flush_output_to_file()
+
+    assert log_path.read_text().splitlines() == [
+        "INFO plain",
+        "raw output",
+        "WARNING warn",
+        "nf-info",
+        "nf-err",
+        "ERROR err",
     ]
 
 
@@ -257,6 +765,9 @@ def test_ssh_connection_cache_reuses_connections(monkeypatch):
         def get_connection_key(self):
             return f"{self.args[0]}:{self.args[1]}:{self.args[2]}:{self.args[4]}"
 
+        def ensure_connected(self):
+            pass
+
         def exec_command(self, *args, **kwargs):
             self.commands.append((args, kwargs))
             return types.SimpleNamespace(exit_code=0, stdout="cached")
@@ -271,6 +782,21 @@ def test_ssh_connection_cache_reuses_connections(monkeypatch):
     assert first is second
     assert output.stdout == "cached"
     assert len(FakeConnection.instances) == 1
+    assert [(utilization.connection_key, utilization.commands) for utilization in cache.get_pool_utilization()] == [
+        ("user@host:22", 1)
+    ]
+
+
+class FakeSSHTransport:
+    def __init__(self):
+        self.active = True
+        self.keepalive = None
+
+    def set_keepalive(self, interval):
+        self.keepalive = interval
+
+    def is_active(self):
+        return self.active
 
 
 def test_ssh_connection_executes_with_paramiko_facade(monkeypatch):
@@ -280,8 +806,12 @@ def test_ssh_connection_executes_with_paramiko_facade(monkeypatch):
         def __init__(self):
             self.connect_kwargs = None
             self.closed = False
+            self.transport = FakeSSHTransport()
             FakeClient.instances.append(self)
 
+        def get_transport(self):
+            return self.transport
+
         def set_missing_host_key_policy(self, policy):
             self.policy = policy
 
@@ -298,6 +828,7 @@ def test_ssh_connection_executes_with_paramiko_facade(monkeypatch):
             self.stdout = "ssh-output"
             self.stderr = ""
             self.exit_code = 0
+            self.stopped = False
 
     exec_calls: list[tuple[Any, str, int, dict[str, Any]]] = []
 
@@ -334,22 +865,123 @@ def test_ssh_connection_executes_with_paramiko_facade(monkeypatch):
         connection.exec_command("true")
 
 
+def test_ssh_connection_reconnects_with_backoff_after_transport_dies(monkeypatch):
+    failures = [OSError("connection refused"), paf_impl.paramiko.SSHException("banner"), None, None]
+
+    class FakeClient:
+        instances: list["FakeClient"] = []
+
+        def __init__(self):
+            self.transport = FakeSSHTransport()
+            FakeClient.instances.append(self)
+
+        def set_missing_host_key_policy(self, policy):
+            pass
+
+        def get_transport(self):
+            return self.transport
+
+        def connect(self, **kwargs):
+            if len(FakeClient.instances) > 1:
+                failure = failures.pop(0)
+                if failure:
+                    raise failure
+
+        def close(self):
+            self.transport.active = False
+
+    sessions: list[Any] = []
+
+    def fake_exec_command(client, cmd, timeout, **kwargs):
+        sessions.append(client)
+        if len(sessions) == 1:
+            client.transport.active = False
+            raise EOFError("session refused")
+        return "stdin", "stdout", "stderr"
+
+    delays: list[float] = []
+    monkeypatch.setattr(paf_impl.paramiko, "SSHClient", FakeClient)
+    monkeypatch.setattr(paf_impl.paramiko, "AutoAddPolicy", lambda: "policy")
+    monkeypatch.setattr(paf_impl.common, "get_terminal_dimensions", lambda: (120, 40))
+    monkeypatch.setattr(paf_impl.common, "exec_command", fake_exec_command)
+    monkeypatch.setattr(paf_impl, "SSHCommandOutput",
+                        lambda *args: types.SimpleNamespace(exit_code=0, stopped=False, stdout="ok"))
+    monkeypatch.setattr(paf_impl.time, "sleep", delays.append)
+    max_delay = Config.get_ssh_reconnect_max_delay()
+    Config.set_ssh_reconnect_max_delay(1.5)
+
+    try:
+        connection = SSHConnection("host", "user")
+        assert FakeClient.instances[0].transport.keepalive == Config.get_ssh_keepalive_interval()
+
+        # e.g. the target has rebooted
+        FakeClient.instances[0].transport.active = False
+        assert not connection.is_alive()
+        output = connection.exec_command("true", interaction_mode=InteractionMode.IGNORE_INPUT)
+    finally:
+        Config.set_ssh_reconnect_max_delay(max_delay)
+
+    assert output.stdout == "ok"
+    assert delays == [1, 1.5]
+    assert connection.is_alive()
+    # the session, which could not be opened, is opened again over the restored connection
+    assert len(FakeClient.instances) == 5
+    assert sessions[0] is FakeClient.instances[3]
+    assert sessions[1] is FakeClient.instances[4]
+
+
+def test_ssh_connection_gives_up_reconnecting(monkeypatch):
+    class FakeClient:
+        def __init__(self):
+            self.transport = FakeSSHTransport()
+
+        def set_missing_host_key_policy(self, policy):
+            pass
+
+        def get_transport(self):
+            return self.transport
+
+        def connect(self, **kwargs):
+            if FakeClient.error:
+                raise FakeClient.error
+
+        def close(self):
+            self.transport.active = False
+
+        error: Any = None
+
+    monkeypatch.setattr(paf_impl.paramiko, "SSHClient", FakeClient)
+    monkeypatch.setattr(paf_impl.paramiko, "AutoAddPolicy", lambda: "policy")
+    monkeypatch.setattr(paf_impl.time, "sleep", lambda delay: None)
+    connection = SSHConnection("host", "user")
+
+    FakeClient.error = OSError("no route to host")
+    connection._SSHConnection__client.close()  # type: ignore[attr-defined]
+    with pytest.raises(Exception, match="has failed after 5 attempts"):
+        connection.ensure_connected()
+
+    FakeClient.error = paf_impl.paramiko.AuthenticationException("denied")
+    with pytest.raises(paf_impl.paramiko.AuthenticationException):
+        connection.reconnect()
+
+
 def test_ssh_connection_uses_jumphost_channel(monkeypatch):
-    class FakeTransport:
-        def open_channel(self, channel_type, dest_addr, src_addr):
-            self.channel = (channel_type, dest_addr, src_addr)
+    class FakeJumpHost:
+        def __init__(self):
+            self.channels: list[tuple[str, int]] = []
+
+        def open_channel(self, host, port):
+            self.channels.append((host, port))
             return "jump-channel"
 
-    class FakeJumpHost:
-        _SSHConnection__client: Any
-        _SSHConnection__host: str
-        _SSHConnection__port: int
+        def get_connection_key(self):
+            return "admin@jump:22"
 
     class FakeClient:
         instances: list["FakeClient"] = []
 
         def __init__(self):
-            self.transport = FakeTransport()
+            self.transport = FakeSSHTransport()
             self.connect_kwargs = None
             FakeClient.instances.append(self)
 
@@ -366,19 +998,62 @@ def test_ssh_connection_uses_jumphost_channel(monkeypatch):
     monkeypatch.setattr(paf_impl.paramiko, "AutoAddPolicy", lambda: "policy")
 
     jumphost = FakeJumpHost()
-    jumphost._SSHConnection__client = FakeClient()
-    jumphost._SSHConnection__host = "jump"
-    jumphost._SSHConnection__port = 22
     connection = SSHConnection("host", "user", 2222, jumphost=jumphost)
 
-    assert connection.get_connection_key() == "user@host:2222"
+    assert connection.get_connection_key() == "user@host:2222 via admin@jump:22"
     assert FakeClient.instances[-1].connect_kwargs is not None
     assert FakeClient.instances[-1].connect_kwargs["sock"] == "jump-channel"
-    assert jumphost._SSHConnection__client.transport.channel == (
-        "direct-tcpip",
-        ("host", 2222),
-        ("jump", 22),
-    )
+    assert jumphost.channels == [("host", 2222)]
+
+
+def test_ssh_connection_cache_shares_the_hops_of_jump_chains(monkeypatch):
+    class FakeConnection:
+        instances: list["FakeConnection"] = []
+
+        @staticmethod
+        def create_connection_key(host, user, port):
+            return f"{user}@{host}:{port}"
+
+        def __init__(self, host, user, port, password, key_filename, jumphost=None, passphrase=None):
+            time.sleep(0.05)
+            self.key = paf_impl._chain_connection_key(f"{user}@{host}:{port}", jumphost)
+            self.jumphost = jumphost
+            FakeConnection.instances.append(self)
+
+        def get_connection_key(self):
+            return self.key
+
+        def ensure_connected(self):
+            pass
+
+        def exec_command(self, *args, **kwargs):
+            return types.SimpleNamespace(exit_code=0, stdout=self.key)
+
+    monkeypatch.setattr(paf_impl, "SSHConnection", FakeConnection)
+    cache = SSHConnectionCache()
+    chain = ["admin@bastion", paf_impl.SSHHop("gateway", "root", 2200, key_filename=["gateway_key"])]
+
+    outputs: list[str] = []
+    threads = [threading.Thread(target=lambda board=board: outputs.append(
+                   cache.exec_command("uname", f"board{board}", "root", 22, jumphost=chain).stdout))
+               for board in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert sorted(outputs) == [f"root@board{board}:22 via root@gateway:2200 via admin@bastion:22" for board in range(5)]
+    gateways = [connection for connection in FakeConnection.instances if connection.key.startswith("root@gateway")]
+    bastions = [connection for connection in FakeConnection.instances if connection.key == "admin@bastion:22"]
+    assert len(gateways) == 1 and len(bastions) == 1
+    assert gateways[0].jumphost is bastions[0]
+
+    # the same host behind another jump host is another machine
+    assert cache.exec_command("uname", "board0", "root", 22).stdout == "root@board0:22"
+    assert cache.find_or_create_jump_chain([]) is None
+
+    with pytest.raises(Exception, match="should be declared as user@host"):
+        cache.exec_command("uname", "board0", "root", 22, jumphost="bastion")
 
 
 def test_ssh_local_client_delegates_to_localhost():
@@ -415,3 +1090,134 @@ def test_phase_scenario_and_execution_element():
     element = ExecutionElement(ExecutionElement.ExecutionElementType_Task, "task")
     assert element.get_element_type() == ExecutionElement.ExecutionElementType_Task
     assert element.get_element_name() == "task"
+
+
+def test_output_line_prefixer_holds_back_incomplete_lines(monkeypatch):
+    prefixer = OutputLinePrefixer(b"[t] ")
+
+    assert prefixer.feed(b"one\ntw") == b"[t] one\n"
+    assert prefixer.feed(b"o\nthree") == b"[t] two\n"
+    assert prefixer.finish() == b"[t] three\n"
+    assert prefixer.finish() == b""
+
+    monkeypatch.setattr(OutputLinePrefixer, "MAX_PARTIAL_LINE_SIZE", 4)
+    assert prefixer.feed(b"abcdef") == b"[t] abcdef"
+
+
+def test_cancelled_command_ignoring_sigterm_is_killed(tmp_path, monkeypatch):
+    monkeypatch.setattr(paf_impl, "_PROCESS_TERMINATE_TIMEOUT", 0.2)
+    pid_file = tmp_path / "child.pid"
+    scope = CancellationScope()
+    result = {}
+
+    def run():
+        with paf_impl._task_output_context("", scope):
+            result["output"] = Task().exec_subprocess(
+                f"trap '' TERM; (trap '' TERM; echo $$BASHPID > {pid_file}; sleep 30) & wait",
+                communication_mode=CommunicationMode.PIPE_OUTPUT,
+                interaction_mode=InteractionMode.IGNORE_INPUT,
+            )
+
+    thread = paf_impl.threading.Thread(target=run)
+    started = time.monotonic()
+    thread.start()
+    time.sleep(0.5)
+    scope.cancel()
+    thread.join(10)
+
+    assert time.monotonic() - started < 5
+    assert result["output"].exit_code == -signal.SIGKILL
+    with pytest.raises(ProcessLookupError):
+        os.kill(int(pid_file.read_text()), 0)
+
+
+def test_cancelled_scope_stops_running_and_rejects_new_commands():
+    scope = CancellationScope()
+    task = Task()
+    task.set_environment(Environment())
+    result = {}
+
+    def run():
+        with paf_impl._task_output_context("", scope):
+            result["output"] = task.exec_subprocess("sleep 30")
+
+    thread = paf_impl.threading.Thread(target=run)
+    started = time.monotonic()
+    thread.start()
+    time.sleep(0.3)
+    scope.cancel()
+    thread.join(10)
+
+    assert time.monotonic() - started < 10
+    assert result["output"].stopped
+    assert scope.cancelled()
+
+    called = []
+    scope.add_callback(lambda: called.append(True))
+    assert called == [True]
+
+    with paf_impl._task_output_context("", scope):
+        with pytest.raises(TaskCancelledError):
+            task.exec_subprocess("true")
+
+
+class FakePooledConnection:
+    def __init__(self, name):
+        self.name = name
+        self.disconnected = False
+
+    def exec_command(self, cmd, *args, **kwargs):
+        return types.SimpleNamespace(exit_code=0, stdout=f"{self.name}: {cmd}")
+
+    def disconnect(self):
+        self.disconnected = True
+
+
+def test_ssh_connection_pool_opens_connections_only_when_sessions_are_exhausted():
+    created: list[FakePooledConnection] = []
+
+    def create_connection():
+        created.append(FakePooledConnection(f"connection{len(created)}"))
+        return created[-1]
+
+    pool = paf_impl.SSHConnectionPool("user@host:22", create_connection, 2, 2)
+
+    assert pool.exec_command("first").stdout == "connection0: first"
+    assert pool.exec_command("second").stdout == "connection0: second"
+    assert len(created) == 1
+
+    with pool.session() as first, pool.session() as second, pool.session() as third, pool.session() as fourth:
+        assert [first, second, third, fourth] == [created[0], created[0], created[1], created[1]]
+
+        waited: list[Any] = []
+        waiter = threading.Thread(target=lambda: waited.append(pool.exec_command("waited").stdout))
+        waiter.start()
+        time.sleep(0.3)
+        assert not waited
+
+    waiter.join(5)
+    assert waited == ["connection0: waited"]
+
+    utilization = pool.get_utilization()
+    assert (utilization.connections, utilization.peak_sessions, utilization.active_sessions) == (2, 4, 0)
+    assert (utilization.commands, utilization.waits) == (3, 1)
+    assert str(utilization).startswith("SSH pool user@host:22: 2 of 2 connections, peak 4 of 4 sessions, 3 commands")
+
+    pool.disconnect()
+    assert all(connection.disconnected for connection in created)
+
+
+def test_ssh_connection_pool_stops_waiting_once_cancelled():
+    pool = paf_impl.SSHConnectionPool("user@host:22", lambda: FakePooledConnection("connection"), 1, 1)
+    scope = CancellationScope()
+
+    with pool.session():
+        timer = threading.Timer(0.2, scope.cancel)
+        timer.start()
+        with paf_impl._task_output_context("", scope):
+            with pytest.raises(TaskCancelledError):
+                pool.exec_command("cancelled")
+        timer.join()
+
+    with pytest.raises(Exception, match="should be positive"):
+        paf_impl.SSHConnectionPool("user@host:22", lambda: None, 0, 1)
@@ -0,0 +1,63 @@
+import threading
+
+import pytest
+
+from paf import prefetch
+
+
+def test_prefetcher_returns_changes_of_task_started_with_same_environment():
+    prefetcher = prefetch.Prefetcher()
+    prefetcher.start("fetch", "hash", lambda: {"set": {"FETCHED": "yes"}, "deleted": []})
+    prefetcher.start("fetch", "hash", lambda: pytest.fail("started twice"))
+
+    assert prefetcher.is_started("fetch")
+    assert prefetcher.take("fetch", "hash") == {"set": {"FETCHED": "yes"}, "deleted": []}
+    # a taken task is executed at its next occurrence
+    assert prefetcher.take("fetch", "hash") is None
+
+    def fail():
+        raise RuntimeError("download failed")
+
+    prefetcher.start("broken", "hash", fail)
+    with pytest.raises(RuntimeError, match="download failed"):
+        prefetcher.take("broken", "hash")
+
+
+def test_prefetcher_stops_stale_and_pending_tasks():
+    prefetcher = prefetch.Prefetcher()
+    stopped = {name: threading.Event() for name in ("stale", "pending", "skipped")}
+
+    def start(name):
+        prefetcher.start(name, "hash", lambda: stopped[name].wait(5), stopped[name].set)
+
+    start("stale")
+    start("pending")
+    start("skipped")
+
+    assert prefetcher.take("stale", "another hash") is None
+    assert stopped["stale"].is_set()
+
+    prefetcher.discard("skipped")
+    assert stopped["skipped"].is_set()
+
+    prefetcher.close()
+    assert stopped["pending"].is_set()
+
+
+def test_prefetcher_awaits_discarded_task_without_stopping_it():
+    prefetcher = prefetch.Prefetcher()
+    started = threading.Event()
+    stopped = threading.Event()
+    finished = []
+
+    def run():
+        started.set()
+        stopped.wait(0.2)
+        finished.append(not stopped.is_set())
+
+    prefetcher.start("clone", "hash", run, stopped.set)
+    started.wait(5)
+    prefetcher.discard("clone", cancel=False)
+
+    assert finished == [True]
+    assert prefetcher.take("clone", "hash") is None
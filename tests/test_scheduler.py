@@ -0,0 +1,142 @@
+import threading
+
+import pytest
+
+from paf import scheduler
+
+
+def test_parse_depends_on_splits_names():
+    assert scheduler.parse_depends_on(None) is None
+    assert scheduler.parse_depends_on("") == []
+    assert scheduler.parse_depends_on(" a, b  c ") == ["a", "b", "c"]
+
+
+def test_resolve_dependencies_defaults_to_declared_order():
+    names = ["m.a", "m.b", "m.c"]
+
+    assert scheduler.resolve_dependencies(names, [None, None, None]) == [[], [0], [1]]
+    assert scheduler.resolve_dependencies(names, [[], ["a"], ["m.a"]]) == [[], [0], [0]]
+
+
+@pytest.mark.parametrize(
+    ("names", "depends_on", "match"),
+    [
+        (["m.a", "m.b"], [[], ["x"]], "unknown task 'x'"),
+        (["m.a", "n.a", "m.b"], [[], [], ["a"]], "ambiguous task name 'a'"),
+        (["m.a", "m.b"], [["b"], ["a"]], "Cyclic task dependencies: m.a -> m.b -> m.a"),
+    ],
+)
+def test_resolve_dependencies_rejects_wrong_references(names, depends_on, match):
+    with pytest.raises(Exception, match=match):
+        scheduler.resolve_dependencies(names, depends_on)
+
+
+def test_run_graph_respects_dependencies_in_sequential_mode():
+    order: list[int] = []
+
+    scheduler.run_graph([[2], [], []], 1, order.append)
+
+    assert order == [1, 2, 0]
+
+
+def test_run_graph_runs_independent_nodes_in_parallel():
+    barrier = threading.Barrier(2, timeout=5)
+    order = []
+
+    def run(index):
+        if index < 2:
+            barrier.wait()
+        order.append(index)
+
+    scheduler.run_graph([[], [], [0, 1]], 2, run)
+
+    assert order[-1] == 2
+
+
+def test_run_graph_fails_fast():
+    cancelled = threading.Event()
+    started = []
+
+    def run(index):
+        started.append(index)
+        if index == 0:
+            raise RuntimeError("boom")
+        cancelled.wait(5)
+
+    with pytest.raises(RuntimeError, match="boom"):
+        scheduler.run_graph([[], [], [0], [1]], 2, run, cancelled.set)
+
+    assert cancelled.is_set()
+    assert sorted(started) == [0, 1]
+
+
+def test_run_graph_with_single_job_stops_at_first_error():
+    started = []
+
+    def run(index):
+        started.append(index)
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        scheduler.run_graph([[], []], 1, run)
+
+    assert started == [0]
+
+
+def test_critical_path_follows_longest_dependency_chain():
+    # 0 -> 2 -> 3 and 1 -> 3
+    assert scheduler.critical_path([[], [], [0], [1, 2]], [1.0, 5.0, 1.0, 2.0]) == (7.0, [1, 3])
+    assert scheduler.critical_path([], []) == (0, [])
+
+
+def test_resource_pool_admits_requests_within_budget():
+    pool = scheduler.ResourcePool(4, 1000)
+    big = scheduler.ResourceRequest(cores=16, memory=2000)
+    qemu = scheduler.ResourceRequest(exclusive=["qemu"])
+
+    assert pool.try_acquire(big) == 4
+    assert pool.try_acquire(scheduler.ResourceRequest()) is None
+    pool.release(big)
+
+    assert pool.try_acquire(qemu) == 1
+    assert pool.try_acquire(qemu) is None
+    assert pool.try_acquire(scheduler.ResourceRequest(cores=3, memory=1000)) == 3
+    assert pool.acquire(qemu, cancelled=lambda: True) is None
+
+    granted = []
+    waiter = threading.Thread(target=lambda: granted.append(pool.acquire(qemu)))
+    waiter.start()
+    pool.release(qemu)
+    waiter.join(5)
+    assert granted == [1]
+
+
+def test_resource_pool_serves_waiting_requests_in_order():
+    pool = scheduler.ResourcePool(2, 0)
+    two_cores = scheduler.ResourceRequest(cores=2)
+    one_core = scheduler.ResourceRequest(cores=1)
+    pool.try_acquire(one_core)
+    order = []
+
+    def acquire(name, request):
+        pool.acquire(request)
+        order.append(name)
+        pool.release(request)
+
+    big = threading.Thread(target=acquire, args=("big", two_cores))
+    big.start()
+    while pool.try_acquire(one_core) is not None:
+        # the big request is not queued yet
+        pool.release(one_core)
+    small = threading.Thread(target=acquire, args=("small", one_core))
+    small.start()
+    pool.release(one_core)
+    big.join(5)
+    small.join(5)
+
+    assert order == ["big", "small"]
+
+
+def test_resource_request_rejects_wrong_values():
+    with pytest.raises(Exception, match="Wrong resource request"):
+        scheduler.ResourceRequest(cores=0)
@@ -0,0 +1,152 @@
+import sys
+
+import pytest
+
+import paf
+from paf import paf_impl
+from paf import yaml_config
+from paf.paf_impl import Environment
+
+import paf_main
+
+
+SESSION_TASKS = (
+    "import os\n"
+    "from paf.paf_impl import Task\n"
+    "with open(os.environ['PAF_TEST_IMPORTS'], 'a') as stream:\n"
+    "    stream.write('imported\\n')\n"
+    "class record(Task):\n"
+    "    def __init__(self):\n"
+    "        super().__init__()\n"
+    "        self.set_name(record.__name__)\n"
+    "    def execute(self):\n"
+    "        with open(self.LOG, 'a') as stream:\n"
+    "            stream.write(self.VALUE + ' ' + self.get_environment_param('LEAKED', 'clean') + '\\n')\n"
+    "        self.set_environment_param('LEAKED', 'dirty')\n"
+    "        if self.VALUE == 'broken':\n"
+    "            raise Exception('broken run')\n"
+)
+
+
+def prepare_session(tmp_path, monkeypatch):
+    module_dir = tmp_path / "modules"
+    module_dir.mkdir()
+    (module_dir / "tasks.py").write_text(SESSION_TASKS, encoding="utf-8")
+    monkeypatch.setenv("PAF_TEST_IMPORTS", str(tmp_path / "imports.log"))
+    config = tmp_path / "scenario.xml"
+    config.write_text(
+        "<paf_config>"
+        "  <param name='LOG' value='" + str(tmp_path / "run.log") + "'/>"
+        "  <param name='VALUE' value='default'/>"
+        "  <phase name='record'><task name='modules.tasks.record'/></phase>"
+        "  <scenario name='default'><phase name='record'/></scenario>"
+        "</paf_config>",
+        encoding="utf-8",
+    )
+    return module_dir, config
+
+
+def test_session_reuses_modules_and_isolates_runs(tmp_path, monkeypatch):
+    module_dir, config = prepare_session(tmp_path, monkeypatch)
+    session = paf.Session()
+
+    for value in ("first", "second"):
+        session.run([str(config)], ["default"], {"VALUE": value},
+                     import_module_dirs=[str(module_dir)], log_dir=str(tmp_path / value))
+
+    assert (tmp_path / "imports.log").read_text() == "imported\n"
+    assert (tmp_path / "run.log").read_text() == "first clean\nsecond clean\n"
+
+    lines = session.run([str(config)], ["default"], import_module_dirs=[str(module_dir)],
+                        log_dir=str(tmp_path / "plan"), plan=True)
+    assert lines[0] == "Execution plan:"
+
+
+def test_run_without_log_dir(tmp_path, monkeypatch):
+    module_dir, config = prepare_session(tmp_path, monkeypatch)
+    monkeypatch.chdir(tmp_path)
+
+    paf.run(params={"LOG": str(tmp_path / "run.log"), "VALUE": "unlogged"}, tasks=["modules.tasks.record"],
+            import_module_dirs=[str(module_dir)])
+
+    assert (tmp_path / "run.log").read_text() == "unlogged clean\n"
+    assert paf_impl.logger.get_log_dir() is None
+    assert not list(tmp_path.glob("**/journal.jsonl"))
+
+
+def test_run_with_yaml_config_resumes_into_another_log_dir(tmp_path, monkeypatch):
+    module_dir, config = prepare_session(tmp_path, monkeypatch)
+    yaml_path = tmp_path / "case.yaml"
+    yaml_path.write_text("name: resumed\n", encoding="utf-8")
+
+    def run(log_dir, **kwargs):
+        paf.run([str(config)], ["default"], {"VALUE": "yaml"}, import_module_dirs=[str(module_dir)],
+                yaml_configs=[str(yaml_path)], log_dir=str(tmp_path / log_dir), **kwargs)
+
+    run("logs")
+    run("logs_2", resume_journal=str(tmp_path / "logs"))
+
+    # the generated config has another path in the new log directory, but the same content
+    assert (tmp_path / "run.log").read_text() == "yaml clean\n"
+
+    yaml_path.write_text("name: changed\n", encoding="utf-8")
+    run("logs_3", resume_journal=str(tmp_path / "logs_2"))
+    assert (tmp_path / "run.log").read_text() == "yaml clean\nyaml clean\n"
+
+
+def test_parsed_configs_are_reused_until_changed(tmp_path):
+    config = tmp_path / "config.xml"
+    config.write_text("<paf_config><param name='A' value='1'/></paf_config>", encoding="utf-8")
+    root = paf_impl._parse_xml_config(str(config))
+    assert paf_impl._parse_xml_config(str(config)) is root
+
+    config.write_text("<paf_config><param name='A' value='22'/></paf_config>", encoding="utf-8")
+    assert paf_impl._parse_xml_config(str(config)) is not root
+
+    case = tmp_path / "case.yaml"
+    case.write_text("project:\n  name: demo\n", encoding="utf-8")
+    loaded = yaml_config.load_yaml_file(str(case))
+    loaded["project"]["name"] = "changed"
+    assert yaml_config.load_yaml_file(str(case)) == {"project": {"name": "demo"}}
+
+    env = Environment()
+    context = paf_impl.ExecutionContext(str(tmp_path / "logs"))
+    context.parse_config(str(config), context, env)
+    assert env.getVariableValue("A") == "22"
+
+
+def test_batch_executes_runs_in_one_process(tmp_path, monkeypatch):
+    module_dir, config = prepare_session(tmp_path, monkeypatch)
+    batch = tmp_path / "batch.txt"
+    batch.write_text("# runs\n-p VALUE=first\n\n-p VALUE=broken\n-p 'VALUE=third'\n", encoding="utf-8")
+    log_dir = tmp_path / "logs"
+    monkeypatch.setattr(sys, "argv", ["paf_main.py", "-c", str(config), "-s", "default", "-imd", str(module_dir),
+                                      "-ld", str(log_dir), "-b", str(batch)])
+
+    with pytest.raises(Exception, match="1 of 3 batch runs failed"):
+        paf_main.main()
+
+    assert (tmp_path / "imports.log").read_text() == "imported\n"
+    assert (tmp_path / "run.log").read_text() == "first clean\nbroken clean\nthird clean\n"
+    assert (log_dir / "batch_2" / "journal.jsonl").exists()
+    # each run logs into its own directory
+    logs = [list((log_dir / f"batch_{index}").glob("paf_*.log")) for index in range(3)]
+    assert all(len(run_logs) == 1 for run_logs in logs)
+    assert "export VALUE=broken" not in logs[0][0].read_text(encoding="utf-8")
+    assert "export VALUE=broken" in logs[1][0].read_text(encoding="utf-8")
+    summary = (log_dir / "batch_summary.log").read_text(encoding="utf-8")
+    assert "-p VALUE=broken | FAILED" in summary
+
+
+def test_matrix_rejects_resumed_journal_file(tmp_path, monkeypatch):
+    module_dir, config = prepare_session(tmp_path, monkeypatch)
+    journal_path = tmp_path / "logs" / "journal.jsonl"
+    journal_path.parent.mkdir()
+    journal_path.write_text("", encoding="utf-8")
+    monkeypatch.setattr(sys, "argv", ["paf_main.py", "-c", str(config), "-s", "default", "-imd", str(module_dir),
+                                      "-ld", str(tmp_path / "logs_2"), "-m", "VALUE=a,b", "-r", str(journal_path)])
+
+    with pytest.raises(Exception, match="takes the log directory of the resumed matrix run"):
+        paf_main.main()
+
+    assert not (tmp_path / "run.log").exists()
@@ -0,0 +1,329 @@
+import contextlib
+import errno
+import os
+import subprocess
+import types
+
+import pytest
+
+from paf import paf_impl
+from paf import ssh_transfer
+from paf.paf_impl import CaptureMode
+from paf.paf_impl import Config
+from paf.paf_impl import Environment
+from paf.paf_impl import Task
+
+
+class FakeSFTPFile:
+    def __init__(self, path, mode, reads_before_failure):
+        self.file = open(path, mode)
+        self.reads_before_failure = reads_before_failure
+        self.prefetched = None
+        self.pipelined = False
+
+    def prefetch(self, file_size):
+        self.prefetched = (self.file.tell(), file_size)
+
+    def set_pipelined(self, pipelined):
+        self.pipelined = pipelined
+
+    def seek(self, offset):
+        self.file.seek(offset)
+
+    def read(self, size):
+        if self.reads_before_failure is not None:
+            if not self.reads_before_failure:
+                raise EOFError("connection lost")
+            self.reads_before_failure -= 1
+        return self.file.read(size)
+
+    def write(self, data):
+        self.file.write(data)
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class FakeSFTPClient:
+    """SFTP client, which keeps the remote files in a local directory."""
+
+    def __init__(self, root, reads_before_failure = None):
+        self.root = root
+        self.reads_before_failure = reads_before_failure
+        self.files = []
+        self.closed = False
+
+    def __path(self, path):
+        return os.path.join(self.root, path.lstrip("/"))
+
+    def open(self, path, mode):
+        sftp_file = FakeSFTPFile(self.__path(path), mode, self.reads_before_failure)
+        self.files.append(sftp_file)
+        return sftp_file
+
+    def stat(self, path):
+        try:
+            return os.stat(self.__path(path))
+        except FileNotFoundError:
+            raise IOError(errno.ENOENT, "No such file")
+
+    def chmod(self, path, mode):
+        os.chmod(self.__path(path), mode)
+
+    def posix_rename(self, old_path, new_path):
+        os.replace(self.__path(old_path), self.__path(new_path))
+
+    def utime(self, path, times):
+        os.utime(self.__path(path), times)
+
+    def listdir_attr(self, path):
+        try:
+            file_names = os.listdir(self.__path(path))
+        except FileNotFoundError:
+            raise IOError(errno.ENOENT, "No such file")
+
+        entries = []
+        for file_name in file_names:
+            file_stat = os.stat(os.path.join(self.__path(path), file_name))
+            entries.append(types.SimpleNamespace(filename = file_name, st_mode = file_stat.st_mode,
+                                                 st_size = file_stat.st_size, st_mtime = int(file_stat.st_mtime)))
+        return entries
+
+    def mkdir(self, path):
+        os.mkdir(self.__path(path))
+
+    def remove(self, path):
+        os.remove(self.__path(path))
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    monkeypatch.setattr(ssh_transfer, "_CHUNK_SIZE", 1024)
+    monkeypatch.setattr(ssh_transfer, "_SEGMENT_SIZE", 4096)
+
+
+def remote_file(root, path, clients, reads_before_failure = None):
+    @contextlib.contextmanager
+    def sftp_session():
+        client = FakeSFTPClient(root, reads_before_failure)
+        clients.append(client)
+        yield client
+
+    return ssh_transfer.RemoteFile(sftp_session, path, "user@host:22")
+
+
+def test_upload_splits_large_file_between_streams(tmp_path, small_chunks):
+    data = os.urandom(40 * 1024 + 100)
+    (tmp_path / "image.bin").write_bytes(data)
+    os.chmod(tmp_path / "image.bin", 0o640)
+    (tmp_path / "remote").mkdir()
+    clients: list[FakeSFTPClient] = []
+    state_path = str(tmp_path / "state.json")
+
+    result = ssh_transfer.transfer(ssh_transfer.LocalFile(str(tmp_path / "image.bin")),
+                                   remote_file(str(tmp_path / "remote"), "/image.bin", clients),
+                                   state_path, streams = 4, parallel_threshold = 1024)
+
+    assert (tmp_path / "remote" / "image.bin").read_bytes() == data
+    assert os.stat(tmp_path / "remote" / "image.bin").st_mode & 0o777 == 0o640
+    assert not (tmp_path / "remote" / "image.bin.part").exists()
+    assert not os.path.exists(state_path)
+    assert (result.size, result.transferred, result.streams, result.resumed) == (len(data), len(data), 4, False)
+
+    # one pipelined writer per segment of each stream
+    assert sum(sftp_file.pipelined for client in clients for sftp_file in client.files) == 12
+    assert str(result).startswith(f"Transferred '{tmp_path / 'image.bin'}' to 'user@host:22:/image.bin': 40.1 KiB of")
+
+    assert ssh_transfer.split_ranges(10, 4) == [[0, 10]]
+    assert ssh_transfer.split_ranges(0, 4) == [[0, 0]]
+
+
+def test_interrupted_download_is_resumed_from_the_saved_progress(tmp_path, small_chunks):
+    data = os.urandom(16 * 1024)
+    (tmp_path / "remote").mkdir()
+    (tmp_path / "remote" / "rootfs.tar").write_bytes(data)
+    target = ssh_transfer.LocalFile(str(tmp_path / "rootfs.tar"))
+    state_path = str(tmp_path / "state.json")
+    clients: list[FakeSFTPClient] = []
+
+    # the first transfer loses the connection after the first segment of 4 chunks
+    with pytest.raises(EOFError):
+        ssh_transfer.transfer(remote_file(str(tmp_path / "remote"), "/rootfs.tar", clients, 6), target,
+                              state_path, streams = 1)
+
+    assert os.path.exists(state_path)
+    assert clients[-1].files[0].prefetched == (0, len(data))
+
+    clients.clear()
+    result = ssh_transfer.transfer(remote_file(str(tmp_path / "remote"), "/rootfs.tar", clients), target,
+                                   state_path, streams = 1)
+
+    assert (tmp_path / "rootfs.tar").read_bytes() == data
+    assert (result.resumed, result.transferred) == (True, len(data) - 4096)
+    assert clients[-1].files[0].prefetched == (4096, len(data))
+    assert not os.path.exists(state_path)
+
+    # the changed source is transferred from the start
+    with pytest.raises(EOFError):
+        ssh_transfer.transfer(remote_file(str(tmp_path / "remote"), "/rootfs.tar", clients, 6), target,
+                              state_path, streams = 1)
+    (tmp_path / "remote" / "rootfs.tar").write_bytes(data[:1000])
+    result = ssh_transfer.transfer(remote_file(str(tmp_path / "remote"), "/rootfs.tar", clients), target,
+                                   state_path, streams = 1)
+    assert (result.resumed, result.transferred) == (False, 1000)
+    assert (tmp_path / "rootfs.tar").read_bytes() == data[:1000]
+
+    with pytest.raises(Exception, match="does not exist"):
+        ssh_transfer.transfer(remote_file(str(tmp_path / "remote"), "/missing", clients), target, state_path)
+
+
+def test_task_transfers_files_over_sftp_sessions_of_the_pool(tmp_path, small_chunks):
+    class FakeConnection:
+        def __init__(self):
+            self.clients: list[FakeSFTPClient] = []
+
+        def open_sftp(self):
+            self.clients.append(FakeSFTPClient(str(tmp_path / "remote")))
+            return self.clients[-1]
+
+    class FakeCache:
+        def __init__(self):
+            self.connection = FakeConnection()
+            self.pool = paf_impl.SSHConnectionPool("user@host:22", lambda: self.connection, 1, 8)
+            self.calls: list[tuple] = []
+
+        def find_or_create_pool(self, *args):
+            self.calls.append(args)
+            return self.pool
+
+    (tmp_path / "remote").mkdir()
+    (tmp_path / "kernel.img").write_bytes(b"kernel" * 1000)
+
+    environment = Environment()
+    environment.setVariableValue("IMAGE_DIR", str(tmp_path))
+    task = Task()
+    task.set_environment(environment)
+    cache = FakeCache()
+    task._Task__ssh_connection_cache = cache  # type: ignore[attr-defined]
+
+    transfer_state_dir = Config.get_transfer_state_dir()
+    Config.set_transfer_state_dir(str(tmp_path / "transfers"))
+    try:
+        result = task.ssh_upload("${IMAGE_DIR}/kernel.img", "/kernel.img", "host", "user", streams = 2)
+        task.ssh_download("/kernel.img", "${IMAGE_DIR}/copy.img", "host", "user")
+        (tmp_path / "deploy").mkdir()
+        (tmp_path / "deploy" / "zImage").write_bytes(b"kernel")
+        sync_result = task.ssh_sync_dir("${IMAGE_DIR}/deploy", "/boot", "host", "user", delete = True)
+    finally:
+        Config.set_transfer_state_dir(transfer_state_dir)
+
+    assert (tmp_path / "copy.img").read_bytes() == b"kernel" * 1000
+    assert (tmp_path / "remote" / "boot" / "zImage").read_bytes() == b"kernel"
+    assert sync_result.transferred == ["zImage"]
+    assert result.target == "user@host:22:/kernel.img"
+    assert cache.calls[0] == ("host", "user", 22, "", [], None, None)
+    assert cache.connection.clients and all(client.closed for client in cache.connection.clients)
+    assert cache.pool.get_utilization().active_sessions == 0
+    assert os.listdir(tmp_path / "transfers") == []
+
+
+def test_sync_dir_transfers_only_the_changed_files(tmp_path, small_chunks):
+    local_dir = tmp_path / "deploy"
+    (local_dir / "boot").mkdir(parents = True)
+    (local_dir / "zImage").write_bytes(b"kernel-1")
+    (local_dir / "boot" / "dtb").write_bytes(b"device tree")
+    (local_dir / "boot" / "config").write_bytes(b"config")
+    remote_dir = str(tmp_path / "board" / "opt" / "deploy")
+    clients: list[FakeSFTPClient] = []
+    commands: list[str] = []
+
+    @contextlib.contextmanager
+    def sftp_session():
+        clients.append(FakeSFTPClient("/"))
+        yield clients[-1]
+
+    def exec_command(cmd):
+        commands.append(cmd)
+        return subprocess.run(cmd, shell = True, check = True, capture_output = True, text = True).stdout
+
+    def sync(**kwargs):
+        return ssh_transfer.sync_directory(str(local_dir), remote_dir, sftp_session, "root@board:22", exec_command,
+                                           str(tmp_path / "transfers"), **kwargs)
+
+    result = sync()
+    assert result.transferred == ["boot/config", "boot/dtb", "zImage"]
+    assert (tmp_path / "board" / "opt" / "deploy" / "boot" / "dtb").read_bytes() == b"device tree"
+    assert int(os.stat(os.path.join(remote_dir, "zImage")).st_mtime) == int(os.stat(local_dir / "zImage").st_mtime)
+
+    (local_dir / "zImage").write_bytes(b"kernel-22")
+    result = sync()
+    assert (result.transferred, result.unchanged) == (["zImage"], ["boot/config", "boot/dtb"])
+    assert str(result) == (f"Synchronized '{local_dir}' to 'root@board:22:{remote_dir}': 1 of 3 files transferred, "
+                           f"9 B in {result.duration:.1f}s, 0 deleted")
+
+    # the same content with another modification time is compared by the checksums in one command
+    os.utime(local_dir / "boot" / "config", (0, 1000))
+    os.utime(local_dir / "boot" / "dtb", (0, 1000))
+    with open(os.path.join(remote_dir, "boot", "dtb"), "wb") as stream:
+        stream.write(b"device TREE")
+    (tmp_path / "board" / "opt" / "deploy" / "stale").write_bytes(b"stale")
+    (tmp_path / "board" / "opt" / "deploy" / "zImage.part").write_bytes(b"part")
+
+    result = sync(checksum = True, delete = True)
+    assert len(commands) == 1 and commands[0].endswith("sha256sum ./boot/config ./boot/dtb")
+    assert (result.transferred, result.unchanged, result.deleted) == (["boot/dtb"], ["boot/config", "zImage"],
+                                                                      ["stale"])
+    assert os.stat(os.path.join(remote_dir, "boot", "config")).st_mtime == 1000
+    assert (tmp_path / "board" / "opt" / "deploy" / "zImage.part").exists()
+    assert sync().unchanged == ["boot/config", "boot/dtb", "zImage"]
+
+    assert len(ssh_transfer.get_checksum_commands("/opt", ["a" * 40000, "b" * 40000])) == 2
+
+
+def test_task_sync_dir_captures_remote_checksums_in_memory(tmp_path):
+    class FakeCache:
+        def find_or_create_pool(self, *args):
+            return paf_impl.SSHConnectionPool("user@host:22", lambda: FakeConnection(), 1, 8)
+
+    class FakeConnection:
+        def open_sftp(self):
+            return FakeSFTPClient(str(tmp_path / "remote"))
+
+    (tmp_path / "deploy").mkdir()
+    (tmp_path / "deploy" / "zImage").write_bytes(b"kernel")
+    (tmp_path / "remote" / "boot").mkdir(parents = True)
+    (tmp_path / "remote" / "boot" / "zImage").write_bytes(b"kernel")
+    os.utime(tmp_path / "remote" / "boot" / "zImage", (0, 1000))
+
+    task = Task()
+    task._Task__ssh_connection_cache = FakeCache()  # type: ignore[attr-defined]
+    calls: list[tuple] = []
+
+    def ssh_command_must_succeed(cmd, *args, **kwargs):
+        calls.append((cmd, kwargs))
+        return subprocess.run(cmd.replace("/boot", str(tmp_path / "remote" / "boot")), shell = True, check = True,
+                              capture_output = True, text = True).stdout
+
+    task.ssh_command_must_succeed = ssh_command_must_succeed  # type: ignore[method-assign]
+
+    capture_mode = Config.get_default_capture_mode()
+    transfer_state_dir = Config.get_transfer_state_dir()
+    Config.set_default_capture_mode(CaptureMode.SPOOL_TO_DISK)
+    Config.set_transfer_state_dir(str(tmp_path / "transfers"))
+    try:
+        result = task.ssh_sync_dir(str(tmp_path / "deploy"), "/boot", "host", "user", checksum = True)
+    finally:
+        Config.set_default_capture_mode(capture_mode)
+        Config.set_transfer_state_dir(transfer_state_dir)
+
+    assert result.unchanged == ["zImage"]
+    assert len(calls) == 1 and calls[0][1]["capture_mode"] == CaptureMode.MEMORY
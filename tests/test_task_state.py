@@ -0,0 +1,100 @@
+import os
+
+import pytest
+
+from paf import task_state
+from paf.paf_impl import Config
+from paf.paf_impl import Environment
+from paf.paf_impl import Task
+
+
+def test_fingerprint_files_follows_content_and_reuses_digests(tmp_path, monkeypatch):
+    (tmp_path / "src" / "sub").mkdir(parents=True)
+    source = tmp_path / "src" / "sub" / "a.c"
+    source.write_text("int a;", encoding="utf-8")
+    db = task_state.TaskStateDB(str(tmp_path / "state" / "state.db"))
+    pattern = str(tmp_path / "src" / "**" / "*.c")
+
+    fingerprint = db.fingerprint_files([pattern])
+    assert fingerprint == db.fingerprint_files([pattern])
+    assert db.fingerprint_files([str(tmp_path / "missing" / "*")]) is None
+
+    def fail_hash(path):
+        raise AssertionError(f"'{path}' should not be read again")
+
+    monkeypatch.setattr(task_state, "_hash_file", fail_hash)
+    assert db.fingerprint_files([pattern]) == fingerprint
+
+    monkeypatch.undo()
+    source.write_text("int b;", encoding="utf-8")
+    os.utime(source, ns=(1, 1))
+    assert db.fingerprint_files([pattern]) != fingerprint
+
+
+class counting_task(Task):
+    executions = 0
+
+    def __init__(self):
+        super().__init__()
+        self.set_name("counting_task")
+        self.add_input_params("ARCH")
+        self.add_input_files("${ROOT}/input.txt")
+        self.add_output_files("${ROOT}/out/${ARCH}/*.bin")
+
+    def execute(self):
+        counting_task.executions += 1
+        output_dir = os.path.join(self.get_environment_param("ROOT"), "out", self.get_environment_param("ARCH"))
+        os.makedirs(output_dir, exist_ok=True)
+        with open(os.path.join(output_dir, "result.bin"), "w", encoding="utf-8") as stream:
+            stream.write(self.get_environment_param("ARCH"))
+
+
+@pytest.fixture
+def state_db_path(tmp_path):
+    old_path = Config.get_task_state_db_path()
+    Config.set_task_state_db_path(str(tmp_path / "task_state.db"))
+    try:
+        yield
+    finally:
+        Config.set_task_state_db_path(old_path)
+        Config.set_force_all_tasks(False)
+        Config.set_forced_tasks([])
+
+
+def run_counting_task(root, arch):
+    environment = Environment()
+    environment.setVariableValue("ROOT", str(root))
+    environment.setVariableValue("ARCH", arch)
+    task = counting_task()
+    task.set_environment(environment)
+    task.start()
+
+
+def test_task_is_skipped_while_inputs_and_outputs_are_unchanged(tmp_path, state_db_path):
+    (tmp_path / "input.txt").write_text("v1", encoding="utf-8")
+    counting_task.executions = 0
+
+    run_counting_task(tmp_path, "ARM")
+    run_counting_task(tmp_path, "ARM")
+    assert counting_task.executions == 1
+
+    run_counting_task(tmp_path, "ARM64")
+    run_counting_task(tmp_path, "ARM")
+    assert counting_task.executions == 2
+
+    (tmp_path / "input.txt").write_text("v2", encoding="utf-8")
+    run_counting_task(tmp_path, "ARM")
+    assert counting_task.executions == 3
+
+    (tmp_path / "out" / "ARM" / "result.bin").unlink()
+    run_counting_task(tmp_path, "ARM")
+    assert counting_task.executions == 4
+
+    Config.set_forced_tasks(["counting_task"])
+    run_counting_task(tmp_path, "ARM")
+    assert counting_task.executions == 5
+
+    Config.set_forced_tasks([])
+    Config.set_force_all_tasks(True)
+    run_counting_task(tmp_path, "ARM")
+    assert counting_task.executions == 6
@@ -0,0 +1,19 @@
+from paf import timing
+
+
+def test_timing_db_estimates_median_of_successful_durations(tmp_path):
+    db = timing.TimingDB(str(tmp_path / "logs" / timing.TIMING_DB_FILE_NAME))
+
+    for started, duration in enumerate([1.0, 9.0, 2.0]):
+        db.record("task", "build", "compile", started, duration, True)
+    db.record("task", "build", "compile", 10, 100.0, False)
+
+    assert db.expected_duration("task", "compile") == 2.0
+    assert db.expected_duration("task", "missing") is None
+
+
+def test_format_duration():
+    assert timing.format_duration(None) == "unknown"
+    assert timing.format_duration(2.25) == "2.2s"
+    assert timing.format_duration(125) == "2m 05s"
+    assert timing.format_duration(3725) == "1h 02m 05s"
@@ -2,6 +2,7 @@ import pytest
 from typing import Any
 
 from paf import yaml_config
+from paf.paf_impl import ExecutionContext
 
 
 def test_apply_domain_defaults_then_case_overrides():
@@ -310,3 +311,36 @@ def test_load_case_config_and_write_expanded_config(tmp_path):
     assert '"value": "new"' in (tmp_path / "generated" / "sample" / "case.expanded.json").read_text(
         encoding="utf-8",
     )
+
+
+def test_register_phases_from_yaml(tmp_path):
+    config = {
+        "phases": {
+            "build": {
+                "tasks": [
+                    "modules.tasks.prepare",
+                    {"name": "modules.tasks.compile", "depends_on": ["prepare"], "conditions": {"DEBUG": True}},
+                    {"name": "modules.tasks.lint", "depends_on": "prepare, compile"},
+                ],
+            },
+        },
+    }
+    yaml_config.validate_case_config(config, [])
+    context = ExecutionContext(str(tmp_path / "logs"))
+
+    yaml_config.register_phases(config, context)
+
+    phase = context.get_available_phase("build")
+    assert phase.get_tasks() == [
+        ("modules.tasks.prepare", {}),
+        ("modules.tasks.compile", {"DEBUG": "true"}),
+        ("modules.tasks.lint", {}),
+    ]
+    assert phase.get_dependencies() == [None, ["prepare"], ["prepare", "compile"]]
+
+
+def test_builtin_schema_rejects_wrong_phase_task():
+    config = {"phases": {"build": {"tasks": [{"depends_on": ["x"]}]}}}
+
+    with pytest.raises(Exception):
+        yaml_config.validate_case_config(config, [])